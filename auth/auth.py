@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+# Формат хеша: pbkdf2_sha256$<итерации>$<соль base64>$<хеш base64>, помещается в колонку password (100 символов)
+HASH_ALGORITHM = "pbkdf2_sha256"
+HASH_ITERATIONS = 260000
+SALT_BYTES = 16
+
+SESSION_COOKIE = "session"
+
+
+def hash_password(password: str, iterations: int = HASH_ITERATIONS, salt: bytes = None) -> str:
+    salt = salt or os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join((HASH_ALGORITHM, str(iterations), base64.b64encode(salt).decode("ascii"),
+                     base64.b64encode(digest).decode("ascii")))
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(HASH_ALGORITHM + "$")
+
+
+def verify_password(password: str, stored: str):
+    # Возвращает (пароль верный, нужно ли пересчитать хеш)
+    if not is_hashed(stored):
+        # Старые записи с паролем в открытом виде, после входа пароль заменяется на хеш
+        ok = hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+        return ok, ok
+    try:
+        _, iterations, salt, expected = stored.split("$")
+        iterations = int(iterations)
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), base64.b64decode(salt), iterations)
+    except ValueError:
+        return False, False
+    ok = hmac.compare_digest(digest, base64.b64decode(expected))
+    return ok, ok and iterations < HASH_ITERATIONS
+
+
+'''
+
+CredentialCache - кеш недавних успешных проверок пароля. pbkdf2 намеренно медленный, поэтому повторный вход
+с теми же данными в течение ttl секунд проверяется по HMAC пароля в памяти, без базы и без pbkdf2.
+Сам пароль в кеше не хранится. Запись удаляется при изменении или удалении пользователя.
+
+'''
+
+
+class CredentialCache:
+    def __init__(self, ttl: float = 60.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.key = secrets.token_bytes(32)  # Ключ HMAC живет только в памяти процесса
+        self.entries = {}  # username -> (hmac пароля, срок действия)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, password: str) -> bytes:
+        return hmac.new(self.key, password.encode("utf-8"), hashlib.sha256).digest()
+
+    def check(self, username: str, password: str) -> bool:
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is None or entry[1] < time.monotonic():
+                self.entries.pop(username, None)
+                self.misses += 1
+                return False
+            ok = hmac.compare_digest(entry[0], self._digest(password))
+            if ok:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return ok
+
+    def put(self, username: str, password: str):
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries.pop(next(iter(self.entries)))
+            self.entries[username] = (self._digest(password), time.monotonic() + self.ttl)
+
+    def invalidate(self, username: str):
+        with self.lock:
+            self.entries.pop(username, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+'''
+
+SessionManager выдает токены сессии после входа. Токен хранится в cookie, проверка выполняется по словарю
+в памяти, поэтому /status, /stream и /print_status не обращаются к базе.
+
+'''
+
+
+class SessionManager:
+    def __init__(self, ttl: float = 12 * 3600):
+        self.ttl = ttl
+        self.sessions = {}  # token -> (username, срок действия)
+        self.lock = threading.Lock()
+
+    def create(self, username: str) -> str:
+        token = secrets.token_urlsafe(32)
+        with self.lock:
+            self.sessions[token] = (username, time.monotonic() + self.ttl)
+        return token
+
+    def validate(self, token: str):
+        # Имя пользователя по токену или None
+        if not token:
+            return None
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is None:
+                return None
+            if session[1] < time.monotonic():
+                del self.sessions[token]
+                return None
+            return session[0]
+
+    def revoke(self, token: str):
+        with self.lock:
+            self.sessions.pop(token, None)
+
+    def revoke_user(self, username: str):
+        with self.lock:
+            for token in [token for token, session in self.sessions.items() if session[0] == username]:
+                del self.sessions[token]
+
+
+# Общие для приложения кеш проверок и сессии
+credential_cache = CredentialCache()
+sessions = SessionManager()
+
+
+def invalidate_user(username: str):
+    # Вызывается репозиторием при изменении или удалении пользователя
+    credential_cache.invalidate(username)
+    sessions.revoke_user(username)
+
+
+def authenticate(user_repo, username: str, password: str, cache: CredentialCache = credential_cache) -> bool:
+    if cache.check(username, password):
+        return True
+
+    # Один запрос к базе по индексу username
+    user = user_repo.get_user_by_username(username)
+    if user is None:
+        return False
+    ok, needs_rehash = verify_password(password, user.password)
+    if not ok:
+        return False
+    if needs_rehash:
+        user_repo.set_password_hash(user.id, hash_password(password))
+    cache.put(username, password)
+    return True
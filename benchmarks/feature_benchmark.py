@@ -0,0 +1,135 @@
+"""
+Сравнение детекторов признаков и способов сопоставления для FindError.
+
+Для каждой конфигурации считается время обработки кадра и совпадение match_ratio с текущим путем SIFT + BF.
+
+    python -m benchmarks.feature_benchmark --frames print.mp4 --nfeatures 1000
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from functions.features import FeatureEngine
+from functions.referencecache import REFERENCE_DIR
+
+DEFAULT_CONFIGS = ("sift:bf", "sift:flann", "orb:bf", "orb:lsh", "akaze:bf", "akaze:lsh")
+BASELINE = "sift:bf"
+
+
+def synthetic_frames(reference, count, seed=0):
+    # Кадры из эталона с небольшим сдвигом, поворотом, шумом и частичным перекрытием
+    rng = np.random.default_rng(seed)
+    height, width = reference.shape[:2]
+    frames = []
+    for _ in range(count):
+        angle = rng.uniform(-5, 5)
+        scale = rng.uniform(0.9, 1.1)
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, scale)
+        matrix[:, 2] += rng.uniform(-15, 15, size=2)
+        frame = cv2.warpAffine(reference, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE)
+        noise = rng.normal(0, 6, frame.shape)
+        frame = np.clip(frame.astype(np.float32) * rng.uniform(0.8, 1.2) + noise, 0, 255).astype(np.uint8)
+        x, y = int(rng.uniform(0, width * 0.7)), int(rng.uniform(0, height * 0.7))
+        cv2.rectangle(frame, (x, y), (x + width // 6, y + height // 6), (0, 0, 0), -1)
+        frames.append(frame)
+    return frames
+
+
+def load_frames(path, limit):
+    if os.path.isdir(path):
+        frames = [cv2.imread(name) for name in sorted(glob.glob(os.path.join(path, "*")))[:limit]]
+        return [frame for frame in frames if frame is not None]
+
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def run_config(config, reference, frames, nfeatures):
+    feature, matcher = config.split(":")
+    engine = FeatureEngine(feature, matcher, nfeatures=nfeatures)
+    keypoints, descriptors = engine.detectAndCompute(reference)
+    engine.build_index(descriptors, key="reference")
+
+    timings, ratios = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        _, frame_descriptors = engine.detectAndCompute(frame)
+        ratio = 0.0
+        if frame_descriptors is not None and len(frame_descriptors) > 1:
+            ratio = engine.match_ratio(keypoints, descriptors, frame_descriptors, key="reference")
+        timings.append((time.perf_counter() - start) * 1000)
+        ratios.append(ratio)
+
+    return {
+        "config": config,
+        "reference_keypoints": len(keypoints),
+        "ms_mean": float(np.mean(timings)),
+        "ms_p50": float(np.percentile(timings, 50)),
+        "ms_p95": float(np.percentile(timings, 95)),
+        "match_ratio_mean": float(np.mean(ratios)),
+        "ratios": ratios,
+    }
+
+
+def compare(results):
+    baseline = next((result for result in results if result["config"] == BASELINE), None)
+    for result in results:
+        if baseline is None:
+            break
+        diff = np.abs(np.array(result["ratios"]) - np.array(baseline["ratios"]))
+        result["agreement_mae"] = float(diff.mean())
+        if np.std(result["ratios"]) > 0 and np.std(baseline["ratios"]) > 0:
+            result["agreement_corr"] = float(np.corrcoef(result["ratios"], baseline["ratios"])[0, 1])
+        else:
+            result["agreement_corr"] = None
+        result["speedup"] = baseline["ms_mean"] / result["ms_mean"] if result["ms_mean"] else None
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк детекторов признаков FindError")
+    parser.add_argument("--reference", default=os.path.join(REFERENCE_DIR, "image2.jpg"))
+    parser.add_argument("--frames", help="видео или папка с кадрами, по умолчанию синтетические кадры из эталона")
+    parser.add_argument("--count", type=int, default=30, help="количество кадров")
+    parser.add_argument("--nfeatures", type=int, default=0, help="ограничение количества ключевых точек")
+    parser.add_argument("--configs", default=",".join(DEFAULT_CONFIGS), help="список feature:matcher")
+    parser.add_argument("--json", help="путь для сохранения результатов")
+    args = parser.parse_args(argv)
+
+    reference = cv2.imread(args.reference)
+    if reference is None:
+        parser.error(f"Не удалось загрузить эталон {args.reference}")
+    frames = load_frames(args.frames, args.count) if args.frames else synthetic_frames(reference, args.count)
+
+    configs = args.configs.split(",")
+    if BASELINE not in configs:
+        configs.insert(0, BASELINE)
+    results = compare([run_config(config, reference, frames, args.nfeatures) for config in configs])
+
+    print(f"{'config':<12}{'kp':>6}{'ms/frame':>10}{'p95':>8}{'ratio':>8}{'mae':>8}{'corr':>8}{'speedup':>9}")
+    for result in results:
+        corr = result.get("agreement_corr")
+        print(f"{result['config']:<12}{result['reference_keypoints']:>6}{result['ms_mean']:>10.2f}"
+              f"{result['ms_p95']:>8.2f}{result['match_ratio_mean']:>8.3f}{result.get('agreement_mae', 0):>8.3f}"
+              f"{corr if corr is None else round(corr, 3)!s:>8}{result.get('speedup') or 0:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Сравнение способов обнаружения движения для MotionDetector.
+
+Каждый кадр записи (или синтетической печати) подготавливается как в PrintPipeline и передается всем способам.
+Считается время на кадр и совпадение решения "есть движение" с текущим путем MOG2: доля совпадений,
+точность и полнота относительно MOG2. Первые кадры пропускаются, пока MOG2 обучает модель фона.
+Для синтетической печати известно, на каких кадрах движется головка, поэтому дополнительно считается
+совпадение с истинной разметкой.
+
+    python -m benchmarks.motion_benchmark --source print.mp4 --json motion.json
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from connectors.replay import FileVideoStream, SyntheticVideoStream
+from functions.motionengines import FrameDiffMotionEngine, Mog2MotionEngine
+from functions.preprocessing import FramePreprocessor
+
+DEFAULT_CONFIGS = ("mog2", "diff:components", "diff:pixels")
+BASELINE = "mog2"
+
+
+def create_engine(config, scale):
+    if config == "mog2":
+        return Mog2MotionEngine()
+    _, decision = config.split(":")
+    return FrameDiffMotionEngine(scale=scale, decision=decision)
+
+
+def read_frames(stream, limit):
+    frames = []
+    while limit is None or len(frames) < limit:
+        try:
+            frames.append(stream.get_frame())
+        except ValueError:
+            break
+    stream.release()
+    return frames
+
+
+def run_config(config, prepared_frames, min_area, scale):
+    engine = create_engine(config, scale)
+    timings, decisions = [], []
+    for prepared in prepared_frames:
+        start = time.perf_counter()
+        motion, _ = engine.detect(prepared.analysis, min_area * prepared.scale ** 2)
+        timings.append((time.perf_counter() - start) * 1000)
+        decisions.append(bool(motion))
+    return {
+        "config": config,
+        "ms_mean": float(np.mean(timings)),
+        "ms_p50": float(np.percentile(timings, 50)),
+        "ms_p95": float(np.percentile(timings, 95)),
+        "motion_frames": int(sum(decisions)),
+        "decisions": decisions,
+    }
+
+
+def agreement(actual, expected):
+    actual, expected = np.array(actual, dtype=bool), np.array(expected, dtype=bool)
+    true_positive = int(np.sum(actual & expected))
+    return {
+        "agreement": float(np.mean(actual == expected)) if len(expected) else None,
+        "precision": true_positive / int(actual.sum()) if actual.sum() else None,
+        "recall": true_positive / int(expected.sum()) if expected.sum() else None,
+    }
+
+
+def compare(results, warmup, truth=None):
+    baseline = next(result for result in results if result["config"] == BASELINE)
+    for result in results:
+        result.update(agreement(result["decisions"][warmup:], baseline["decisions"][warmup:]))
+        if truth is not None:
+            result["truth_agreement"] = agreement(result["decisions"][warmup:], truth[warmup:])["agreement"]
+        result["speedup"] = baseline["ms_mean"] / result["ms_mean"] if result["ms_mean"] else None
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк способов обнаружения движения")
+    parser.add_argument("--source", default="synthetic", help="видео, папка с кадрами, маска файлов или synthetic")
+    parser.add_argument("--frames", type=int, default=300, help="количество кадров")
+    parser.add_argument("--configs", default=",".join(DEFAULT_CONFIGS), help="список mog2, diff:components, "
+                                                                              "diff:pixels")
+    parser.add_argument("--min-area", type=int, default=1000, help="минимальная площадь движения на полном кадре")
+    parser.add_argument("--scale", type=float, default=0.5, help="уменьшение изображения для diff")
+    parser.add_argument("--analysis-width", type=int, default=640)
+    parser.add_argument("--warmup", type=int, default=30, help="кадров на обучение фона, не учитываются")
+    parser.add_argument("--json", help="путь для сохранения результатов")
+    args = parser.parse_args(argv)
+
+    stream = SyntheticVideoStream(frames=args.frames) if args.source == "synthetic" else FileVideoStream(args.source)
+    preprocessor = FramePreprocessor(analysis_width=args.analysis_width)
+    prepared_frames = [preprocessor.prepare(frame) for frame in read_frames(stream, args.frames)]
+
+    configs = args.configs.split(",")
+    if BASELINE not in configs:
+        configs.insert(0, BASELINE)
+    # Истинная разметка синтетической печати: головка движется на первых print_frames кадрах
+    truth = [0 < index < stream.print_frames for index in range(len(prepared_frames))] \
+        if isinstance(stream, SyntheticVideoStream) else None
+    results = compare([run_config(config, prepared_frames, args.min_area, args.scale) for config in configs],
+                      args.warmup, truth)
+
+    print(f"Кадров: {len(prepared_frames)}")
+    print(f"{'config':<18}{'ms/frame':>10}{'p95':>8}{'motion':>8}{'agree':>8}{'prec':>8}{'recall':>8}"
+          f"{'truth':>8}{'speedup':>9}")
+    for result in results:
+        print(f"{result['config']:<18}{result['ms_mean']:>10.3f}{result['ms_p95']:>8.3f}{result['motion_frames']:>8}"
+              f"{result['agreement'] or 0:>8.3f}{result['precision'] or 0:>8.3f}{result['recall'] or 0:>8.3f}"
+              f"{result.get('truth_agreement') or 0:>8.3f}{result['speedup'] or 0:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Бенчмарк цепочки детекторов без камеры.
+
+Записанная печать (видео, папка с кадрами или маска файлов) или синтетические кадры прогоняются через
+FramePreprocessor, MotionDetector, TimerDetectorDecorator, PrintErrorDetector с FindError и сжатие JPEG
+так быстро, как позволяет процессор. Для каждого этапа считаются пропускная способность и задержки
+p50/p95/p99, для всего прогона - пиковая память. Результаты сохраняются в JSON и могут сравниваться
+с предыдущим прогоном (--baseline), ненулевой код выхода означает регрессию.
+
+    python -m benchmarks.pipeline_benchmark --source print.mp4 --json result.json
+    python -m benchmarks.pipeline_benchmark --frames 300 --baseline result.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from connectors.replay import FileVideoStream, SyntheticVideoStream
+from decorators.decorators import PrintErrorDetector, TimerDetectorDecorator
+from functions.alignment import HomographyAligner
+from functions.errorsdetector import FindError
+from functions.features import FeatureEngine
+from functions.motiondetector import MotionDetector
+from functions.preprocessing import FramePreprocessor
+from functions.referencecache import ReferenceFeatureCache
+from functions.scheduler import AnalysisScheduler
+
+
+class StageTimer:
+    # Время вызовов по этапам. Этапы вложены: chain включает timer, timer включает motion и т.д.
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage, func):
+        samples = self.samples[stage]
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+        return timed
+
+    def instrument(self, obj, method, stage):
+        # Подмена метода у экземпляра, вызовы через self.method тоже попадают в замер
+        setattr(obj, method, self.wrap(stage, getattr(obj, method)))
+
+    def summary(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            ms = np.array(samples) * 1000
+            total = float(np.sum(samples))
+            result[stage] = {
+                "calls": len(samples),
+                "total_s": round(total, 4),
+                "per_second": round(len(samples) / total, 2) if total else None,
+                "mean_ms": round(float(ms.mean()), 3),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                "p99_ms": round(float(np.percentile(ms, 99)), 3),
+                "max_ms": round(float(ms.max()), 3),
+            }
+        return result
+
+
+def open_source(args):
+    if args.source == "synthetic":
+        return SyntheticVideoStream(frames=args.frames, width=args.width, height=args.height, seed=args.seed)
+    return FileVideoStream(args.source, loop=args.loop)
+
+
+def build_chain(args, timer, events, preprocessor):
+    engine = FeatureEngine(args.feature, args.matcher, nfeatures=args.nfeatures)
+    aligner = HomographyAligner(drift_tolerance=args.drift_tolerance) if args.alignment else None
+    find_error = FindError(error_threshold=args.error_threshold, engine=engine, aligner=aligner)
+    motion_detector = MotionDetector(engine=args.motion_engine)
+    motion_timer = TimerDetectorDecorator(motion_detector)
+    scheduler = AnalysisScheduler(every_n_frames=args.analyze_every) if args.analyze_every > 1 else None
+    print_error_detector = PrintErrorDetector(motion_timer, find_error, quality_threshold=args.quality_threshold,
+                                              reference_name=args.reference,
+                                              reference_cache=ReferenceFeatureCache(engine=engine,
+                                                                                    preprocessor=preprocessor),
+                                              scheduler=scheduler)
+
+    def on_error(elapsed_time, last_frame, error_message):
+        # Ошибка печати не останавливает прогон, детектор снимается с паузы
+        events["print_errors"] += 1
+        find_error.resume()
+
+    motion_timer.set_motion_end_handler(lambda total_time, last_frame: events.__setitem__(
+        "motion_end", events["motion_end"] + 1))
+    print_error_detector.set_error_handler(on_error)
+
+    timer.instrument(print_error_detector, "process_frame", "chain")
+    timer.instrument(motion_timer, "process_frame", "motion_timer")
+    timer.instrument(motion_detector, "process_frame", "motion")
+    timer.instrument(find_error, "compute_scores", "quality")
+    # Полное сопоставление признаков: с --alignment только при расчете гомографии
+    timer.instrument(find_error, "match_features", "feature_match")
+    # Дескрипторы эталона считаются до замеров
+    print_error_detector.get_reference_features()
+    return print_error_detector
+
+
+def run(args):
+    timer = StageTimer()
+    events = defaultdict(int)
+    source = open_source(args)
+    preprocessor = FramePreprocessor(analysis_width=args.analysis_width)
+    capture = timer.wrap("capture", source.get_frame)
+    prepare = timer.wrap("preprocess", preprocessor.prepare)
+    chain = build_chain(args, timer, events, preprocessor)
+    encode = timer.wrap("encode", lambda image: cv2.imencode('.jpg', image)[1])
+
+    if args.trace_memory:
+        tracemalloc.start()
+    frames = 0
+    start = time.perf_counter()
+    try:
+        while args.frames is None or frames < args.frames:
+            try:
+                frame = capture()
+            except ValueError:
+                break  # Конец записи
+            try:
+                processed_frame, motion_detected = chain.process_frame(prepare(frame))
+                events["motion_frames"] += int(motion_detected)
+            except Exception as e:
+                events["frame_errors"] += 1
+                processed_frame = frame
+                if args.verbose:
+                    print(f"Ошибка обработки кадра {frames}: {e}")
+            encode(processed_frame)
+            frames += 1
+    finally:
+        wall = time.perf_counter() - start
+        source.release()
+    peak_traced = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    if args.trace_memory:
+        tracemalloc.stop()
+
+    # ru_maxrss в Linux - килобайты, в macOS - байты
+    rss_divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")},
+        "environment": {"python": platform.python_version(), "opencv": cv2.__version__,
+                        "machine": platform.machine(), "processor": platform.processor()},
+        "frames": frames,
+        "wall_s": round(wall, 3),
+        "fps": round(frames / wall, 2) if wall else None,
+        "stages": timer.summary(),
+        "events": dict(events),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / rss_divisor, 1),
+        "peak_traced_mb": round(peak_traced / 1024 / 1024, 1) if peak_traced is not None else None,
+    }
+
+
+def compare(result, baseline, tolerance):
+    # Регрессия - рост p95 этапа больше чем на tolerance относительно базового прогона
+    regressions = []
+    for stage, stats in result["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base or not base["p95_ms"]:
+            continue
+        ratio = stats["p95_ms"] / base["p95_ms"]
+        stats["p95_vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(stage)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк цепочки детекторов на записи или синтетических кадрах")
+    parser.add_argument("--source", default="synthetic", help="видео, папка с кадрами, маска файлов или synthetic")
+    parser.add_argument("--frames", type=int, help="ограничение количества кадров (для synthetic - 300)")
+    parser.add_argument("--loop", action="store_true", help="повторять запись до --frames кадров")
+    parser.add_argument("--width", type=int, default=640, help="ширина синтетических кадров")
+    parser.add_argument("--height", type=int, default=480, help="высота синтетических кадров")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reference", default="image2.jpg", help="эталон из папки referenceses")
+    parser.add_argument("--feature", default="sift")
+    parser.add_argument("--matcher", default="bf")
+    parser.add_argument("--nfeatures", type=int, default=0)
+    parser.add_argument("--motion-engine", default="mog2", choices=("mog2", "diff"))
+    parser.add_argument("--alignment", action="store_true", help="сравнение по сохраненной гомографии")
+    parser.add_argument("--drift-tolerance", type=float, default=0.15, help="падение сходства до пересчета "
+                                                                            "гомографии")
+    parser.add_argument("--analysis-width", type=int, default=640, help="ширина кадра для анализа, 0 - полная")
+    parser.add_argument("--analyze-every", type=int, default=1, help="проверка качества раз в N кадров")
+    parser.add_argument("--quality-threshold", type=float, default=0.01)
+    parser.add_argument("--error-threshold", type=float, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="пик памяти Python через tracemalloc")
+    parser.add_argument("--json", help="путь для сохранения результатов")
+    parser.add_argument("--baseline", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимый рост p95 этапа")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    if args.source == "synthetic" and args.frames is None:
+        args.frames = 300
+    args.analysis_width = args.analysis_width or None
+
+    result = run(args)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(result, json.load(file), args.tolerance)
+        result["regressions"] = regressions
+
+    print(f"Кадров: {result['frames']}, {result['fps']} кадров/с, пик памяти {result['peak_rss_mb']} МБ")
+    print(f"{'stage':<14}{'calls':>7}{'per_s':>10}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:<14}{stats['calls']:>7}{stats['per_second'] or 0:>10.1f}{stats['p50_ms']:>9.2f}"
+              f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}")
+    if regressions:
+        print(f"Регрессия p95: {', '.join(regressions)}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Бенчмарк запуска приложения.
+
+Каждый прогон выполняется в новом процессе Python: замеряются импорт main.app (холодный импорт без открытия камеры
+и подключения к базе), запуск lifespan, время до первого кадра трансляции при подключении зрителя сразу после
+запуска и время до готовности по /ready (база доступна, эталоны всех принтеров загружены). Вместо камеры
+используется запись или синтетические кадры. Результаты сохраняются в JSON и могут сравниваться с предыдущим
+прогоном (--baseline), ненулевой код выхода означает регрессию.
+
+    python -m benchmarks.startup_benchmark --runs 5 --json startup.json
+    python -m benchmarks.startup_benchmark --baseline startup.json --tolerance 0.3 --import-profile 15
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_PREFIX = "STARTUP_RESULT "
+METRICS = ("import_s", "lifespan_s", "first_frame_s", "ready_s")
+
+
+def open_source(args):
+    from connectors.replay import FileVideoStream, SyntheticVideoStream
+
+    if args.source == "synthetic":
+        return SyntheticVideoStream(frames=100000, width=args.width, height=args.height, fps=args.fps)
+    return FileVideoStream(args.source, loop=True, fps=args.fps)
+
+
+async def measure_lifespan(app_module, args, started):
+    result = {}
+    async with app_module.app.router.lifespan_context(app_module.app):
+        result["lifespan_s"] = time.perf_counter() - started
+        # Зритель подключается сразу после запуска, эталоны в это время могут еще загружаться
+        subscription = app_module.pipeline.subscribe()
+        try:
+            await subscription.get_async(timeout=args.timeout)
+            result["first_frame_s"] = time.perf_counter() - started
+        finally:
+            subscription.close()
+        deadline = time.perf_counter() + args.timeout
+        while not app_module.readiness()["ready"]:
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Приложение не стало готовым")
+            await asyncio.sleep(0.005)
+        result["ready_s"] = time.perf_counter() - started
+    return result
+
+
+def child(args):
+    # Один прогон в новом процессе, результат - строка JSON с префиксом RESULT_PREFIX
+    start = time.perf_counter()
+    import main.app as app_module
+    imported = time.perf_counter()
+
+    # Ресурсы, которые не должны создаваться при импорте
+    eager = {
+        "database_engine": app_module.db.engine_created,
+        "writer_thread": app_module.writer.thread is not None,
+        "camera": any(printer.videostream is not None for printer in app_module.registry),
+        "references": any(printer.warmed_up for printer in app_module.registry),
+    }
+    for printer in app_module.registry:
+        printer.source_factory = lambda: open_source(args)
+
+    result = {"import_s": imported - start, **asyncio.run(measure_lifespan(app_module, args, time.perf_counter()))}
+    result = {key: round(value, 4) for key, value in result.items()}
+    result["eager_resources"] = [name for name, created in eager.items() if created]
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+def child_env(args):
+    env = dict(os.environ)
+    env["DATABASE_URL"] = args.database_url
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+def run_once(args):
+    command = [sys.executable, "-m", "benchmarks.startup_benchmark", "--child", "--source", args.source,
+               "--width", str(args.width), "--height", str(args.height), "--fps", str(args.fps),
+               "--timeout", str(args.timeout)]
+    completed = subprocess.run(command, cwd=ROOT, env=child_env(args), capture_output=True, text=True,
+                               timeout=args.timeout * 3)
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"Прогон завершился без результата:\n{completed.stderr[-2000:]}")
+
+
+def import_profile(args, top):
+    # Самые долгие модули холодного импорта по данным python -X importtime
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main.app"], cwd=ROOT,
+                               env=child_env(args), capture_output=True, text=True, timeout=args.timeout)
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line.split(":", 1)[1].split("|")
+        # Вложенность отмечается двумя пробелами, берутся модули, которые импортирует сам main.app
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            modules.append({"module": name.strip(), "self_ms": int(own) / 1000,
+                            "cumulative_ms": int(cumulative) / 1000})
+    return sorted(modules, key=lambda module: module["cumulative_ms"], reverse=True)[:top]
+
+
+def summarize(runs):
+    summary = {}
+    for metric in METRICS:
+        values = [run[metric] for run in runs]
+        summary[metric] = {
+            "median": round(statistics.median(values), 4),
+            "min": round(min(values), 4),
+            "max": round(max(values), 4),
+        }
+    return summary
+
+
+def compare(result, baseline, tolerance):
+    # Регрессия - рост медианы больше чем на tolerance относительно базового прогона
+    regressions = []
+    for metric, stats in result["summary"].items():
+        base = baseline.get("summary", {}).get(metric)
+        if not base or not base["median"]:
+            continue
+        ratio = stats["median"] / base["median"]
+        stats["median_vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(metric)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного импорта и времени до первого кадра")
+    parser.add_argument("--runs", type=int, default=3, help="количество прогонов, каждый в новом процессе")
+    parser.add_argument("--source", default="synthetic", help="видео, папка с кадрами, маска файлов или synthetic")
+    parser.add_argument("--width", type=int, default=640, help="ширина синтетических кадров")
+    parser.add_argument("--height", type=int, default=480, help="высота синтетических кадров")
+    parser.add_argument("--fps", type=float, default=30.0, help="частота кадров источника")
+    parser.add_argument("--database-url", default="sqlite://", help="база для прогонов, по умолчанию в памяти")
+    parser.add_argument("--timeout", type=float, default=60.0, help="ограничение времени одного прогона, секунды")
+    parser.add_argument("--import-profile", type=int, default=0, help="показать N самых долгих модулей импорта")
+    parser.add_argument("--json", help="путь для сохранения результатов")
+    parser.add_argument("--baseline", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="допустимый рост медианы")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args)
+        return 0
+
+    runs = [run_once(args) for _ in range(max(1, args.runs))]
+    result = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline", "child")},
+        "environment": {"python": platform.python_version(), "machine": platform.machine(),
+                        "processor": platform.processor()},
+        "runs": runs,
+        "summary": summarize(runs),
+        "eager_resources": sorted({name for run in runs for name in run["eager_resources"]}),
+    }
+    if args.import_profile:
+        result["import_profile"] = import_profile(args, args.import_profile)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(result, json.load(file), args.tolerance)
+        result["regressions"] = regressions
+
+    print(f"Прогонов: {len(runs)}")
+    print(f"{'metric':<16}{'median':>10}{'min':>10}{'max':>10}")
+    for metric, stats in result["summary"].items():
+        print(f"{metric:<16}{stats['median']:>10.3f}{stats['min']:>10.3f}{stats['max']:>10.3f}")
+    if result["eager_resources"]:
+        print(f"Создаются при импорте: {', '.join(result['eager_resources'])}")
+    for module in result.get("import_profile", []):
+        print(f"{module['module']:<40}{module['cumulative_ms']:>10.1f} мс")
+    if regressions:
+        print(f"Регрессия: {', '.join(regressions)}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2, ensure_ascii=False)
+    return 1 if regressions or result["eager_resources"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
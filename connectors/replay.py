@@ -0,0 +1,146 @@
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from connectors.videoconnect import VideoStream
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def list_images(path):
+    # Кадры из папки или по маске (prints/*.jpg), по порядку имен файлов
+    pattern = os.path.join(path, "*") if os.path.isdir(path) else path
+    return [name for name in sorted(glob.glob(pattern)) if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+'''
+
+FileVideoStream - источник кадров из записанного видео или последовательности изображений с тем же интерфейсом,
+что и VideoStream (get_frame, release). Позволяет прогонять записанную печать через детекторы без камеры.
+По умолчанию кадры отдаются так быстро, как их читают; fps ограничивает скорость как у реальной камеры.
+
+'''
+
+
+class FileVideoStream(VideoStream):
+    def __init__(self, src, loop: bool = False, fps: float = None):
+        self.src = src
+        self.loop = loop  # Начинать сначала после последнего кадра
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_frame_time = None
+        self.frame_index = 0
+        self.images = None
+        if os.path.isdir(src) or glob.has_magic(src):
+            self.images = list_images(src)
+            if not self.images:
+                raise ValueError(f"Нет изображений в {src}.")
+        else:
+            self.stream = cv2.VideoCapture(src)
+            if not self.stream.isOpened():
+                raise ValueError("Не удалось открыть видеопоток.")
+
+    def _throttle(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_frame_time is not None and now < self.next_frame_time:
+            time.sleep(self.next_frame_time - now)
+            now = self.next_frame_time
+        self.next_frame_time = now + self.interval
+
+    def _read(self):
+        if self.images is not None:
+            if self.frame_index >= len(self.images):
+                return None
+            frame = cv2.imread(self.images[self.frame_index])
+            if frame is None:
+                raise ValueError(f"Не удалось прочитать {self.images[self.frame_index]}.")
+            return frame
+        ret, frame = self.stream.read()
+        return frame if ret else None
+
+    def get_frame(self):
+        self._throttle()
+        frame = self._read()
+        if frame is None and self.loop and self.frame_index:
+            self.rewind()
+            frame = self._read()
+        if frame is None:
+            raise ValueError("Не удалось получить кадр.")
+        self.frame_index += 1
+        return frame
+
+    def rewind(self):
+        self.frame_index = 0
+        if self.images is None:
+            self.stream.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+
+'''
+
+SyntheticVideoStream генерирует кадры печати без камеры и без файлов: неподвижный стол, движущаяся печатающая
+головка и растущая модель в фазе печати, затем неподвижная готовая модель. Кадры детерминированы (seed),
+поэтому результаты бенчмарков можно сравнивать между версиями.
+
+'''
+
+
+class SyntheticVideoStream(VideoStream):
+    def __init__(self, frames: int = 300, width: int = 640, height: int = 480, print_frames: int = None,
+                 background=None, noise: float = 2.0, seed: int = 0, fps: float = None):
+        self.src = "synthetic"
+        self.frames = frames  # Всего кадров, затем get_frame сообщает о конце потока
+        self.print_frames = int(frames * 0.7) if print_frames is None else print_frames  # Кадров с движением
+        self.rng = np.random.default_rng(seed)
+        self.interval = 1.0 / fps if fps else 0.0
+        self.frame_index = 0
+
+        if background is None:
+            # Стол принтера: текстура, чтобы у кадра были ключевые точки
+            texture = self.rng.integers(60, 200, size=(height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+            background = cv2.resize(texture, (width, height), interpolation=cv2.INTER_NEAREST)
+        else:
+            background = cv2.resize(background, (width, height))
+        self.background = background
+        self.width, self.height = width, height
+        # Несколько заранее посчитанных кадров шума, генерация шума на каждый кадр медленнее самих детекторов
+        self.noise_frames = [self.rng.normal(0, noise, background.shape).astype(np.int16) for _ in range(8)] \
+            if noise else []
+
+    def render(self, index):
+        frame = self.background.copy()
+        cx, cy = self.width // 2, self.height // 2
+        progress = min(index, self.print_frames) / max(1, self.print_frames)
+
+        # Модель растет по мере печати
+        size = int(min(self.width, self.height) * 0.3 * progress)
+        if size > 0:
+            cv2.rectangle(frame, (cx - size // 2, cy - size // 2), (cx + size // 2, cy + size // 2),
+                          (40, 120, 220), -1)
+
+        # Головка движется только во время печати
+        if index < self.print_frames:
+            angle = index * 0.35
+            hx = int(cx + np.cos(angle) * self.width * 0.3)
+            hy = int(cy + np.sin(angle * 0.7) * self.height * 0.3)
+            cv2.rectangle(frame, (hx - 30, hy - 20), (hx + 30, hy + 20), (30, 30, 30), -1)
+
+        if self.noise_frames:
+            noise = self.noise_frames[index % len(self.noise_frames)]
+            frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+        return frame
+
+    def get_frame(self):
+        if self.frame_index >= self.frames:
+            raise ValueError("Не удалось получить кадр.")
+        if self.interval:
+            time.sleep(self.interval)
+        frame = self.render(self.frame_index)
+        self.frame_index += 1
+        return frame
+
+    def release(self):
+        pass
@@ -1,3 +1,8 @@
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+
 import cv2
 
 
@@ -23,3 +28,111 @@ class VideoStream:
             self.stream.release()
 
 
+# Кадр с порядковым номером и временем захвата
+class FramePacket(NamedTuple):
+    seq: int
+    timestamp: float
+    frame: object
+
+
+"""
+
+ThreadedVideoStream читает кадры с камеры в отдельном потоке и хранит только последние кадры в ограниченном
+буфере. Потребитель всегда получает самый свежий кадр и не ждет устройство, а внутренний буфер драйвера
+не заполняется устаревшими кадрами, пока идет медленный анализ.
+
+"""
+
+
+class ThreadedVideoStream(VideoStream):
+    def __init__(self, src=0, buffer_size: int = 1, read_timeout: float = 2.0):
+        super().__init__(src)
+        self.buffer = deque(maxlen=max(1, buffer_size))  # Последние захваченные кадры
+        self.read_timeout = read_timeout  # Сколько ждать нового кадра от потока чтения
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self.error: Optional[str] = None  # Ошибка потока чтения
+        self.frames_captured = 0  # Всего прочитано с устройства
+        self.frames_delivered = 0  # Отдано потребителям
+        self.frames_dropped = 0  # Пропущено, так как потребитель не успел их забрать
+        self.last_delivered_seq = 0
+        self.cpu_time = 0.0  # Процессорное время потока чтения
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._reader, name=f"capture-{self.src}", daemon=True)
+            self.thread.start()
+        return self
+
+    def _reader(self):
+        cpu_start = time.thread_time()
+        while self.running:
+            self.cpu_time = time.thread_time() - cpu_start
+            ret, frame = self.stream.read()
+            if not ret:
+                with self.condition:
+                    self.error = "Не удалось получить кадр."
+                    self.running = False
+                    self.condition.notify_all()
+                break
+
+            with self.condition:
+                self.frames_captured += 1
+                self.buffer.append(FramePacket(self.frames_captured, time.time(), frame))
+                self.condition.notify_all()
+
+    def read_packet(self, timeout: Optional[float] = None) -> FramePacket:
+        # Возвращает самый свежий кадр, который еще не был отдан. Ждет только поток чтения, а не камеру
+        if self.thread is None:
+            self.start()
+        timeout = self.read_timeout if timeout is None else timeout
+
+        with self.condition:
+            has_new = self.condition.wait_for(
+                lambda: (self.buffer and self.buffer[-1].seq > self.last_delivered_seq) or not self.running,
+                timeout=timeout
+            )
+            if not self.buffer or self.buffer[-1].seq <= self.last_delivered_seq:
+                if self.error:
+                    raise ValueError(self.error)
+                if not has_new:
+                    raise ValueError("Не удалось получить кадр: истекло время ожидания.")
+                raise ValueError("Видеопоток не открыт.")
+
+            packet = self.buffer[-1]
+            self.frames_dropped += packet.seq - self.last_delivered_seq - 1
+            self.frames_delivered += 1
+            self.last_delivered_seq = packet.seq
+            return packet
+
+    def get_frame(self):
+        return self.read_packet().frame
+
+    def get_recent(self):
+        # Копия кольцевого буфера последних кадров (от старых к новым)
+        with self.condition:
+            return list(self.buffer)
+
+    def get_stats(self):
+        with self.condition:
+            latest = self.buffer[-1] if self.buffer else None
+            return {
+                "captured": self.frames_captured,
+                "delivered": self.frames_delivered,
+                "dropped": self.frames_dropped,
+                "last_seq": latest.seq if latest else 0,
+                "latest_age": time.time() - latest.timestamp if latest else None,
+                "running": self.running,
+                "cpu_time": round(self.cpu_time, 3),
+            }
+
+    def release(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=self.read_timeout)
+        self.thread = None
+        super().release()
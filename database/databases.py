@@ -1,8 +1,19 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text
-from sqlalchemy.orm import sessionmaker, declarative_base
+import base64
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, Column, Integer, String, Text, LargeBinary, DateTime, Float, Enum, Index, or_
+from sqlalchemy.dialects.mysql import LONGBLOB, MEDIUMBLOB
+from sqlalchemy.orm import sessionmaker, declarative_base, deferred, load_only, column_property
 from sqlalchemy.exc import SQLAlchemyError
-from validation.all_classes import UserCreateSchema, UserUpdateSchema
+from sqlalchemy.pool import StaticPool
+from validation.all_classes import UserCreateSchema, UserUpdateSchema, PrintOutcome
+from auth.auth import hash_password, invalidate_user
 from sqlalchemy.sql import text
+from database.storage import (STORAGE_BASE64, STORAGE_BLOB, STORAGE_FILE, STORAGE_MODES, SnapshotStore,
+                              make_thumbnail)
 
 # Базовый класс для моделей
 Base = declarative_base()
@@ -16,29 +27,102 @@ class DatabaseConnection:
     # Использование паттерна Singleton
     _instance = None
 
-    def __new__(cls, username, password, host, database):
+    def __new__(cls, *args, **kwargs):
         if not cls._instance:
             cls._instance = super(DatabaseConnection, cls).__new__(cls)
             cls._instance._initialized = False
         return cls._instance
 
-    def __init__(self, username, password, host, database):
+    def __init__(self, username=None, password=None, host=None, database=None, url=None, pool_size=5,
+                 max_overflow=10, pool_recycle=1800, pool_pre_ping=True, echo=False):
         if not self._initialized:
-            # Подключение к mysql с помощью pymysql
-            self.database_url = f"mysql+pymysql://{username}:{password}@{host}/{database}"
-            self.engine = create_engine(self.database_url, echo=True)
-            self.SessionFactory = sessionmaker(bind=self.engine, expire_on_commit=False)
+            # Подключение к mysql с помощью pymysql, либо по готовому адресу (например, sqlite для локального запуска)
+            self.database_url = url or f"mysql+pymysql://{username}:{password}@{host}/{database}"
+            self.echo = echo
+            self.options = self.engine_options(self.database_url, pool_size, max_overflow, pool_recycle,
+                                               pool_pre_ping)
+            # Движок и драйвер базы создаются при первом обращении, импорт приложения не подключается к базе
+            self._engine = None
+            self._session_factory = None
+            self.lock = threading.Lock()
+            self.tables_created = False
             self._initialized = True
 
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self.lock:
+                if self._engine is None:
+                    engine = create_engine(self.database_url, echo=self.echo, **self.options)
+                    self._session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+                    self._engine = engine
+        return self._engine
+
+    @property
+    def engine_created(self):
+        return self._engine is not None
+
+    @property
+    def SessionFactory(self):
+        if self._session_factory is None:
+            self.engine  # Фабрика сессий создается вместе с движком
+        return self._session_factory
+
+    @staticmethod
+    def engine_options(url, pool_size, max_overflow, pool_recycle, pool_pre_ping):
+        if url.startswith("sqlite"):
+            options = {"connect_args": {"check_same_thread": False}}
+            if url in ("sqlite://", "sqlite:///:memory:"):
+                # Одна общая база в памяти для всех потоков
+                options["poolclass"] = StaticPool
+            return options
+        return {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_recycle": pool_recycle,
+            "pool_pre_ping": pool_pre_ping,
+        }
+
     def get_session(self):
         return self.SessionFactory()
 
+    @contextmanager
+    def session_scope(self):
+        # Сессия на одну операцию: фиксация при успехе, откат при ошибке и обязательное закрытие
+        session = self.get_session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
     def close_session(self):
-        self.engine.dispose()
+        # После закрытия следующее обращение создает движок заново
+        with self.lock:
+            engine, self._engine, self._session_factory = self._engine, None, None
+        if engine is not None:
+            engine.dispose()
+            self.tables_created = False
+
+    def ping(self) -> bool:
+        # Проверка доступности базы для /ready
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return True
+        except SQLAlchemyError:
+            return False
 
     def create_tables(self):
+        # Схема создается один раз при запуске приложения
+        if self.tables_created:
+            return
         with self.engine.begin() as conn:
             Base.metadata.create_all(conn)
+        self.tables_created = True
 
 
 # Создание таблицы пользователей
@@ -53,17 +137,70 @@ class Users(Base):
         return f"<User(username={self.username}, password={self.password})>"
 
 
+# Длина колонки статуса, сообщения детекторов длиннее обрезаются при записи
+STATUS_LENGTH = 255
+
+
 # Создание таблицы информации о печати
 class PrintInfo(Base):
     __tablename__ = 'print_info'
 
     id = Column(Integer, primary_key=True)
     print_time = Column(String(50), nullable=False)
-    status = Column(String(50), nullable=False)
-    image = Column(Text, nullable=True)
+    status = Column(String(STATUS_LENGTH), nullable=False)  # Текст статуса, у ошибок содержит сообщение детектора
+    # Типизированные колонки для истории печати. Для старых записей заполняются миграцией
+    printer_id = Column(String(50), nullable=True, default="default")
+    started_at = Column(DateTime, nullable=True, index=True)  # Время начала печати, UTC
+    duration_seconds = Column(Float, nullable=True)
+    outcome = Column(Enum(PrintOutcome, native_enum=False, length=20,
+                          values_callable=lambda outcomes: [outcome.value for outcome in outcomes]), nullable=True)
+    # Изображения загружаются только при обращении к атрибуту, списки записей их не читают
+    image = deferred(Column(Text, nullable=True))  # Снимок в base64 (старый формат)
+    image_data = deferred(Column(LargeBinary().with_variant(LONGBLOB, "mysql"), nullable=True))  # Байты JPEG
+    image_ref = Column(String(64), nullable=True)  # sha256 снимка в файловом хранилище
+    thumbnail = deferred(Column(LargeBinary().with_variant(MEDIUMBLOB, "mysql"), nullable=True))  # Миниатюра JPEG
+    clip_ref = Column(String(100), nullable=True)  # Имя ролика последних секунд перед ошибкой в папке clips
+
+    # История читается по убыванию id, индексы покрывают фильтр и сортировку без полного просмотра таблицы
+    __table_args__ = (
+        Index("ix_print_info_printer_id_id", "printer_id", "id"),
+        Index("ix_print_info_outcome_id", "outcome", "id"),
+    )
 
     def __repr__(self):
-        return f"<PrintInfo(print_time={self.print_time}, status={self.status}, image={self.image})>"
+        return f"<PrintInfo(print_time={self.print_time}, status={self.status}, image_ref={self.image_ref})>"
+
+
+# Наличие снимка вычисляется в запросе, сами изображения при этом не читаются
+PrintInfo.has_image = column_property(
+    or_(PrintInfo.image_data.isnot(None), PrintInfo.image_ref.isnot(None), PrintInfo.image.isnot(None))
+)
+
+PrintInfo.has_clip = column_property(PrintInfo.clip_ref.isnot(None))
+
+# Колонки, которые читаются для списка истории
+HISTORY_COLUMNS = (PrintInfo.id, PrintInfo.printer_id, PrintInfo.started_at, PrintInfo.duration_seconds,
+                   PrintInfo.outcome, PrintInfo.status, PrintInfo.image_ref, PrintInfo.has_image, PrintInfo.clip_ref,
+                   PrintInfo.has_clip)
+
+
+def parse_duration(print_time):
+    # print_time хранится строкой, для истории нужна длительность в секундах
+    try:
+        return float(print_time)
+    except (TypeError, ValueError):
+        return None
+
+
+def outcome_from_status(status: str):
+    return PrintOutcome.ERROR if status.startswith("Ошибка") else PrintOutcome.SUCCESS
+
+
+def truncate_status(status: str) -> str:
+    # Текст исключения (например, OpenCV) может быть длиннее колонки, и вставка всей пачки завершится ошибкой
+    if len(status) <= STATUS_LENGTH:
+        return status
+    return status[:STATUS_LENGTH - 1] + "…"
 
 
 """
@@ -77,7 +214,8 @@ class UserRepository:
 
     def add_user(self, user_data: UserCreateSchema):
         try:
-            new_user = Users(username=user_data.username, password=user_data.password)
+            # Пароль хранится только в виде хеша pbkdf2
+            new_user = Users(username=user_data.username, password=hash_password(user_data.password))
             self.session.add(new_user)
             self.session.commit()
         except SQLAlchemyError as e:
@@ -85,48 +223,161 @@ class UserRepository:
             print(f"Ошибка добавления пользователя: {e}")
 
     def get_user(self, user_id):
-        query = text("SELECT * FROM users WHERE id = :id")
-        result = self.session.execute(query, {"id": user_id})
-        return result.fetchone()
+        return self.session.get(Users, user_id)
+
+    def get_user_by_username(self, username):
+        # Поиск одной строки по уникальному индексу username
+        return self.session.query(Users).filter(Users.username == username).first()
 
     def get_all_users(self):
         query = text("SELECT * FROM users")
         result = self.session.execute(query)
         return result.fetchall()
 
+    def set_password_hash(self, user_id, password_hash):
+        # Замена старого пароля в открытом виде на хеш после успешного входа
+        try:
+            self.session.query(Users).filter(Users.id == user_id).update({Users.password: password_hash})
+            self.session.commit()
+        except SQLAlchemyError as e:
+            self.session.rollback()
+            print(f"Ошибка обновления пароля: {e}")
+
     def update_user(self, user_id, user_data: UserUpdateSchema):
         user = self.get_user(user_id)
         if user:
+            invalidate_user(user.username)
             if user_data.username:
                 user.username = user_data.username
             if user_data.password:
-                user.password = user_data.password
+                user.password = hash_password(user_data.password)
             self.session.commit()
 
     def delete_user(self, user_id):
         user = self.get_user(user_id)
         if user:
+            invalidate_user(user.username)
             self.session.delete(user)
             self.session.commit()
 
 
 class PrintInfoRepository:
-    def __init__(self, session):
+    def __init__(self, session, storage_mode: str = STORAGE_BLOB, store: SnapshotStore = None):
+        if storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Неизвестный способ хранения снимков: {storage_mode}")
         self.session = session
+        self.storage_mode = storage_mode  # base64, blob или file
+        self.store = store or (SnapshotStore() if storage_mode == STORAGE_FILE else None)
+
+    def snapshot_columns(self, image=None, jpeg=None, thumbnail=None):
+        # Значения колонок снимка для выбранного способа хранения. image - base64 строка, jpeg - байты
+        if jpeg is None and image:
+            jpeg = base64.b64decode(image)
+        if jpeg is None:
+            return {}
+
+        if thumbnail is None:
+            try:
+                thumbnail = make_thumbnail(jpeg)
+            except ValueError as e:
+                print(f"Ошибка создания миниатюры: {e}")
 
-    def add_print_info(self, print_time, status, image=None):
+        if self.storage_mode == STORAGE_BASE64:
+            columns = {"image": image or base64.b64encode(jpeg).decode('utf-8')}
+        elif self.storage_mode == STORAGE_FILE:
+            columns = {"image_ref": self.store.put(jpeg)}
+        else:
+            columns = {"image_data": jpeg}
+        columns["thumbnail"] = thumbnail
+        return columns
+
+    @staticmethod
+    def history_columns(print_time, status, printer_id=None, outcome=None, finished_at=None):
+        # Типизированные колонки истории: статус в пределах длины колонки, принтер, время начала,
+        # длительность и результат
+        duration = parse_duration(print_time)
+        finished_at = time.time() if finished_at is None else finished_at
+        return {
+            "status": truncate_status(status),
+            "printer_id": printer_id or "default",
+            "duration_seconds": duration,
+            "started_at": datetime.fromtimestamp(finished_at - (duration or 0), timezone.utc).replace(tzinfo=None),
+            "outcome": PrintOutcome(outcome) if outcome else outcome_from_status(status),
+        }
+
+    def add_print_info(self, print_time, status, image=None, jpeg=None, printer_id=None, outcome=None,
+                       clip_ref=None):
         try:
-            new_print_info = PrintInfo(print_time=print_time, status=status, image=image)
+            new_print_info = PrintInfo(print_time=print_time, clip_ref=clip_ref,
+                                       **self.history_columns(print_time, status, printer_id, outcome),
+                                       **self.snapshot_columns(image, jpeg))
             self.session.add(new_print_info)
             self.session.commit()
         except SQLAlchemyError as e:
             self.session.rollback()
             print(f"Ошибка добавления информации о печати: {e}")
 
+    def add_print_infos(self, records):
+        # Пачка записей в сессии вызывающего кода: фиксацию и откат выполняет session_scope,
+        # ошибка передается вызывающему коду для повторной попытки
+        self.session.add_all([
+            PrintInfo(print_time=record["print_time"], clip_ref=record.get("clip_ref"),
+                      **self.history_columns(record["print_time"], record["status"], record.get("printer_id"),
+                                             record.get("outcome"), record.get("finished_at")),
+                      **self.snapshot_columns(record.get("image"), record.get("jpeg"), record.get("thumbnail")))
+            for record in records
+        ])
+        self.session.flush()
+
     def get_print_info(self, print_time_id):
-        query = text("SELECT * FROM print_info WHERE id = :id")
-        result = self.session.execute(query, {"id": print_time_id})
-        return result.fetchone()
+        return self.session.get(PrintInfo, print_time_id)
+
+    def list_print_info(self, limit: int = 100, offset: int = 0):
+        # Список без изображений: читаются только колонки с метаданными
+        query = self.session.query(PrintInfo).options(
+            load_only(PrintInfo.id, PrintInfo.print_time, PrintInfo.status, PrintInfo.image_ref)
+        )
+        return query.order_by(PrintInfo.id.desc()).limit(limit).offset(offset).all()
+
+    def list_history(self, limit: int = 50, cursor: int = None, printer_id: str = None, outcome=None,
+                     started_from: datetime = None, started_to: datetime = None):
+        # Постраничный список истории по убыванию id. cursor - id последней записи предыдущей страницы,
+        # поэтому каждая страница читается по индексу, а не через OFFSET
+        query = self.session.query(PrintInfo).options(load_only(*HISTORY_COLUMNS))
+        if cursor is not None:
+            query = query.filter(PrintInfo.id < cursor)
+        if printer_id is not None:
+            query = query.filter(PrintInfo.printer_id == printer_id)
+        if outcome is not None:
+            query = query.filter(PrintInfo.outcome == PrintOutcome(outcome))
+        if started_from is not None:
+            query = query.filter(PrintInfo.started_at >= started_from)
+        if started_to is not None:
+            query = query.filter(PrintInfo.started_at < started_to)
+        rows = query.order_by(PrintInfo.id.desc()).limit(limit + 1).all()
+        next_cursor = rows[limit - 1].id if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def get_image(self, print_time_id):
+        # Байты JPEG снимка независимо от способа хранения
+        print_info = self.get_print_info(print_time_id)
+        if print_info is None:
+            return None
+        if print_info.image_data is not None:
+            return print_info.image_data
+        if print_info.image_ref:
+            store = self.store or SnapshotStore()
+            return store.get(print_info.image_ref)
+        if print_info.image:
+            return base64.b64decode(print_info.image)
+        return None
+
+    def get_clip_ref(self, print_time_id):
+        return self.session.query(PrintInfo.clip_ref).filter(PrintInfo.id == print_time_id).scalar()
+
+    def get_thumbnail(self, print_time_id):
+        print_info = self.get_print_info(print_time_id)
+        return print_info.thumbnail if print_info is not None else None
 
     def update_print_info(self, print_time_id, status=None, image=None):
         print_info = self.get_print_info(print_time_id)
@@ -134,7 +385,8 @@ class PrintInfoRepository:
             if status:
                 print_info.status = status
             if image:
-                print_info.image = image
+                for column, value in self.snapshot_columns(image).items():
+                    setattr(print_info, column, value)
             self.session.commit()
 
     def delete_print_info(self, print_time_id):
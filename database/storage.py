@@ -0,0 +1,70 @@
+import hashlib
+import os
+
+import cv2
+import numpy as np
+
+# Способы хранения снимков печати
+STORAGE_BASE64 = "base64"  # Старый способ: base64 в текстовой колонке image
+STORAGE_BLOB = "blob"  # Байты JPEG в колонке image_data
+STORAGE_FILE = "file"  # Файл в хранилище по хешу содержимого, в строке только ссылка
+STORAGE_MODES = (STORAGE_BASE64, STORAGE_BLOB, STORAGE_FILE)
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "snapshots")
+THUMBNAIL_WIDTH = 160
+
+
+def encode_jpeg(frame, quality: int = 90) -> bytes:
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Не удалось сжать кадр в JPEG.")
+    return buffer.tobytes()
+
+
+def make_thumbnail(image, width: int = THUMBNAIL_WIDTH, quality: int = 70) -> bytes:
+    # Миниатюра из кадра или из байтов JPEG
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Не удалось декодировать изображение.")
+    scale = min(1.0, width / image.shape[1])
+    if scale < 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return encode_jpeg(image, quality)
+
+
+'''
+
+SnapshotStore - файловое хранилище снимков с адресацией по содержимому. Имя файла - sha256 байтов JPEG,
+одинаковые снимки хранятся один раз, а в базе остается только короткая ссылка.
+
+'''
+
+
+class SnapshotStore:
+    def __init__(self, root: str = SNAPSHOT_DIR):
+        self.root = root
+
+    def path(self, ref: str) -> str:
+        return os.path.join(self.root, ref[:2], f"{ref}.jpg")
+
+    def put(self, data: bytes) -> str:
+        ref = hashlib.sha256(data).hexdigest()
+        path = self.path(ref)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        with open(self.path(ref), "rb") as file:
+            return file.read()
+
+    def delete(self, ref: str):
+        try:
+            os.remove(self.path(ref))
+        except FileNotFoundError:
+            pass
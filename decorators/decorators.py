@@ -4,14 +4,31 @@ from typing import Optional, Callable
 from observer.observer import Subject
 from datetime import datetime
 from functions.errorsdetector import FindError
-import cv2
-
-
-# Базовый класс декораторов
+from functions.referencecache import ReferenceFeatureCache
+from functions.referenceset import ReferenceSet
+from functions.scheduler import AnalysisScheduler
+from functions.qualityworker import QualityWorkerPool
+from functions.preprocessing import frame_image, analysis_image
+from handlers.timelapse import TimelapseRecorder
+from monitoring.metrics import NULL_METRICS, StageMetrics
+import queue
+import time
+
+
+# Базовый класс декораторов. Время обработки кадра каждым декоратором записывается в метрики этапа stage
 class DetectorDecorator(Subject, ABC):
+    stage = "decorator"
+
     def __init__(self, detector: Subject):
         super().__init__()
         self._detector = detector
+        self.metrics: StageMetrics = NULL_METRICS
+
+    def set_metrics(self, metrics: StageMetrics):
+        # Метрики передаются по всей цепочке до базового детектора
+        self.metrics = metrics
+        if hasattr(self._detector, "set_metrics"):
+            self._detector.set_metrics(metrics)
 
     def attach(self, observer):
         self._detector.attach(observer)
@@ -22,8 +39,15 @@ class DetectorDecorator(Subject, ABC):
     def notify(self, message: str):
         self._detector.notify(message)
 
-    @abstractmethod
     def process_frame(self, frame):
+        start = time.perf_counter()
+        try:
+            return self.handle_frame(frame)
+        finally:
+            self.metrics.observe(self.stage, time.perf_counter() - start)
+
+    @abstractmethod
+    def handle_frame(self, frame):
         pass
 
 
@@ -36,6 +60,8 @@ TimerDetectorDecorator декоратор для расчета общего в
 
 
 class TimerDetectorDecorator(DetectorDecorator):
+    stage = "motion_timer"
+
     def __init__(self, detector: Subject, motion_cooldown: float = 10.0):
         super().__init__(detector)
         self.motion_start_time = None  # Время начала движения
@@ -45,7 +71,7 @@ class TimerDetectorDecorator(DetectorDecorator):
         self.motion_cooldown = motion_cooldown  # Время "охлаждения" перед завершением движения
         self.last_motion_time = None  # Время последнего обнаруженного движения
 
-    def process_frame(self, frame):
+    def handle_frame(self, frame):
         # Обработка кадра базовым детектором
         result = self._detector.process_frame(frame)
         processed_frame, motion_detected = result
@@ -59,7 +85,7 @@ class TimerDetectorDecorator(DetectorDecorator):
                 self.motion_start_time = current_time
                 print("MotionTimerDecorator: Движение началось.")
             self.last_motion_time = current_time  # Обновляем время последнего движения
-            self.last_frame = frame
+            self.last_frame = frame_image(frame)
         else:
             if self.motion_start_time is not None:
                 # Движение не обнаружено, но оно может быть временным
@@ -73,7 +99,7 @@ class TimerDetectorDecorator(DetectorDecorator):
                     if self.on_motion_end:
                         self.on_motion_end(
                             self.total_motion_time,
-                            self.last_frame if self.last_frame is not None else frame
+                            self.last_frame if self.last_frame is not None else frame_image(frame)
                         )
                         print("MotionTimerDecorator: Движение завершено.")
 
@@ -86,6 +112,27 @@ class TimerDetectorDecorator(DetectorDecorator):
         return self.total_motion_time
 
 
+"""
+
+TimelapseDecorator передает кадры печати в TimelapseRecorder для замедленной съемки. Кадр только ставится
+в очередь записи, поэтому декоратор не задерживает трансляцию и анализ.
+
+"""
+
+
+class TimelapseDecorator(DetectorDecorator):
+    stage = "timelapse"
+
+    def __init__(self, detector: Subject, recorder: TimelapseRecorder):
+        super().__init__(detector)
+        self.recorder = recorder  # Запись сегментов в отдельном потоке
+
+    def handle_frame(self, frame):
+        result = self._detector.process_frame(frame)
+        self.recorder.offer(frame_image(frame))
+        return result
+
+
 """
 
 PrintErrorDetector декоратор для регистарции ошибки печати. Производит расчет общего времени печати до ошибки,
@@ -95,39 +142,68 @@ PrintErrorDetector декоратор для регистарции ошибки
 
 
 class PrintErrorDetector(DetectorDecorator):
-    def __init__(self, detector: Subject, error_detector: FindError, quality_threshold: float = 0.01):
+    stage = "print_error"
+
+    def __init__(self, detector: Subject, error_detector: FindError, quality_threshold: float = 0.01,
+                 reference_name: str = "image2.jpg", reference_cache: Optional[ReferenceFeatureCache] = None,
+                 scheduler: Optional[AnalysisScheduler] = None, quality_pool: Optional[QualityWorkerPool] = None,
+                 reference_set: Optional[ReferenceSet] = None):
         super().__init__(detector)
         self.print_start_time = datetime.now()
         self.error_occurred = False  # Флаг ошибки
         self.last_frame = None  # Последний фрейм с фиксацией ошибки
         self.on_error_handler = None  # Обработчик для ошибок печати
+        self.on_quality_handler = None  # Обработчик нового значения коэффициента качества
         self.error_detector = error_detector  # Объект для поиска ошибок
         self.quality_threshold = quality_threshold  # Порог для определения ошибки
-
-    def process_frame(self, frame):
+        self.reference_name = reference_name  # Имя эталонного изображения в папке referenceses
+        self.reference_cache = reference_cache or ReferenceFeatureCache()  # Кеш дескрипторов эталонов
+        # Эталоны по ходу печати, по умолчанию один эталон готовой детали
+        self.reference_set = reference_set or ReferenceSet([reference_name], cache=self.reference_cache)
+        self.progress = None  # Доля выполнения печати от PrintPipeline; None - печать еще не началась
+        self.scheduler = scheduler  # Планировщик проверок качества, без него проверяется каждый кадр
+        self.quality_pool = quality_pool  # Пул процессов для расчета качества, без него расчет идет синхронно
+        self.last_quality = None  # Последний посчитанный коэффициент качества
+        # Результаты пула процессов приходят в потоке обратного вызова и применяются в потоке обработки кадров
+        self.pool_results = queue.SimpleQueue()
+
+    def set_metrics(self, metrics: StageMetrics):
+        super().set_metrics(metrics)
+        self.error_detector.metrics = metrics
+
+    def handle_frame(self, frame):
         try:
+            start = time.perf_counter()
+            self.apply_pool_results()
+
             # Обработка кадра основным детектором
             result = self._detector.process_frame(frame)
             processed_frame, motion_detected = result
 
-            self.last_frame = frame
+            self.last_frame = frame_image(frame)
 
-            # Вычисление коэффициента качества для текущего кадра
-            reference_image = self.get_reference_image()
-            quality_coefficient = self.error_detector.calculate_quality_coefficient(reference_image, frame)
+            # Проверка качества запускается по расписанию, детектор движения при этом работает на каждом кадре
+            if self.scheduler is None or self.scheduler.should_analyze(motion_detected):
+                analysis_start = time.perf_counter()
+                analysis_frame = self.scheduler.scale_frame(frame) if self.scheduler else frame
 
-            # Проверка на ошибку печати
-            if quality_coefficient <= self.quality_threshold:
-                self.error_occurred = True
-                if self.print_start_time is not None:
-                    elapsed_time = (datetime.now() - self.print_start_time).total_seconds()
+                if self.quality_pool is not None and not self.error_detector.paused:
+                    # Расчет в отдельном процессе, результат придет в on_quality_scores
+                    # В процесс передается только ближайший эталон, его дескрипторы там уже загружены
+                    self.quality_pool.submit(self.reference_set.nearest(self.get_progress(), 1)[0],
+                                             analysis_image(analysis_frame), self.on_quality_scores)
                 else:
-                    elapsed_time = 0
-
-                # Передача в хендлер для записи в базу
-                if self.on_error_handler:
-                    self.on_error_handler(elapsed_time, self.last_frame,
-                                           f"Ошибка печати.\nКоэфициент схожести = {quality_coefficient:.2f}")
+                    # Вычисление коэффициента качества для текущего кадра по ближайшим к прогрессу эталонам
+                    references = self.get_references()
+                    reference_image = references[0] if len(references) == 1 else references
+                    quality_coefficient = self.error_detector.calculate_quality_coefficient(reference_image,
+                                                                                            analysis_frame)
+                    if self.scheduler:
+                        self.scheduler.record_analysis(time.perf_counter() - analysis_start)
+                    self.check_quality(quality_coefficient)
+
+            if self.scheduler:
+                self.scheduler.record_frame(time.perf_counter() - start)
 
             return processed_frame, motion_detected
 
@@ -138,10 +214,79 @@ class PrintErrorDetector(DetectorDecorator):
                 self.on_error_handler(elapsed_time, self.last_frame, str(e))
             raise e
 
+    # Результат расчета из пула процессов. Вызывается в потоке пула, поэтому состояние детектора и конвейера
+    # не меняет, а только ставит результат в очередь
+    def on_quality_scores(self, result, latency):
+        self.pool_results.put((result, latency))
+
+    def apply_pool_results(self):
+        while True:
+            try:
+                result, latency = self.pool_results.get_nowait()
+            except queue.Empty:
+                return
+            self.apply_quality_scores(result, latency)
+            if self.error_occurred:
+                return
+
+    def apply_quality_scores(self, result, latency):
+        self.metrics.observe("quality_pool", latency)
+        if self.scheduler:
+            self.scheduler.record_analysis(latency)
+
+        if isinstance(result, Exception):
+            self.error_occurred = True
+            elapsed_time = (datetime.now() - self.print_start_time).total_seconds()
+            if self.on_error_handler:
+                self.on_error_handler(elapsed_time, self.last_frame, str(result))
+            return
+
+        quality_coefficient = self.error_detector.apply_scores(*result) if result is not None else 0.0
+        self.check_quality(quality_coefficient)
+
+    # Проверка на ошибку печати
+    def check_quality(self, quality_coefficient):
+        self.last_quality = quality_coefficient
+        if self.on_quality_handler:
+            self.on_quality_handler(quality_coefficient)
+        if quality_coefficient <= self.quality_threshold:
+            self.error_occurred = True
+            if self.print_start_time is not None:
+                elapsed_time = (datetime.now() - self.print_start_time).total_seconds()
+            else:
+                elapsed_time = 0
+
+            # Передача в хендлер для записи в базу
+            if self.on_error_handler:
+                self.on_error_handler(elapsed_time, self.last_frame,
+                                      f"Ошибка печати.\nКоэфициент схожести = {quality_coefficient:.2f}")
+
     # Хендлер обрабатывающий ошибку
     def set_error_handler(self, handler):
         self.on_error_handler = handler
 
+    def set_quality_handler(self, handler):
+        self.on_quality_handler = handler
+
+    def set_progress(self, progress: Optional[float]):
+        # Прогресс считает PrintPipeline от начала движения (или внешний источник, например номер слоя),
+        # None - движение еще не началось
+        self.progress = progress
+
+    def get_progress(self):
+        # До начала движения - начало печати: первый эталон или, без ожидаемого времени, эталон готовой детали
+        if self.progress is None:
+            return self.reference_set.progress_at(0)
+        return self.progress
+
+    # Ближайшие к прогрессу печати эталоны с заранее посчитанными дескрипторами
+    def get_references(self):
+        return self.reference_set.select(self.get_progress())
+
+    # Эталон с заранее посчитанными дескрипторами, файл читается с диска только при его изменении
+    def get_reference_features(self):
+        return self.get_references()[0]
+
     # Загрузка эталонного изображения
     def get_reference_image(self):
-        return cv2.imread("C../../referenceses/image2.jpg")
+        return self.get_reference_features().image
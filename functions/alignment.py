@@ -0,0 +1,167 @@
+import cv2
+import numpy as np
+
+MIN_HOMOGRAPHY_POINTS = 4
+# Поля состояния выравнивания одного эталона
+STATE_FIELDS = ("homography", "reference_key", "frame_shape", "size", "mask", "reference_pixels", "scale",
+                "match_ratio", "baseline", "inliers", "age")
+
+
+def gray_image(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+'''
+
+HomographyAligner запоминает положение эталона на кадре. Камера и стол принтера неподвижны, поэтому гомография
+между эталоном и кадром считается один раз по ключевым точкам (RANSAC), а эталон сразу переводится в координаты
+кадра. Дальше каждый кадр сравнивается с приведенным эталоном нормированной корреляцией пикселей внутри области
+эталона на уменьшенном изображении, без поиска ключевых точек. Корреляция не зависит от яркости и контраста
+кадра и резко падает при смещении изображения, поэтому служит и оценкой совпадения, и проверкой выравнивания.
+
+Проверка выравнивания: при расчете гомографии запоминается сходство кадра с эталоном. Если сходство следующего
+кадра падает больше чем на drift_tolerance (камеру сдвинули, стол сместился) или прошло max_age кадров,
+compare возвращает None и FindError заново выполняет полное сопоставление признаков.
+
+Состояние хранится отдельно для нескольких эталонов (max_references), поэтому переход между эталонами
+ReferenceSet по ходу печати не требует повторного расчета гомографии.
+
+'''
+
+
+class HomographyAligner:
+    def __init__(self, min_inliers: int = 12, ransac_threshold: float = 5.0, drift_tolerance: float = 0.15,
+                 max_age: int = 300, compare_width: int = 320, max_references: int = 4):
+        self.min_inliers = max(MIN_HOMOGRAPHY_POINTS, min_inliers)  # Минимум согласованных точек для гомографии
+        self.ransac_threshold = ransac_threshold  # Допустимая ошибка перепроецирования, пиксели
+        self.drift_tolerance = drift_tolerance  # Допустимое падение сходства до повторного сопоставления
+        self.max_age = max_age  # Кадров до обязательного повторного сопоставления, 0 - без ограничения
+        self.compare_width = compare_width  # Ширина изображения для сравнения пикселей
+        self.max_references = max(1, max_references)  # Сколько эталонов помнить одновременно
+        self.saved = {}  # Хеш эталона -> состояние выравнивания, кроме текущего
+        self.reset()
+        self.aligned = 0  # Успешных расчетов гомографии
+        self.failed = 0  # Расчетов без достаточного количества точек
+        self.drifts = 0  # Повторных сопоставлений из-за падения сходства
+        self.fast_frames = 0  # Кадров, сравненных без поиска ключевых точек
+
+    def reset(self):
+        self.homography = None
+        self.reference_key = None  # Хеш эталона, для которого посчитана гомография
+        self.frame_shape = None
+        self.size = None  # Размер уменьшенного кадра (ширина, высота)
+        self.mask = None  # Пиксели уменьшенного кадра, покрытые эталоном
+        self.reference_pixels = None  # Нормированные пиксели эталона внутри mask
+        self.scale = 1.0
+        self.match_ratio = 0.0  # Доля совпавших точек при расчете гомографии
+        self.baseline = None  # Сходство кадра с эталоном при расчете гомографии
+        self.inliers = 0
+        self.age = 0
+
+    @property
+    def ready(self):
+        return self.homography is not None
+
+    def switch(self, reference_key):
+        # Текущим становится состояние эталона reference_key, прежнее сохраняется
+        if reference_key == self.reference_key:
+            return
+        if self.ready:
+            self.saved[self.reference_key] = {field: getattr(self, field) for field in STATE_FIELDS}
+            while len(self.saved) >= self.max_references:
+                self.saved.pop(next(iter(self.saved)))
+        state = self.saved.pop(reference_key, None)
+        if state is None:
+            self.reset()
+        else:
+            for field, value in state.items():
+                setattr(self, field, value)
+
+    def align(self, reference_image, reference_keypoints, frame_keypoints, pairs, frame, reference_key=None):
+        # Полное сопоставление: возвращает долю совпавших точек, при удаче запоминает гомографию
+        match_ratio = len({reference_index for reference_index, _ in pairs}) / len(reference_keypoints) \
+            if reference_keypoints else 0.0
+        self.reset()
+        if len(pairs) < self.min_inliers:
+            self.failed += 1
+            return match_ratio
+
+        source = np.float32([reference_keypoints[i].pt for i, _ in pairs]).reshape(-1, 1, 2)
+        target = np.float32([frame_keypoints[j].pt for _, j in pairs]).reshape(-1, 1, 2)
+        homography, inlier_mask = cv2.findHomography(source, target, cv2.RANSAC, self.ransac_threshold)
+        inliers = int(inlier_mask.sum()) if inlier_mask is not None else 0
+        if homography is None or inliers < self.min_inliers:
+            self.failed += 1
+            return match_ratio
+
+        frame = gray_image(frame)
+        height, width = frame.shape[:2]
+        self.scale = min(1.0, self.compare_width / width) if self.compare_width else 1.0
+        size = (max(1, int(round(width * self.scale))), max(1, int(round(height * self.scale))))
+        # Гомография сразу в координаты уменьшенного кадра, эталон переводится один раз
+        scaled = np.diag([self.scale, self.scale, 1.0]) @ homography
+        reference = gray_image(reference_image)
+        warped = cv2.warpPerspective(reference, scaled, size)
+        coverage = cv2.warpPerspective(np.full(reference.shape[:2], 255, np.uint8), scaled, size)
+        # Края области убираются, на них интерполяция дает ложную разницу
+        mask = cv2.erode(coverage, np.ones((3, 3), np.uint8)) > 0
+        pixels = warped[mask].astype(np.float32)
+        if pixels.size < 2 or pixels.std() == 0:
+            self.failed += 1
+            return match_ratio
+
+        self.size = size
+        self.mask = mask
+        self.reference_pixels = (pixels - pixels.mean()) / pixels.std()
+        self.homography = homography
+        self.reference_key = reference_key
+        self.frame_shape = frame.shape[:2]
+        self.match_ratio = match_ratio
+        self.inliers = inliers
+        self.baseline = self.similarity(frame)
+        self.aligned += 1
+        return match_ratio
+
+    def similarity(self, frame):
+        # Нормированная корреляция кадра и приведенного эталона внутри области эталона, от -1 до 1
+        small = frame if self.scale == 1.0 else cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        pixels = small[self.mask].astype(np.float32)
+        deviation = pixels.std()
+        if deviation == 0:
+            return 0.0
+        return float(np.dot(pixels - pixels.mean(), self.reference_pixels) / (pixels.size * deviation))
+
+    def compare(self, frame, reference_key=None):
+        # Доля совпадения в масштабе match_ratio или None, если нужно полное сопоставление
+        self.switch(reference_key)
+        if not self.ready:
+            return None
+        frame = gray_image(frame)
+        if frame.shape[:2] != self.frame_shape:
+            return None
+        self.age += 1
+        if self.max_age and self.age > self.max_age:
+            return None
+
+        similarity = self.similarity(frame)
+        if similarity < self.baseline - self.drift_tolerance:
+            self.drifts += 1
+            return None
+
+        self.fast_frames += 1
+        if self.baseline <= 0:
+            return self.match_ratio
+        # Изменение сходства относительно момента расчета гомографии переводится в масштаб доли совпавших точек
+        return max(0.0, min(1.0, self.match_ratio * similarity / self.baseline))
+
+    def get_stats(self):
+        return {
+            "ready": self.ready,
+            "references": len(self.saved) + int(self.ready),
+            "inliers": self.inliers,
+            "age": self.age,
+            "aligned": self.aligned,
+            "failed": self.failed,
+            "drifts": self.drifts,
+            "fast_frames": self.fast_frames,
+        }
@@ -1,47 +1,109 @@
+from typing import Optional
+
 from observer.observer import Subject
+from functions.alignment import HomographyAligner
+from functions.features import FeatureEngine
+from functions.referencecache import ReferenceFeatures
+from functions.preprocessing import analysis_image
+from monitoring.metrics import NULL_METRICS
+import time
 import cv2
 import numpy as np
 
 '''
 
-Класс FindError использует SIFT алгоритм и поиск контуров для обнаружения ошибок печати
+Класс FindError использует поиск ключевых точек (по умолчанию SIFT) и поиск контуров для обнаружения ошибок печати.
+С HomographyAligner ключевые точки ищутся только при расчете гомографии, остальные кадры сравниваются с эталоном
+попиксельно
 
 '''
 
 
 class FindError(Subject):
-    def __init__(self, error_threshold=0.1):
+    def __init__(self, error_threshold=0.1, engine: Optional[FeatureEngine] = None,
+                 aligner: Optional[HomographyAligner] = None):
         super().__init__()
-        self.sift = cv2.SIFT_create()
-        self.bf = cv2.BFMatcher()
+        self.engine = engine or FeatureEngine()  # Детектор признаков и способ сопоставления, по умолчанию SIFT + BF
         self.error_threshold = error_threshold  # Порог ошибки для остановки
         self.paused = False  # Флаг приостановки обработки
+        self.kernel = np.ones((5, 5), np.uint8)  # Ядро морфологических операций
+        self.aligner = aligner  # Сравнение по сохраненной гомографии, None - сопоставление признаков на каждом кадре
+        self.metrics = NULL_METRICS  # Время этапов feature_detect, match, align_compare и error_contours
 
     def calculate_quality_coefficient(self, reference_image, printed_image):
         # Если обработка приостановлена, возвращаем нулевой коэффициент
         if self.paused:
             return 0.0
 
-        keypoints1, descriptors1 = self.sift.detectAndCompute(reference_image, None)
-        keypoints2, descriptors2 = self.sift.detectAndCompute(printed_image, None)
-
-        if descriptors1 is None or descriptors2 is None:
+        if isinstance(reference_image, (list, tuple)):
+            scores = self.best_scores(reference_image, printed_image)
+        else:
+            scores = self.compute_scores(reference_image, printed_image)
+        if scores is None:
             return 0.0
 
-        matches = self.bf.knnMatch(descriptors1, descriptors2, k=2)
+        return self.apply_scores(*scores)
+
+    # Расчет доли совпавших точек и доли ошибок без изменения коэффициента и паузы, может выполняться в другом
+    # процессе. Меняется только сохраненная гомография HomographyAligner
+    def compute_scores(self, reference_image, printed_image):
+        # Для подготовленного кадра используется уменьшенная область стола в оттенках серого
+        printed_image = analysis_image(printed_image)
+
+        match_ratio = None
+        reference_key = reference_image.digest if isinstance(reference_image, ReferenceFeatures) else None
+        if self.aligner is not None and reference_key is not None:
+            # Гомография запоминается только для эталона из кеша, у которого есть хеш
+            start = time.perf_counter()
+            match_ratio = self.aligner.compare(printed_image, reference_key)
+            self.metrics.observe("align_compare", time.perf_counter() - start)
 
-        good_matches = []
-        for m, n in matches:
-            if m and n:
-                if m.distance < 0.75 * n.distance:
-                    good_matches.append(m)
-            else:
-                raise ValueError("Недостаточно совпадений")
+        if match_ratio is None:
+            # Гомографии нет или выравнивание нарушено, полное сопоставление признаков
+            match_ratio = self.match_features(reference_image, printed_image, reference_key)
+            if match_ratio is None:
+                return None
 
-        match_ratio = len(good_matches) / len(keypoints1) if len(keypoints1) > 0 else 0
+        matched = time.perf_counter()
 
         error_ratio = self.detect_print_errors(printed_image)
+        self.metrics.observe("error_contours", time.perf_counter() - matched)
 
+        return match_ratio, error_ratio
+
+    def best_scores(self, reference_images, printed_image):
+        # Сравнение с несколькими соседними эталонами, берется лучшее совпадение
+        results = [scores for scores in (self.compute_scores(reference, printed_image)
+                                         for reference in reference_images) if scores is not None]
+        return max(results, key=lambda scores: scores[0]) if results else None
+
+    def match_features(self, reference_image, printed_image, reference_key=None):
+        # Эталон может быть передан уже с посчитанными дескрипторами
+        if isinstance(reference_image, ReferenceFeatures):
+            keypoints1, descriptors1 = reference_image.keypoints, reference_image.descriptors
+        else:
+            keypoints1, descriptors1 = self.engine.detectAndCompute(reference_image, None)
+
+        start = time.perf_counter()
+        keypoints2, descriptors2 = self.engine.detectAndCompute(printed_image, None)
+        detected = time.perf_counter()
+        self.metrics.observe("feature_detect", detected - start)
+
+        if descriptors1 is None or descriptors2 is None:
+            return None
+
+        if self.aligner is None or reference_key is None:
+            match_ratio = self.engine.match_ratio(keypoints1, descriptors1, descriptors2, reference_key)
+        else:
+            # Те же пары точек дают и долю совпадений, и гомографию для следующих кадров
+            pairs = self.engine.match_pairs(descriptors1, descriptors2, reference_key)
+            match_ratio = self.aligner.align(reference_image.image, keypoints1, keypoints2, pairs, printed_image,
+                                             reference_key)
+        self.metrics.observe("match", time.perf_counter() - detected)
+        return match_ratio
+
+    # Итоговый коэффициент качества и приостановка обработки при обнаружении ошибки
+    def apply_scores(self, match_ratio, error_ratio):
         if error_ratio < self.error_threshold:
             self.paused = True
             self.notify(f"Ошибка печати обнаружена: {error_ratio:.2f}. Обработка приостановлена.")
@@ -51,12 +113,12 @@ class FindError(Subject):
         return quality_coefficient
 
     def detect_print_errors(self, image):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        image = analysis_image(image)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
         _, binary = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
 
-        kernel = np.ones((5, 5), np.uint8)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+        binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, self.kernel)
+        binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, self.kernel)
 
         contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
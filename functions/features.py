@@ -0,0 +1,139 @@
+import cv2
+
+FEATURE_TYPES = ("sift", "orb", "akaze")
+MATCHER_TYPES = ("bf", "flann", "lsh")
+BINARY_FEATURES = ("orb", "akaze")
+
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+
+'''
+
+FeatureEngine объединяет выбранный детектор признаков (SIFT, ORB или AKAZE) и способ сопоставления дескрипторов
+(полный перебор, FLANN KD-дерево или LSH для бинарных дескрипторов). Для FLANN и LSH индекс строится один раз
+по дескрипторам эталона, а кадры ищутся в нем, поэтому сопоставление не растет квадратично от числа точек.
+
+'''
+
+
+class FeatureEngine:
+    def __init__(self, feature="sift", matcher="bf", nfeatures=0, ratio=0.75):
+        if feature not in FEATURE_TYPES:
+            raise ValueError(f"Неизвестный детектор признаков: {feature}")
+        if matcher not in MATCHER_TYPES:
+            raise ValueError(f"Неизвестный способ сопоставления: {matcher}")
+        if matcher == "flann" and feature in BINARY_FEATURES:
+            raise ValueError("FLANN KD-дерево работает только с SIFT, для бинарных дескрипторов используйте lsh.")
+        if matcher == "lsh" and feature not in BINARY_FEATURES:
+            raise ValueError("LSH работает только с бинарными дескрипторами ORB/AKAZE.")
+
+        self.feature = feature
+        self.matcher = matcher
+        self.nfeatures = nfeatures  # Ограничение количества ключевых точек, 0 - без ограничения
+        self.ratio = ratio  # Порог теста Лоу
+        # Детектор и BFMatcher создаются при первом использовании, а не при создании реестра принтеров
+        self._detector = None
+        self._bf = None
+        self._index = None  # Индекс по дескрипторам эталона
+        self._index_key = None  # Хеш эталона, для которого построен индекс
+
+    @property
+    def binary(self):
+        return self.feature in BINARY_FEATURES
+
+    @property
+    def detector(self):
+        if self._detector is None:
+            self._detector = self.create_detector()
+        return self._detector
+
+    @property
+    def bf(self):
+        if self._bf is None:
+            self._bf = cv2.BFMatcher(cv2.NORM_HAMMING if self.binary else cv2.NORM_L2)
+        return self._bf
+
+    @property
+    def signature(self):
+        # Ключ для кеша эталонов: дескрипторы зависят от детектора и ограничения точек
+        return f"{self.feature}-{self.nfeatures}"
+
+    def __repr__(self):
+        return f"<FeatureEngine(feature={self.feature}, matcher={self.matcher}, nfeatures={self.nfeatures})>"
+
+    def create_detector(self):
+        if self.feature == "sift":
+            return cv2.SIFT_create(nfeatures=self.nfeatures)
+        if self.feature == "orb":
+            return cv2.ORB_create(nfeatures=self.nfeatures or 500)
+        return cv2.AKAZE_create()
+
+    def detectAndCompute(self, image, mask=None):
+        keypoints, descriptors = self.detector.detectAndCompute(image, mask)
+        # AKAZE не умеет ограничивать количество точек, оставляем самые сильные
+        if self.nfeatures and descriptors is not None and len(keypoints) > self.nfeatures:
+            order = sorted(range(len(keypoints)), key=lambda i: keypoints[i].response, reverse=True)
+            order = order[:self.nfeatures]
+            keypoints = [keypoints[i] for i in order]
+            descriptors = descriptors[order]
+        return keypoints, descriptors
+
+    def create_matcher(self):
+        if self.matcher == "flann":
+            return cv2.FlannBasedMatcher(dict(algorithm=FLANN_INDEX_KDTREE, trees=4), dict(checks=32))
+        if self.matcher == "lsh":
+            return cv2.FlannBasedMatcher(
+                dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1),
+                dict(checks=32)
+            )
+        return self.bf
+
+    def build_index(self, reference_descriptors, key=None):
+        # Индекс строится один раз для каждого эталона
+        if self._index is not None and key is not None and key == self._index_key:
+            return self._index
+
+        index = self.create_matcher()
+        index.add([reference_descriptors])
+        index.train()
+        self._index = index
+        self._index_key = key
+        return index
+
+    def match_ratio(self, reference_keypoints, reference_descriptors, descriptors, key=None):
+        if len(reference_keypoints) == 0:
+            return 0
+
+        if self.matcher == "bf":
+            matches = self.bf.knnMatch(reference_descriptors, descriptors, k=2)
+
+            good_matches = []
+            for m, n in matches:
+                if m and n:
+                    if m.distance < self.ratio * n.distance:
+                        good_matches.append(m)
+                else:
+                    raise ValueError("Недостаточно совпадений")
+
+            return len(good_matches) / len(reference_keypoints)
+
+        # Кадр ищется в индексе эталона, учитываем каждую точку эталона один раз
+        index = self.build_index(reference_descriptors, key)
+        matched = set()
+        for pair in index.knnMatch(descriptors, k=2):
+            if len(pair) == 2 and pair[0].distance < self.ratio * pair[1].distance:
+                matched.add(pair[0].trainIdx)
+
+        return len(matched) / len(reference_keypoints)
+
+    def match_pairs(self, reference_descriptors, descriptors, key=None):
+        # Пары (индекс точки эталона, индекс точки кадра), прошедшие тест Лоу, для оценки гомографии
+        if self.matcher == "bf":
+            return [(pair[0].queryIdx, pair[0].trainIdx)
+                    for pair in self.bf.knnMatch(reference_descriptors, descriptors, k=2)
+                    if len(pair) == 2 and pair[0].distance < self.ratio * pair[1].distance]
+
+        index = self.build_index(reference_descriptors, key)
+        return [(pair[0].trainIdx, pair[0].queryIdx) for pair in index.knnMatch(descriptors, k=2)
+                if len(pair) == 2 and pair[0].distance < self.ratio * pair[1].distance]
@@ -1,6 +1,9 @@
 import cv2
 import time
 from observer.observer import Subject
+from functions.preprocessing import prepare_frame
+from functions.motionengines import create_motion_engine
+from monitoring.metrics import NULL_METRICS
 
 
 '''
@@ -11,40 +14,33 @@ from observer.observer import Subject
 
 
 class MotionDetector(Subject):
-    def __init__(self, min_area=1000, min_motion_duration=5.0, motion_cooldown=10.0):
+    def __init__(self, min_area=1000, min_motion_duration=5.0, motion_cooldown=10.0, engine="mog2"):
         super().__init__()
-        self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
+        # Способ обнаружения движения: mog2 (вычитание фона) или diff (разница со скользящим средним)
+        self.engine = create_motion_engine(engine) if isinstance(engine, str) else engine
         self.min_area = min_area  # Минимальная площадь контура для учета движения
         self.min_motion_duration = min_motion_duration  # Минимальная продолжительность движения
         self.motion_cooldown = motion_cooldown  # Время "охлаждения" перед завершением движения
         self.motion_start_time = None  # Время начала движения
         self.last_motion_time = None  # Время последнего обнаруженного движения
         self.motion_active = False  # Флаг, указывающий, активно ли движение
+        self.metrics = NULL_METRICS  # Время этапов обнаружения движения
 
-    def process_frame(self, frame):
-        # Преобразуем кадр в оттенки серого
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        # Применяем метод вычитания фона
-        fg_mask = self.bg_subtractor.apply(gray)
+    def set_metrics(self, metrics):
+        self.metrics = metrics
 
-        # Применяем морфологические операции для удаления шума
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, kernel)
-        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, kernel)
-
-        # Находим контуры
-        contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    def process_frame(self, frame):
+        # Кадр в оттенках серого и уменьшенная область стола считаются один раз на кадр
+        prepared = prepare_frame(frame)
+        frame = prepared.image
 
-        motion_detected = False
+        min_area = self.min_area * prepared.scale ** 2  # Площадь в масштабе изображения для анализа
+        motion_detected, box = self.engine.detect(prepared.analysis, min_area, self.metrics)
 
-        # Проверка наличия движения
-        for contour in contours:
-            if cv2.contourArea(contour) > self.min_area:
-                motion_detected = True
-                (x, y, w, h) = cv2.boundingRect(contour)
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                break  # Если найдено движение, прерываем цикл
+        if box is not None:
+            # Отметка рисуется на полном кадре
+            (x, y, w, h) = prepared.to_full(*box)
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
 
         current_time = time.time()
 
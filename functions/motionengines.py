@@ -0,0 +1,131 @@
+import time
+
+import cv2
+import numpy as np
+
+from monitoring.metrics import NULL_METRICS
+
+MOTION_ENGINES = ("mog2", "diff")
+DECISION_MODES = ("components", "pixels")
+
+
+'''
+
+Mog2MotionEngine - исходный способ: вычитание фона MOG2, две морфологические операции и поиск контуров.
+Отвечает на вопрос "было ли движение" и возвращает рамку первого достаточно большого контура.
+
+'''
+
+
+class Mog2MotionEngine:
+    name = "mog2"
+
+    def __init__(self, history=500, var_threshold=16):
+        self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(history=history, varThreshold=var_threshold,
+                                                                detectShadows=False)
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))  # Ядро морфологических операций
+
+    def detect(self, image, min_area, metrics=NULL_METRICS):
+        start = time.perf_counter()
+
+        # Применяем метод вычитания фона
+        fg_mask = self.bg_subtractor.apply(image)
+
+        # Применяем морфологические операции для удаления шума
+        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, self.kernel)
+        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, self.kernel)
+
+        contours_start = time.perf_counter()
+        metrics.observe("mog2", contours_start - start)
+
+        # Находим контуры
+        contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        box = None
+        for contour in contours:
+            if cv2.contourArea(contour) > min_area:
+                box = cv2.boundingRect(contour)
+                break  # Если найдено движение, прерываем цикл
+        metrics.observe("contours", time.perf_counter() - contours_start)
+        return box is not None, box
+
+
+'''
+
+FrameDiffMotionEngine - быстрый способ: разница кадра со скользящим средним предыдущих кадров на уменьшенном
+изображении. Решение о движении принимается по числу изменившихся пикселей или по площади самой большой связной
+области из connectedComponentsWithStats, без цикла Python по контурам. Скользящее среднее медленно поглощает
+неподвижные изменения (напечатанный слой), поэтому готовая модель не считается движением.
+
+'''
+
+
+class FrameDiffMotionEngine:
+    name = "diff"
+
+    def __init__(self, scale=0.5, alpha=0.05, threshold=25, decision="components", blur=5):
+        if decision not in DECISION_MODES:
+            raise ValueError(f"Неизвестный способ решения о движении: {decision}")
+        self.scale = scale  # Дополнительное уменьшение изображения для анализа
+        self.alpha = alpha  # Скорость обновления скользящего среднего
+        self.threshold = threshold  # Порог изменения яркости пикселя
+        self.decision = decision  # components - по площади области, pixels - по числу пикселей
+        self.blur = blur  # Размер размытия для подавления шума камеры, 0 - без размытия
+        self.average = None  # Скользящее среднее кадров, float32
+
+    def reset(self):
+        self.average = None
+
+    def detect(self, image, min_area, metrics=NULL_METRICS):
+        start = time.perf_counter()
+        small = image
+        if self.scale != 1.0:
+            small = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if self.blur:
+            small = cv2.GaussianBlur(small, (self.blur, self.blur), 0)
+
+        if self.average is None or self.average.shape != small.shape:
+            # Первый кадр становится фоном
+            self.average = small.astype(np.float32)
+            metrics.observe("frame_diff", time.perf_counter() - start)
+            return False, None
+
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self.average))
+        cv2.accumulateWeighted(small, self.average, self.alpha)
+        _, mask = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+
+        decision_start = time.perf_counter()
+        metrics.observe("frame_diff", decision_start - start)
+
+        min_area = min_area * self.scale ** 2  # Площадь в масштабе уменьшенного изображения
+        box = None
+        if self.decision == "pixels":
+            motion = cv2.countNonZero(mask) > min_area
+            if motion:
+                x, y, w, h = cv2.boundingRect(mask)
+                box = (x, y, w, h)
+        else:
+            count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+            motion = False
+            if count > 1:
+                # Нулевая компонента - фон, берем самую большую из остальных
+                largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+                motion = stats[largest, cv2.CC_STAT_AREA] > min_area
+                if motion:
+                    box = tuple(int(value) for value in stats[largest, :4])
+        metrics.observe("components", time.perf_counter() - decision_start)
+
+        if box is not None and self.scale != 1.0:
+            # Рамка в масштабе изображения для анализа
+            box = tuple(int(round(value / self.scale)) for value in box)
+        return motion, box
+
+
+def create_motion_engine(name="mog2", **kwargs):
+    if name == "mog2":
+        return Mog2MotionEngine(**kwargs)
+    if name == "diff":
+        return FrameDiffMotionEngine(**kwargs)
+    raise ValueError(f"Неизвестный способ обнаружения движения: {name}")
@@ -0,0 +1,88 @@
+import cv2
+
+'''
+
+PreparedFrame - результат предобработки кадра, общий для всех детекторов: исходный кадр для отрисовки, кадр
+в оттенках серого, уменьшенное изображение области стола принтера для анализа и данные для перевода координат
+обратно в полный кадр.
+
+'''
+
+
+class PreparedFrame:
+    def __init__(self, image, gray, analysis, scale=1.0, roi=None):
+        self.image = image  # Исходный кадр в полном разрешении, на нем рисуются отметки
+        self.gray = gray  # Кадр в оттенках серого в полном разрешении
+        self.analysis = analysis  # Уменьшенная область стола в оттенках серого
+        self.scale = scale  # Масштаб analysis относительно полного кадра
+        self.roi = roi or (0, 0, image.shape[1], image.shape[0])  # Область стола (x, y, w, h) в полном кадре
+
+    def to_full(self, x, y, w, h):
+        # Перевод прямоугольника из координат analysis в координаты полного кадра
+        roi_x, roi_y = self.roi[0], self.roi[1]
+        return (int(roi_x + x / self.scale), int(roi_y + y / self.scale),
+                int(round(w / self.scale)), int(round(h / self.scale)))
+
+    def downscaled(self, factor):
+        # Дополнительное уменьшение изображения для анализа при перегрузке
+        if factor >= 1.0:
+            return self
+        analysis = cv2.resize(self.analysis, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+        return PreparedFrame(self.image, self.gray, analysis, self.scale * factor, self.roi)
+
+
+'''
+
+FramePreprocessor выполняет предобработку один раз на кадр: перевод в оттенки серого, обрезку по области стола
+и уменьшение до ширины analysis_width. Без настроек анализ идет по всему кадру в исходном разрешении.
+
+'''
+
+
+class FramePreprocessor:
+    def __init__(self, analysis_width: int = None, roi: tuple = None):
+        self.analysis_width = analysis_width  # Ширина изображения для анализа, None - без уменьшения
+        self.roi = roi  # Область стола принтера (x, y, w, h), None - весь кадр
+
+    @property
+    def signature(self):
+        # Часть ключа кеша эталонов: дескрипторы зависят от области стола и масштаба
+        roi = "x".join(str(value) for value in self.roi) if self.roi else "full"
+        return f"w{self.analysis_width or 0}-roi{roi}"
+
+    def prepare(self, frame) -> PreparedFrame:
+        if isinstance(frame, PreparedFrame):
+            return frame
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+        height, width = gray.shape[:2]
+        x, y, w, h = self.roi or (0, 0, width, height)
+        x, y = max(0, min(x, width - 1)), max(0, min(y, height - 1))
+        w, h = max(1, min(w, width - x)), max(1, min(h, height - y))
+        analysis = gray[y:y + h, x:x + w]
+
+        scale = 1.0
+        if self.analysis_width and w > self.analysis_width:
+            scale = self.analysis_width / w
+            analysis = cv2.resize(analysis, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        return PreparedFrame(frame, gray, analysis, scale, (x, y, w, h))
+
+
+# Предобработка по умолчанию для детекторов, которым передали обычный кадр
+default_preprocessor = FramePreprocessor()
+
+
+def prepare_frame(frame) -> PreparedFrame:
+    return default_preprocessor.prepare(frame)
+
+
+def frame_image(frame):
+    # Исходный кадр в полном разрешении
+    return frame.image if isinstance(frame, PreparedFrame) else frame
+
+
+def analysis_image(frame):
+    # Изображение для анализа: уменьшенная область стола или переданный кадр без изменений
+    return frame.analysis if isinstance(frame, PreparedFrame) else frame
@@ -0,0 +1,127 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from functions.alignment import HomographyAligner
+from functions.errorsdetector import FindError
+from functions.features import FeatureEngine
+from functions.preprocessing import FramePreprocessor
+from functions.referencecache import REFERENCE_DIR, ReferenceFeatureCache
+
+# Состояние процесса-обработчика, создается один раз при его запуске
+_worker_detector = None
+_worker_cache = None
+
+
+def _init_worker(engine_settings, reference_dir, reference_names, alignment_settings=None, preprocess_settings=None):
+    global _worker_detector, _worker_cache
+    # Гомография хранится в процессе-обработчике и используется всеми его задачами
+    aligner = HomographyAligner(**alignment_settings) if alignment_settings is not None else None
+    _worker_detector = FindError(engine=FeatureEngine(**engine_settings), aligner=aligner)
+    _worker_cache = ReferenceFeatureCache(reference_dir, engine=FeatureEngine(**engine_settings),
+                                          preprocessor=FramePreprocessor(**(preprocess_settings or {})))
+    # Дескрипторы эталонов загружаются при старте процесса, а не в каждой задаче
+    for name in reference_names:
+        _worker_cache.get(name)
+
+
+def _ping():
+    return True
+
+
+def _compute_scores(reference_name, frame):
+    return _worker_detector.compute_scores(_worker_cache.get(reference_name), frame)
+
+
+'''
+
+QualityWorkerPool выполняет расчет качества печати в отдельных процессах. Кадры передаются через ограниченную
+очередь: если все процессы заняты, в очереди остаются только самые свежие кадры, а устаревшие отбрасываются.
+Результат возвращается асинхронно через callback, поэтому видеопоток не ждет окончания сопоставления.
+
+'''
+
+
+class QualityWorkerPool:
+    def __init__(self, engine_settings: dict = None, reference_names=("image2.jpg",), reference_dir=REFERENCE_DIR,
+                 workers: int = 1, max_pending: int = 1, alignment_settings: dict = None,
+                 preprocess_settings: dict = None):
+        self.workers = max(1, workers)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(engine_settings or {}, reference_dir, tuple(reference_names), alignment_settings,
+                      preprocess_settings)
+        )
+        self.pending = deque(maxlen=max(1, max_pending))  # Кадры, ожидающие свободного процесса
+        self.in_flight = 0
+        self.lock = threading.RLock()
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_latency = None
+
+    def start(self):
+        # Запуск процессов заранее, чтобы эталоны загрузились до первого кадра
+        for future in [self.executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+        return self
+
+    def submit(self, reference_name, frame, callback) -> bool:
+        # Возвращает False, если кадр поставлен в очередь ожидания вместо немедленной отправки
+        with self.lock:
+            self.submitted += 1
+            if self.in_flight < self.workers:
+                self._dispatch(reference_name, frame, callback)
+                return True
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append((reference_name, frame, callback))
+            return False
+
+    def _dispatch(self, reference_name, frame, callback):
+        self.in_flight += 1
+        started = time.perf_counter()
+        future = self.executor.submit(_compute_scores, reference_name, frame)
+        future.add_done_callback(lambda done: self._on_done(done, callback, started))
+
+    def _on_done(self, future, callback, started):
+        latency = time.perf_counter() - started
+        with self.lock:
+            self.in_flight -= 1
+            self.last_latency = latency
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+            if self.pending:
+                try:
+                    self._dispatch(*self.pending.popleft())
+                except RuntimeError:
+                    # Пул уже остановлен
+                    self.pending.clear()
+
+        if not future.cancelled():
+            callback(future.exception() or future.result(), latency)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "pending": len(self.pending),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "last_latency_ms": round(self.last_latency * 1000, 2) if self.last_latency else None,
+            }
+
+    def shutdown(self, wait: bool = True):
+        with self.lock:
+            self.pending.clear()
+        self.executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from functions.preprocessing import FramePreprocessor, default_preprocessor
+
+# Папка с эталонными изображениями
+REFERENCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "referenceses")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+'''
+
+ReferenceFeatures хранит эталонное изображение вместе с заранее посчитанными ключевыми точками и дескрипторами
+
+'''
+
+
+class ReferenceFeatures:
+    def __init__(self, name, digest, image, keypoints, descriptors):
+        self.name = name  # Имя файла эталона
+        self.digest = digest  # sha256 содержимого файла
+        self.image = image
+        self.keypoints = keypoints
+        self.descriptors = descriptors
+
+    def __repr__(self):
+        return f"<ReferenceFeatures(name={self.name}, keypoints={len(self.keypoints)})>"
+
+
+def keypoints_to_array(keypoints):
+    return np.array([(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id)
+                     for kp in keypoints], dtype=np.float64).reshape(-1, 7)
+
+
+def array_to_keypoints(array):
+    return [cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave), int(class_id))
+            for x, y, size, angle, response, octave, class_id in array]
+
+
+'''
+
+ReferenceFeatureCache загружает эталоны из папки referenceses один раз, считает для них дескрипторы и держит их
+в памяти. Результат сохраняется на диск под ключом из хеша содержимого файла, поэтому после перезапуска расчет
+не повторяется. При изменении файла эталона кеш автоматически пересчитывается.
+
+Эталон проходит ту же предобработку FramePreprocessor, что и кадры камеры (область стола, масштаб, оттенки
+серого), поэтому коэффициент качества не зависит от разрешения камеры и настроек analysis_width и roi.
+
+'''
+
+
+class ReferenceFeatureCache:
+    def __init__(self, reference_dir=REFERENCE_DIR, cache_dir=None, feature_factory=None, signature="sift",
+                 engine=None, preprocessor: FramePreprocessor = None):
+        self.reference_dir = reference_dir
+        self.cache_dir = cache_dir or os.path.join(reference_dir, ".cache")
+        if engine is not None:
+            # Дескрипторы эталона считаются тем же FeatureEngine, что и для кадров
+            feature_factory = lambda: engine
+            signature = engine.signature
+        self.feature_factory = feature_factory or cv2.SIFT_create  # Создание детектора признаков
+        self.signature = signature  # Часть ключа кеша, зависящая от настроек детектора
+        self.preprocessor = preprocessor or default_preprocessor  # Предобработка эталона, как у кадров
+        self._detector = None
+        self._entries = {}  # путь -> (mtime, размер, ReferenceFeatures)
+        self._lock = threading.Lock()
+
+    def resolve(self, name):
+        return name if os.path.isabs(name) else os.path.join(self.reference_dir, name)
+
+    def get(self, name) -> ReferenceFeatures:
+        path = self.resolve(name)
+        stat = os.stat(path)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                return entry[2]
+
+            with open(path, "rb") as file:
+                data = file.read()
+            digest = hashlib.sha256(data).hexdigest()
+
+            if entry and entry[2].digest == digest:
+                features = entry[2]
+            else:
+                features = self._load_or_compute(os.path.basename(path), digest, data)
+
+            self._entries[path] = (stat.st_mtime_ns, stat.st_size, features)
+            return features
+
+    def load_all(self):
+        # Предварительная загрузка всех эталонов из папки
+        if not os.path.isdir(self.reference_dir):
+            return []
+        names = sorted(name for name in os.listdir(self.reference_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+        return [self.get(name) for name in names]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cache_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}-{self.signature}-{self.preprocessor.signature}.npz")
+
+    def _load_or_compute(self, name, digest, data):
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Не удалось загрузить эталонное изображение {name}.")
+        # Ключевые точки и изображение для выравнивания в координатах подготовленного кадра
+        image = self.preprocessor.prepare(image).analysis
+
+        cache_path = self.cache_path(digest)
+        if os.path.exists(cache_path):
+            try:
+                with np.load(cache_path) as cached:
+                    descriptors = cached["descriptors"] if cached["descriptors"].size else None
+                    return ReferenceFeatures(name, digest, image, array_to_keypoints(cached["keypoints"]),
+                                             descriptors)
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Поврежденный кеш эталона {name}, пересчет: {e}")
+
+        if self._detector is None:
+            self._detector = self.feature_factory()
+        keypoints, descriptors = self._detector.detectAndCompute(image, None)
+        self._save(cache_path, keypoints, descriptors)
+        return ReferenceFeatures(name, digest, image, list(keypoints), descriptors)
+
+    def _save(self, cache_path, keypoints, descriptors):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = cache_path + ".tmp.npz"
+            np.savez(tmp_path, keypoints=keypoints_to_array(keypoints),
+                     descriptors=descriptors if descriptors is not None else np.empty((0,), np.float32))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Не удалось сохранить кеш эталона: {e}")
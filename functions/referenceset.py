@@ -0,0 +1,64 @@
+import bisect
+from typing import List, Optional
+
+from functions.referencecache import ReferenceFeatureCache, ReferenceFeatures
+
+
+def default_progress(count: int) -> List[float]:
+    # Эталоны равномерно по ходу печати, последний - готовая деталь
+    return [(index + 1) / count for index in range(count)]
+
+
+'''
+
+ReferenceSet - последовательность эталонов одной печати: каждому изображению соответствует доля выполнения
+печати от 0 до 1 (например, слой или доля времени). Точки прогресса отсортированы, поэтому нужный эталон
+находится двоичным поиском по текущему прогрессу, а сравнивается кадр только с одним или двумя ближайшими
+эталонами. Стоимость проверки кадра не зависит от количества эталонов.
+
+Дескрипторы всех эталонов считаются заранее через ReferenceFeatureCache (preload).
+
+'''
+
+
+class ReferenceSet:
+    def __init__(self, names: List[str], progress: Optional[List[float]] = None,
+                 cache: Optional[ReferenceFeatureCache] = None, neighbors: int = 1,
+                 expected_duration: Optional[float] = None):
+        if not names:
+            raise ValueError("Нужен хотя бы один эталон.")
+        progress = list(progress) if progress is not None else default_progress(len(names))
+        if len(progress) != len(names):
+            raise ValueError("Количество точек прогресса должно совпадать с количеством эталонов.")
+        if any(later <= earlier for earlier, later in zip(progress, progress[1:])):
+            raise ValueError("Точки прогресса эталонов должны возрастать.")
+
+        self.names = list(names)
+        self.progress = progress  # Доля выполнения печати для каждого эталона
+        self.cache = cache or ReferenceFeatureCache()
+        self.neighbors = max(1, neighbors)  # Количество ближайших эталонов для сравнения
+        self.expected_duration = expected_duration  # Ожидаемое время печати, секунды
+
+    def __len__(self):
+        return len(self.names)
+
+    def preload(self):
+        # Дескрипторы всех эталонов считаются до начала печати
+        return [self.cache.get(name) for name in self.names]
+
+    def progress_at(self, elapsed_time: float) -> float:
+        # Без ожидаемого времени печати прогресс неизвестен, используется эталон готовой детали
+        if not self.expected_duration:
+            return 1.0
+        return min(1.0, max(0.0, elapsed_time / self.expected_duration))
+
+    def nearest(self, progress: float, count: int = None) -> List[str]:
+        # Имена ближайших к прогрессу эталонов, сначала самый близкий
+        count = count or self.neighbors
+        index = bisect.bisect_left(self.progress, progress)
+        candidates = [i for i in (index - 1, index) if 0 <= i < len(self.names)]
+        candidates.sort(key=lambda i: abs(self.progress[i] - progress))
+        return [self.names[i] for i in candidates[:count]]
+
+    def select(self, progress: float, count: int = None) -> List[ReferenceFeatures]:
+        return [self.cache.get(name) for name in self.nearest(progress, count)]
@@ -0,0 +1,118 @@
+import math
+import time
+
+import cv2
+
+from functions.preprocessing import PreparedFrame
+
+'''
+
+AnalysisScheduler решает, на каких кадрах запускать проверку качества печати. Детектор движения работает на каждом
+кадре, а проверка - раз в N кадров, раз в T секунд или при начале/окончании движения.
+
+Если среднее время обработки кадра превышает бюджет, планировщик сначала реже запускает проверку, а когда частота
+уже минимальна - уменьшает разрешение кадра для анализа. При снижении нагрузки настройки возвращаются обратно.
+
+'''
+
+
+class AnalysisScheduler:
+    def __init__(self, every_n_frames: int = 10, every_seconds: float = None, on_motion_change: bool = True,
+                 frame_budget: float = 0.1, max_load_factor: float = 8.0, min_scale: float = 0.25,
+                 smoothing: float = 0.1):
+        self.every_n_frames = max(1, every_n_frames)  # Базовая частота проверки в кадрах
+        self.every_seconds = every_seconds  # Базовая частота проверки в секундах
+        self.on_motion_change = on_motion_change  # Проверять ли при смене состояния движения
+        self.frame_budget = frame_budget  # Допустимое среднее время обработки кадра, секунды
+        self.max_load_factor = max_load_factor  # Максимальное замедление частоты проверки
+        self.min_scale = min_scale  # Минимальный масштаб кадра для анализа
+        self.smoothing = smoothing  # Коэффициент экспоненциального сглаживания времени
+
+        self.load_factor = 1.0  # Во сколько раз реже запускается проверка из-за нагрузки
+        self.scale = 1.0  # Масштаб кадра для анализа
+        self.frames_since_analysis = 0
+        self.frames_since_adjust = 0  # Настройки меняются не чаще одного раза за цикл проверки
+        self.last_analysis_time = None
+        self.last_motion = None
+        self.avg_frame_time = 0.0
+        self.avg_analysis_time = 0.0
+        self.frames_total = 0
+        self.analyses_total = 0
+        self.started_at = time.time()
+
+    @property
+    def effective_interval(self):
+        return max(1, math.ceil(self.every_n_frames * self.load_factor))
+
+    @property
+    def effective_seconds(self):
+        return self.every_seconds * self.load_factor if self.every_seconds else None
+
+    def should_analyze(self, motion_detected: bool, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        self.frames_since_analysis += 1
+
+        motion_changed = self.last_motion is not None and motion_detected != self.last_motion
+        self.last_motion = motion_detected
+
+        due = (
+            self.last_analysis_time is None
+            or self.frames_since_analysis >= self.effective_interval
+            or (self.effective_seconds is not None and now - self.last_analysis_time >= self.effective_seconds)
+            or (self.on_motion_change and motion_changed)
+        )
+
+        if due:
+            self.frames_since_analysis = 0
+            self.last_analysis_time = now
+            self.analyses_total += 1
+        return due
+
+    def scale_frame(self, frame):
+        # Уменьшение кадра для анализа при перегрузке
+        if self.scale >= 1.0:
+            return frame
+        if isinstance(frame, PreparedFrame):
+            return frame.downscaled(self.scale)
+        return cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+
+    def record_analysis(self, elapsed: float):
+        self.avg_analysis_time = self._smooth(self.avg_analysis_time, elapsed)
+
+    def record_frame(self, elapsed: float):
+        self.frames_total += 1
+        self.frames_since_adjust += 1
+        self.avg_frame_time = self._smooth(self.avg_frame_time, elapsed)
+
+        if self.frames_since_adjust < self.effective_interval:
+            return
+        self.frames_since_adjust = 0
+
+        if self.avg_frame_time > self.frame_budget:
+            # Сброс нагрузки: сначала реже проверяем, затем уменьшаем разрешение
+            if self.load_factor < self.max_load_factor:
+                self.load_factor = min(self.max_load_factor, self.load_factor * 1.5)
+            elif self.scale > self.min_scale:
+                self.scale = max(self.min_scale, self.scale * 0.75)
+        elif self.avg_frame_time < self.frame_budget * 0.5:
+            # Нагрузка спала: сначала возвращаем разрешение, затем частоту
+            if self.scale < 1.0:
+                self.scale = min(1.0, self.scale / 0.75)
+            elif self.load_factor > 1.0:
+                self.load_factor = max(1.0, self.load_factor / 1.5)
+
+    def _smooth(self, average, value):
+        return value if average == 0 else average + self.smoothing * (value - average)
+
+    def get_stats(self):
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            "effective_interval_frames": self.effective_interval,
+            "effective_interval_seconds": self.effective_seconds,
+            "analysis_scale": round(self.scale, 3),
+            "load_factor": round(self.load_factor, 3),
+            "frame_fps": round(self.frames_total / elapsed, 2),
+            "analysis_fps": round(self.analyses_total / elapsed, 2),
+            "avg_frame_ms": round(self.avg_frame_time * 1000, 2),
+            "avg_analysis_ms": round(self.avg_analysis_time * 1000, 2),
+        }
@@ -0,0 +1,194 @@
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from pipeline.broadcast import encode_jpeg
+
+CLIP_DIR = os.environ.get("CLIP_DIR",
+                          os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "clips"))
+CLIP_EXTENSION = ".avi"
+CLIP_REF_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def new_clip_ref(printer_id: str = None) -> str:
+    # Имя ролика выбирается до записи, поэтому строку в базе можно записать, не дожидаясь ролика
+    return f"{printer_id or 'default'}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def clip_path(clip_ref: str, root: str = CLIP_DIR) -> str:
+    if not CLIP_REF_PATTERN.match(clip_ref):
+        raise ValueError(f"Некорректное имя ролика: {clip_ref}")
+    return os.path.join(root, f"{clip_ref}{CLIP_EXTENSION}")
+
+
+'''
+
+FrameRingBuffer хранит кадры последних seconds секунд перед ошибкой печати. Кадры уменьшаются до width и
+хранятся в памяти в виде JPEG, не чаще fps раз в секунду. Общий размер ограничен max_bytes: при превышении
+отбрасываются самые старые кадры, поэтому память буфера не зависит от разрешения камеры и длительности печати.
+
+'''
+
+
+class FrameRingBuffer:
+    def __init__(self, seconds: float = 10.0, fps: float = 5.0, width: int = 480, quality: int = 70,
+                 max_bytes: int = 8 * 1024 * 1024):
+        self.seconds = seconds  # Сколько секунд до ошибки хранить
+        self.interval = 1.0 / fps if fps else 0.0  # Минимальный интервал между кадрами буфера
+        self.fps = fps
+        self.width = width  # Ширина кадров буфера
+        self.quality = quality  # Качество JPEG
+        self.max_bytes = max_bytes  # Жесткое ограничение памяти буфера
+        self.frames = deque()  # (время, JPEG)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.added = 0
+        self.evicted = 0
+
+    def due(self, now: float) -> bool:
+        # Кадры чаще fps не кодируются вовсе
+        return not self.frames or now - self.frames[-1][0] >= self.interval
+
+    def add(self, frame, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        if not self.due(now):
+            return False
+        data = encode_jpeg(frame, self.width, self.quality)
+        with self.lock:
+            self.frames.append((now, data))
+            self.bytes += len(data)
+            self.added += 1
+            self._evict(now)
+        return True
+
+    def _evict(self, now: float):
+        while self.frames and (now - self.frames[0][0] > self.seconds or self.bytes > self.max_bytes):
+            _, data = self.frames.popleft()
+            self.bytes -= len(data)
+            self.evicted += 1
+
+    def snapshot(self) -> List[Tuple[float, bytes]]:
+        # Копия содержимого буфера, кадры дальше добавляются без влияния на выгрузку
+        with self.lock:
+            return list(self.frames)
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.bytes = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "frames": len(self.frames),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "added": self.added,
+                "evicted": self.evicted,
+            }
+
+
+'''
+
+ClipExporter записывает содержимое буфера в ролик Motion JPEG (.avi) в фоновом потоке, чтобы обработка кадров
+не ждала записи на диск. Ролик пишется во временный файл и переименовывается после завершения, поэтому по
+адресу /history/{id}/clip никогда не отдается недописанный файл.
+
+'''
+
+
+class ClipExporter:
+    def __init__(self, root: str = CLIP_DIR, max_queue: int = 4):
+        self.root = root
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread: Optional[threading.Thread] = None
+        self.exported = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="clip-exporter", daemon=True)
+            self.thread.start()
+        return self
+
+    def submit(self, clip_ref: str, frames: List[Tuple[float, bytes]], fps: float) -> bool:
+        if not frames:
+            return False
+        self.start()
+        try:
+            self.queue.put_nowait((clip_ref, frames, fps))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f"ClipExporter: очередь переполнена, ролик {clip_ref} не записан")
+            return False
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    break
+                self.export(*task)
+            finally:
+                self.queue.task_done()
+
+    def export(self, clip_ref: str, frames: List[Tuple[float, bytes]], fps: float) -> Optional[str]:
+        path = clip_path(clip_ref, self.root)
+        tmp_path = f"{path[:-len(CLIP_EXTENSION)]}.tmp{CLIP_EXTENSION}"
+        writer = None
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            for _, data in frames:
+                image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                if image is None:
+                    continue
+                if writer is None:
+                    height, width = image.shape[:2]
+                    writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*"MJPG"), fps or 5.0, (width, height))
+                    if not writer.isOpened():
+                        raise OSError(f"Не удалось открыть {tmp_path} для записи")
+                writer.write(image)
+            if writer is None:
+                raise ValueError("Нет кадров для ролика")
+            writer.release()
+            writer = None
+            os.replace(tmp_path, path)
+            self.exported += 1
+            print(f"ClipExporter: ролик ошибки печати записан в {path}")
+            return path
+        except (OSError, ValueError, cv2.error) as e:
+            self.failed += 1
+            print(f"ClipExporter: ошибка записи ролика {clip_ref}: {e}")
+            return None
+        finally:
+            if writer is not None:
+                writer.release()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def flush(self):
+        self.queue.join()
+
+    def shutdown(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=30)
+            self.thread = None
+
+    def get_stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "exported": self.exported,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
@@ -1,59 +1,32 @@
-import cv2
-import base64
+from validation.all_classes import PrintOutcome
 
 
-def handle_motion_end(total_motion_time, last_frame, print_repo):
+def handle_motion_end(total_motion_time, last_frame, print_sink, printer_id=None):
 
     """
-    Синхронная обработка конца печати и запись данных в базу.
+    Обработка конца печати и запись данных в базу через print_sink (PersistenceWriter или RepositorySink).
     """
 
     if last_frame is None:
         print("Ошибка: last_frame пустой или None.")
         return
 
-    try:
-        _, buffer = cv2.imencode('.jpg', last_frame)
-        binary_frame = base64.b64encode(buffer).decode('utf-8')
-    except cv2.error as e:
-        print(f"Ошибка при кодировании кадра: {e}")
-        return
-
-    try:
-        print_repo.add_print_info(
-            print_time=total_motion_time,
-            status="Модель напечатана без ошибок",
-            image=binary_frame
-        )
-        print("Данные о печати записаны в базу.")
-    except Exception as e:
-        print(f"Ошибка записи данных в базу: {e}")
+    print_sink.submit(total_motion_time, "Модель напечатана без ошибок", last_frame, printer_id,
+                      PrintOutcome.SUCCESS.value)
 
 
-def handle_print_error(elapsed_time, last_frame, error_message, print_info_repo):
+def handle_print_error(elapsed_time, last_frame, error_message, print_sink, printer_id=None, clip_ref=None):
 
     """
-    Синхронная обработка ошибки печати и запись данных в базу.
+    Обработка ошибки печати и запись данных в базу через print_sink (PersistenceWriter или RepositorySink).
+    clip_ref - имя ролика последних секунд перед ошибкой, ролик записывается отдельно.
     """
 
     if last_frame is None:
         print("Ошибка: last_frame пустой или None.")
         return
 
-    try:
-        # Конвертируем последний кадр в бинарный вид
-        _, buffer = cv2.imencode('.jpg', last_frame)
-        binary_frame = base64.b64encode(buffer).decode('utf-8')
-    except cv2.error as e:
-        print(f"Ошибка при кодировании кадра: {e}")
-        return
-
     # Формируем статус с сообщением об ошибке
     status = f"Ошибка печати: {error_message}"
 
-    try:
-        # Запись данных в базу синхронно
-        print_info_repo.add_print_info(print_time=elapsed_time, status=status, image=binary_frame)
-        print(f"Данные об ошибке печати записаны в базу. Время: {elapsed_time:.2f} секунд")
-    except Exception as e:
-        print(f"Ошибка записи данных об ошибке печати в базу: {e}")
+    print_sink.submit(elapsed_time, status, last_frame, printer_id, PrintOutcome.ERROR.value, clip_ref)
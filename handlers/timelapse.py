@@ -0,0 +1,223 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import Optional
+
+import cv2
+
+TIMELAPSE_DIR = os.environ.get("TIMELAPSE_DIR",
+                               os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "timelapse"))
+SEGMENT_EXTENSION = ".avi"
+INDEX_NAME = "index.json"
+
+
+'''
+
+TimelapseRecorder записывает замедленную съемку каждой печати. Цикл обработки кадров только передает кадр
+в ограниченную очередь не чаще раза в interval секунд (offer не ждет: при заполненной очереди кадр
+отбрасывается), а уменьшение, кодирование и запись на диск выполняются в отдельном потоке.
+
+Запись идет сегментами по segment_frames кадров: каждая печать (job) - отдельная папка с файлами сегментов
+и index.json со списком сегментов, временем и размером. Общий размер папки ограничен max_bytes: после закрытия
+сегмента самые старые сегменты удаляются, пока размер не станет меньше бюджета. Открытый сегмент не удаляется.
+
+'''
+
+
+class TimelapseRecorder:
+    def __init__(self, root: str = TIMELAPSE_DIR, interval: float = 5.0, fps: float = 25.0,
+                 segment_frames: int = 1500, width: Optional[int] = 1280, max_bytes: int = 2 * 1024 ** 3,
+                 queue_size: int = 8):
+        self.root = root
+        self.interval = interval  # Секунд реального времени между кадрами замедленной съемки
+        self.fps = fps  # Частота кадров при воспроизведении
+        self.segment_frames = segment_frames  # Кадров в одном сегменте
+        self.width = width  # Ширина кадров записи, None - как у камеры
+        self.max_bytes = max_bytes  # Бюджет на диске для всех записей принтера
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.job_id = None  # Текущая печать, кадры вне печати не записываются
+        self.last_offer = None
+
+        # Состояние потока записи
+        self.writer = None
+        self.writer_job = None
+        self.segment = None  # Описание открытого сегмента для index.json
+        self.frame_size = None
+
+        self.offered = 0
+        self.dropped = 0
+        self.written = 0
+        self.segments = 0
+        self.evicted = 0
+        self.failed = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="timelapse-recorder", daemon=True)
+                self.thread.start()
+        return self
+
+    def start_job(self, job_id: str):
+        self.start()
+        self.job_id = job_id
+        self.last_offer = None
+
+    def end_job(self):
+        # Открытый сегмент закрывается в потоке записи, после кадров, уже стоящих в очереди.
+        # Признак конца печати не отбрасывается: при заполненной очереди ждем, пока поток записи освободит место
+        if self.job_id is not None:
+            self.job_id = None
+            self.queue.put(("end", None, None))
+
+    def offer(self, frame, now: float = None) -> bool:
+        # Вызывается на каждом кадре, поэтому без ожидания и без копирования кадров, которые не записываются
+        job_id = self.job_id
+        if job_id is None:
+            return False
+        now = time.time() if now is None else now
+        if self.last_offer is not None and now - self.last_offer < self.interval:
+            return False
+        self.last_offer = now
+        self.offered += 1
+        return self._put(("frame", job_id, (frame, now)))
+
+    def _put(self, item) -> bool:
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            kind, job_id, payload = self.queue.get()
+            try:
+                if kind == "stop":
+                    self._close_segment()
+                    break
+                if kind == "end":
+                    self._close_segment()
+                else:
+                    self._write(job_id, *payload)
+            except (OSError, ValueError, cv2.error) as e:
+                self.failed += 1
+                print(f"TimelapseRecorder: ошибка записи: {e}")
+            finally:
+                self.queue.task_done()
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.root, job_id)
+
+    def _write(self, job_id, frame, timestamp):
+        if self.width and frame.shape[1] > self.width:
+            scale = self.width / frame.shape[1]
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        size = (frame.shape[1], frame.shape[0])
+        if (self.writer is None or job_id != self.writer_job or size != self.frame_size
+                or self.segment["frames"] >= self.segment_frames):
+            self._close_segment()
+            self._open_segment(job_id, size, timestamp)
+        self.writer.write(frame)
+        self.segment["frames"] += 1
+        self.segment["ended_at"] = timestamp
+        self.written += 1
+
+    def _open_segment(self, job_id, size, timestamp):
+        directory = self.job_dir(job_id)
+        os.makedirs(directory, exist_ok=True)
+        index = self.read_index(job_id)
+        name = f"segment-{len(index['segments']) + index.get('evicted', 0) + 1:04d}{SEGMENT_EXTENSION}"
+        writer = cv2.VideoWriter(os.path.join(directory, name), cv2.VideoWriter_fourcc(*"MJPG"), self.fps, size)
+        if not writer.isOpened():
+            raise OSError(f"Не удалось открыть сегмент {name} для записи")
+        self.writer, self.writer_job, self.frame_size = writer, job_id, size
+        self.segment = {"file": name, "started_at": timestamp, "ended_at": timestamp, "frames": 0, "bytes": 0}
+
+    def _close_segment(self):
+        if self.writer is None:
+            return
+        self.writer.release()
+        job_id, segment = self.writer_job, self.segment
+        self.writer, self.writer_job, self.segment = None, None, None
+        path = os.path.join(self.job_dir(job_id), segment["file"])
+        segment["bytes"] = os.path.getsize(path) if os.path.exists(path) else 0
+        index = self.read_index(job_id)
+        index["segments"].append(segment)
+        self.write_index(job_id, index)
+        self.segments += 1
+        self.enforce_budget()
+
+    def read_index(self, job_id: str) -> dict:
+        path = os.path.join(self.job_dir(job_id), INDEX_NAME)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                return json.load(file)
+        return {"job_id": job_id, "segments": [], "evicted": 0}
+
+    def write_index(self, job_id: str, index: dict):
+        path = os.path.join(self.job_dir(job_id), INDEX_NAME)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(index, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def list_jobs(self):
+        # Индексы всех записанных печатей, от старых к новым
+        if not os.path.isdir(self.root):
+            return []
+        jobs = [self.read_index(name) for name in os.listdir(self.root)
+                if os.path.exists(os.path.join(self.job_dir(name), INDEX_NAME))]
+        return sorted(jobs, key=lambda job: job["segments"][0]["started_at"] if job["segments"] else 0)
+
+    def enforce_budget(self):
+        # Удаление самых старых закрытых сегментов, пока записи не помещаются в max_bytes
+        segments = [(segment["started_at"], job["job_id"], segment) for job in self.list_jobs()
+                    for segment in job["segments"]]
+        total = sum(segment["bytes"] for _, _, segment in segments)
+        for _, job_id, segment in sorted(segments, key=lambda item: item[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.job_dir(job_id), segment["file"]))
+            except FileNotFoundError:
+                pass
+            total -= segment["bytes"]
+            self.evicted += 1
+
+            index = self.read_index(job_id)
+            index["segments"] = [item for item in index["segments"] if item["file"] != segment["file"]]
+            index["evicted"] = index.get("evicted", 0) + 1
+            if index["segments"] or job_id == self.job_id:
+                self.write_index(job_id, index)
+            else:
+                # От печати не осталось сегментов
+                shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def flush(self):
+        self.queue.join()
+
+    def shutdown(self):
+        self.job_id = None
+        if self.thread is not None:
+            self.queue.put(("stop", None, None))
+            self.thread.join(timeout=30)
+            self.thread = None
+
+    def get_stats(self):
+        return {
+            "job_id": self.job_id,
+            "queued": self.queue.qsize(),
+            "offered": self.offered,
+            "dropped": self.dropped,
+            "written": self.written,
+            "segments": self.segments,
+            "evicted": self.evicted,
+            "failed": self.failed,
+        }
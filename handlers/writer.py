@@ -0,0 +1,279 @@
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+import cv2
+
+from database.databases import PrintInfoRepository
+from database.storage import encode_jpeg, make_thumbnail
+from monitoring.metrics import DB_RECORDS_WRITTEN, DB_WRITE_SECONDS
+
+SPILL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "spill", "print_info.jsonl")
+
+
+# Поля записи с байтами, в файле они хранятся в base64
+BINARY_FIELDS = ("jpeg", "thumbnail")
+
+
+'''
+
+RepositorySink записывает информацию о печати в репозиторий синхронно, в потоке обработчика события. Вместе
+с PersistenceWriter реализует один интерфейс submit, поэтому обработчики событий не зависят от способа записи.
+
+'''
+
+
+class RepositorySink:
+    def __init__(self, repo):
+        self.repo = repo  # Репозиторий с информацией о печати
+
+    def submit(self, print_time, status, frame=None, printer_id=None, outcome=None, clip_ref=None) -> bool:
+        jpeg = None
+        if frame is not None:
+            try:
+                jpeg = encode_jpeg(frame)
+            except (cv2.error, ValueError) as e:
+                print(f"Ошибка при кодировании кадра: {e}")
+                return False
+        try:
+            self.repo.add_print_info(print_time=print_time, status=status, jpeg=jpeg, printer_id=printer_id,
+                                     outcome=outcome, clip_ref=clip_ref)
+            print(f"Данные о печати записаны в базу: {status}")
+            return True
+        except Exception as e:
+            print(f"Ошибка записи данных в базу: {e}")
+            return False
+
+
+'''
+
+PersistenceWriter записывает информацию о печати в базу в фоновом потоке. Обработчики событий только кладут кадр
+в ограниченную очередь, а кодирование JPEG и запись пачками выполняются вне цикла обработки кадров. Если очередь
+заполнена, запись без обработки добавляется в список переполнения, который разбирает тот же фоновый поток.
+
+Неудачная запись повторяется с экспоненциальной задержкой. Если база недоступна, записи сохраняются в локальный
+файл и дописываются в базу после восстановления соединения. При остановке очередь записывается до конца.
+Каждая пачка записывается в своей сессии session_scope: фиксация, откат и закрытие сессии выполняются там.
+
+'''
+
+
+class PersistenceWriter:
+    def __init__(self, session_scope: Callable, repo_factory: Callable = PrintInfoRepository, max_queue: int = 100,
+                 batch_size: int = 20, flush_interval: float = 1.0, max_retries: int = 3, backoff: float = 0.5,
+                 max_backoff: float = 10.0, spill_path: str = SPILL_PATH):
+        self.session_scope = session_scope  # Сессия на одну пачку записей, например DatabaseConnection.session_scope
+        self.repo_factory = repo_factory  # Репозиторий с информацией о печати для сессии
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size  # Максимальное количество записей в одной транзакции
+        self.flush_interval = flush_interval  # Сколько ждать новых записей перед записью неполной пачки
+        self.max_retries = max_retries  # Попыток записи перед сохранением в файл
+        self.backoff = backoff  # Начальная задержка между попытками, секунды
+        self.max_backoff = max_backoff
+        self.spill_path = spill_path  # Файл для записей, которые не удалось записать в базу
+        self.spill_lock = threading.Lock()
+        self.overflow = deque()  # Записи, не поместившиеся в очередь, ждут фонового потока
+        self.overflow_lock = threading.Lock()
+        self.overflow_unfinished = 0  # Записи из переполнения, еще не записанные в базу или файл
+        self.thread = None
+        self.stopping = threading.Event()
+
+        self.written = 0
+        self.retries = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.overflowed = 0
+        self.last_write_latency = None
+        self.avg_write_latency = None
+
+    def start(self):
+        if self.thread is None:
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._run, name="persistence-writer", daemon=True)
+            self.thread.start()
+        return self
+
+    def submit(self, print_time, status, frame=None, printer_id=None, outcome=None, clip_ref=None) -> bool:
+        # Возвращает False, если очередь переполнена и запись отложена в список переполнения.
+        # Время окончания фиксируется сразу, запись в базу может произойти позже
+        record = {"print_time": print_time, "status": status, "frame": frame, "printer_id": printer_id,
+                  "outcome": outcome, "clip_ref": clip_ref, "finished_at": time.time()}
+        # Поток записи запускается при запуске приложения или при первой записи
+        self.start()
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            # Поток обработки кадров не кодирует кадр и не ждет файл, запись разберет фоновый поток
+            with self.overflow_lock:
+                self.overflow.append(record)
+                self.overflow_unfinished += 1
+                self.overflowed += 1
+            return False
+
+    def _encode(self, record):
+        # Сжатие кадра в JPEG и миниатюру выполняется в фоновом потоке
+        frame = record.pop("frame", None)
+        if frame is not None:
+            try:
+                record["jpeg"] = encode_jpeg(frame)
+                record["thumbnail"] = make_thumbnail(frame)
+            except (cv2.error, ValueError) as e:
+                print(f"Ошибка при кодировании кадра: {e}")
+        record["print_time"] = str(record["print_time"])
+        return record
+
+    @staticmethod
+    def _dump(record):
+        return json.dumps({key: base64.b64encode(value).decode('ascii') if key in BINARY_FIELDS and value else value
+                           for key, value in record.items()}, ensure_ascii=False)
+
+    @staticmethod
+    def _load(line):
+        record = json.loads(line)
+        for key in BINARY_FIELDS:
+            if record.get(key):
+                record[key] = base64.b64decode(record[key])
+        return record
+
+    def _next_batch(self):
+        # Пачка из очереди и списка переполнения, возвращается вместе с количеством записей из очереди
+        batch = []
+        if not self.overflow:
+            try:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                return [], 0
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        queued = len(batch)
+        with self.overflow_lock:
+            while len(batch) < self.batch_size and self.overflow:
+                batch.append(self.overflow.popleft())
+        return batch, queued
+
+    def _run(self):
+        while not (self.stopping.is_set() and self.queue.empty() and not self.overflow):
+            batch, queued = self._next_batch()
+            if not batch:
+                continue
+            try:
+                records = [self._encode(record) for record in batch]
+                if self._write_with_retry(records):
+                    self._replay_spill()
+                else:
+                    self._spill(records)
+            finally:
+                for _ in range(queued):
+                    self.queue.task_done()
+                with self.overflow_lock:
+                    self.overflow_unfinished -= len(batch) - queued
+
+    def _write(self, records):
+        start = time.perf_counter()
+        with self.session_scope() as session:
+            self.repo_factory(session).add_print_infos(records)
+        latency = time.perf_counter() - start
+        DB_WRITE_SECONDS.observe(latency)
+        DB_RECORDS_WRITTEN.inc(len(records))
+        self.last_write_latency = latency
+        self.avg_write_latency = latency if self.avg_write_latency is None \
+            else self.avg_write_latency * 0.9 + latency * 0.1
+        self.written += len(records)
+
+    def _write_with_retry(self, records) -> bool:
+        delay = self.backoff
+        for attempt in range(self.max_retries):
+            try:
+                self._write(records)
+                return True
+            except Exception as e:
+                print(f"Ошибка записи данных в базу (попытка {attempt + 1}): {e}")
+                # При остановке не ждем, оставшиеся записи уйдут в файл
+                if attempt + 1 < self.max_retries and not self.stopping.is_set():
+                    self.retries += 1
+                    self.stopping.wait(delay)
+                    delay = min(delay * 2, self.max_backoff)
+        return False
+
+    def _append_spill(self, records):
+        with self.spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as file:
+                for record in records:
+                    file.write(self._dump(record) + "\n")
+
+    def _spill(self, records):
+        self._append_spill(records)
+        self.spilled += len(records)
+        print(f"PersistenceWriter: база недоступна, {len(records)} записей сохранено в {self.spill_path}")
+
+    def _replay_spill(self):
+        # Дозапись сохраненных в файл записей после восстановления соединения с базой.
+        # Под локом файл только читается и удаляется, запись в базу идет без лока
+        with self.spill_lock:
+            if not os.path.exists(self.spill_path):
+                return
+            with open(self.spill_path, encoding="utf-8") as file:
+                records = [self._load(line) for line in file if line.strip()]
+            os.remove(self.spill_path)
+        for start in range(0, len(records), self.batch_size):
+            try:
+                self._write(records[start:start + self.batch_size])
+            except Exception as e:
+                print(f"Ошибка дозаписи сохраненных данных: {e}")
+                # Недописанные записи возвращаются в файл
+                self._append_spill(records[start:])
+                return
+            self.replayed += len(records[start:start + self.batch_size])
+
+    def flush(self, timeout: float = None):
+        # Ожидание записи всех поставленных в очередь данных
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks or self.overflow_unfinished:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout: float = 30.0):
+        self.stopping.set()
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout=timeout)
+            if thread.is_alive():
+                # Поток еще пишет пачку, синхронная запись остатка привела бы к повторной записи
+                print("PersistenceWriter: поток записи не завершился за отведенное время")
+                return
+            self.thread = None
+        # Если поток так и не был запущен, записываем остаток синхронно
+        leftovers = []
+        while not self.queue.empty():
+            leftovers.append(self._encode(self.queue.get_nowait()))
+            self.queue.task_done()
+        with self.overflow_lock:
+            while self.overflow:
+                leftovers.append(self._encode(self.overflow.popleft()))
+                self.overflow_unfinished -= 1
+        if leftovers and not self._write_with_retry(leftovers):
+            self._spill(leftovers)
+
+    def get_stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "written": self.written,
+            "retries": self.retries,
+            "spilled": self.spilled,
+            "overflowed": self.overflowed,
+            "replayed": self.replayed,
+            "last_write_ms": round(self.last_write_latency * 1000, 2) if self.last_write_latency else None,
+            "avg_write_ms": round(self.avg_write_latency * 1000, 2) if self.avg_write_latency else None,
+        }
@@ -1,60 +1,154 @@
-from fastapi import FastAPI, HTTPException, Form, Request
-from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from database.databases import DatabaseConnection, UserRepository, PrintInfoRepository
-from validation.all_classes import LoginRequest
-from functions.motiondetector import MotionDetector
-from functions.errorsdetector import FindError
-from connectors.videoconnect import VideoStream
-from observer.notifier import ConsoleNotifier
-import cv2
-from decorators.decorators import TimerDetectorDecorator, PrintErrorDetector
-from handlers.handlers import handle_motion_end, handle_print_error
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import Optional
 
-app = FastAPI(debug=True)
+from fastapi import FastAPI, HTTPException, Depends, Form, Query, Request
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse, JSONResponse, RedirectResponse, Response
+from fastapi.templating import Jinja2Templates
+from sqlalchemy.orm import Session
+from config import settings
+from auth.auth import SESSION_COOKIE, authenticate, sessions
+from database.databases import DatabaseConnection, UserRepository, PrintInfoRepository
+from validation.all_classes import LoginRequest, PrintHistoryItem, PrintHistoryPage, PrintOutcome
+from pipeline.pipeline import PrintPipeline
+from pipeline.registry import PrinterRegistry
+from pipeline.broadcast import stream_frames
+from pipeline.events import event_stream
+from handlers.clips import clip_path
+from handlers.writer import PersistenceWriter
+from monitoring.metrics import CONTENT_TYPE, REGISTRY
+from observer.notifier import MQTTNotifier, connect_mqtt_client, create_mqtt_client
+
+# Время запуска приложения и окончания подготовки принтеров для /ready
+startup_state = {"started": None, "ready": None}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Импорт модуля только создает объекты. База, поток записи, MQTT и эталоны готовятся здесь,
+    # камера открывается при первом зрителе
+    startup_state["started"], startup_state["ready"] = time.perf_counter(), None
+    create_schema()
+    writer.start()
+    if mqtt_client is not None:
+        connect_mqtt_client(mqtt_client, settings.MQTT_HOST, settings.MQTT_PORT)
+    # Эталоны считаются в фоне: сервер сразу принимает запросы, готовность видна по /ready
+    warmup = threading.Thread(target=warm_up_printers, name="printers-warmup", daemon=True)
+    warmup.start()
+    yield
+    warmup.join(timeout=30)
+    stop_printers()
+
+
+app = FastAPI(debug=True, lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
 
-# Глобальные переменные для статуса и времени печати
-printing_status = "Ожидание начала печати"
-motion_start_time = None
-total_time = 0
-streaming_active = True
-last_frame = None
-
-# Обработчик ошибок печати
-printing_error = False
-error_message = ""
 
-# функция для поворторного открытия видеопотока
-def get_videostream():
-    return VideoStream(0)
+# Подключение к базе создается один раз на все время работы приложения, соединения берутся из пула
+db = DatabaseConnection(
+    url=settings.DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    echo=settings.DB_ECHO
+)
 
 
-videostream = get_videostream()
-
-# Подключение к базе
-def get_db():
-    db = DatabaseConnection(
-        username='krasti',
-        password='Admin20)$1998',
-        host='193.233.48.188',
-        database='3dprint_base'
-    )
-    db.create_tables()
+# Сессия на один запрос, после ответа соединение возвращается в пул
+def get_db_session():
     session = db.get_session()
-    return session
+    try:
+        yield session
+    finally:
+        session.close()
 
 
 # Получение репозитория пользователя
-def get_user_repo():
-    db_session = get_db()
-    return UserRepository(db_session)
+def get_user_repo(session: Session = Depends(get_db_session)):
+    return UserRepository(session)
+
+
+# Репозиторий информации о печати на один запрос для чтения истории
+def get_history_repo(session: Session = Depends(get_db_session)):
+    return PrintInfoRepository(session, storage_mode=settings.SNAPSHOT_STORAGE)
+
+
+# Репозиторий с информацией о печати для пачки записей фонового потока, сессией управляет db.session_scope
+def get_print_repo(session: Session):
+    return PrintInfoRepository(session, storage_mode=settings.SNAPSHOT_STORAGE)
+
+
+# Принтеры фермы из config/printers.json (или PRINTERS_CONFIG). У каждого принтера свой обработчик камеры,
+# кадр обрабатывается и кодируется один раз для всех подключений
+# Информация о печати записывается в базу фоновым потоком, цикл обработки кадров не ждет базу
+writer = PersistenceWriter(session_scope=db.session_scope, repo_factory=get_print_repo)
+
+# Сообщения детекторов публикуются в MQTT, если указан MQTT_HOST. Один клиент на все принтеры
+mqtt_client = create_mqtt_client(settings.MQTT_USERNAME, settings.MQTT_PASSWORD) if settings.MQTT_HOST else None
+
+
+def mqtt_notifiers(printer_id: str):
+    if mqtt_client is None:
+        return []
+    return [MQTTNotifier(mqtt_client, printer_id, settings.MQTT_TOPIC_PREFIX, settings.MQTT_QOS)]
+
+
+registry = PrinterRegistry.from_config(
+    sink_factory=lambda: writer,
+    notifier_factory=mqtt_notifiers,
+    dispatcher_settings={"timeout": settings.NOTIFY_TIMEOUT, "dedupe_window": settings.NOTIFY_DEDUPE_WINDOW}
+).register_metrics()
+REGISTRY.callback("print_db_queue_depth", "Записи в очереди фоновой записи в базу", "gauge",
+                  lambda: [({}, writer.queue.qsize())])
+REGISTRY.callback("print_db_spilled_total", "Записи, сохраненные в файл из-за недоступности базы", "counter",
+                  lambda: [({}, writer.spilled)])
 
-# Получение репозитория с информацией о печати
-def get_print_repo():
-    db_session = get_db()
-    return PrintInfoRepository(db_session)
+# Первый принтер обслуживает адреса без идентификатора принтера
+pipeline = registry.default
+
+# Отдельный пул для блокирующих вызовов OpenCV из асинхронных обработчиков, не делит потоки с синхронными адресами
+stream_executor = ThreadPoolExecutor(max_workers=settings.STREAM_EXECUTOR_WORKERS, thread_name_prefix="stream")
+
+
+def warm_up_printers():
+    for printer in registry:
+        printer.warm_up()
+    startup_state["ready"] = time.perf_counter()
+
+
+def readiness():
+    # База доступна и эталоны всех принтеров загружены. Камера открывается при первом зрителе и на готовность
+    # не влияет
+    database = db.tables_created and db.ping()
+    printers = {
+        printer.printer_id: {
+            "references": printer.warmed_up,
+            "error": printer.warmup_error,
+            "warmup_seconds": round(printer.warmup_time, 3) if printer.warmup_time is not None else None,
+            "camera": "running" if printer.running else "idle",
+        }
+        for printer in registry
+    }
+    started, ready = startup_state["started"], startup_state["ready"]
+    return {
+        "ready": database and all(printer["references"] for printer in printers.values()),
+        "database": database,
+        "printers": printers,
+        "startup_seconds": round(ready - started, 3) if started is not None and ready is not None else None,
+    }
+
+
+def get_pipeline(printer_id: str) -> PrintPipeline:
+    try:
+        return registry.get(printer_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Принтер {printer_id} не найден")
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -63,13 +157,13 @@ def login_form(request: Request):
 
 
 @app.post("/login", response_class=HTMLResponse)
-def login(request: Request, username: str = Form(...), password: str = Form(...)):
-    user_repo = get_user_repo()
+def login(request: Request, username: str = Form(...), password: str = Form(...),
+          user_repo: UserRepository = Depends(get_user_repo)):
     login_data = LoginRequest(username=username, password=password)
-    users = user_repo.get_all_users()
-    for user in users:
-        if user.username == login_data.username and user.password == login_data.password:
-            return RedirectResponse(url="/status", status_code=303)
+    if authenticate(user_repo, login_data.username, login_data.password):
+        response = RedirectResponse(url="/status", status_code=303)
+        response.set_cookie(SESSION_COOKIE, sessions.create(login_data.username), httponly=True, samesite="lax")
+        return response
 
     return templates.TemplateResponse(request, "login.html", {
         "request": request,
@@ -77,13 +171,26 @@ def login(request: Request, username: str = Form(...), password: str = Form(...)
     })
 
 
+# Проверка токена сессии из cookie, без обращения к базе
+def get_current_user(request: Request):
+    return sessions.validate(request.cookies.get(SESSION_COOKIE))
+
+
+def require_user(request: Request):
+    username = get_current_user(request)
+    if username is None:
+        raise HTTPException(status_code=401, detail="Требуется вход")
+    return username
+
+
 @app.get("/status", response_class=HTMLResponse)
 def status_page(request: Request):
-    global printing_status, total_time
+    if get_current_user(request) is None:
+        return RedirectResponse(url="/", status_code=303)
     return templates.TemplateResponse(request, "status.html", {
         "request": request,
-        "status": printing_status,
-        "elapsed_time": f"{total_time:.2f}"
+        "status": pipeline.printing_status,
+        "elapsed_time": f"{pipeline.total_time:.2f}"
     })
 
 
@@ -94,119 +201,175 @@ def end_print_page(request: Request):
         "end_print.html",
         {
             "request": request,
-            "status": printing_status,
-            "elapsed_time": f"{total_time:.2f}",
-            "error": printing_error,
+            "status": pipeline.printing_status,
+            "elapsed_time": f"{pipeline.total_time:.2f}",
+            "error": pipeline.printing_error,
         }
     )
 
 
-@app.get("/stream", response_class=StreamingResponse)
-def video_stream():
-    global printing_status, motion_start_time, total_time, printing_error, error_message, streaming_active, last_frame, videostream
-
-    detector = MotionDetector()
-    find_error_detector = FindError(error_threshold=0)
-    motion_timer_decorator = TimerDetectorDecorator(detector)
-    print_error_detector = PrintErrorDetector(motion_timer_decorator, find_error_detector)
-
-    # Инициализация наблюдателей
-    console_notifier = ConsoleNotifier()
-    motion_timer_decorator.attach(console_notifier)
-
-    # Установка обработчиков событий
-    def motion_end_handler(total_motion_time, last_frame):
-        global printing_status, total_time, streaming_active
-
-        print_repo = get_print_repo()
-        handle_motion_end(total_motion_time, last_frame, print_repo)
-        printing_status = "Печать завершена успешно"
-        total_time = total_motion_time
-        streaming_active = False  # Останавливаем стриминг
-
-    def print_error_handler(elapsed_time, last_frame, error_message):
-        global printing_status, printing_error, total_time, streaming_active
-
-        print_repo = get_print_repo()
-        handle_print_error(elapsed_time, last_frame, error_message, print_repo)
-        printing_status = f"Ошибка: {error_message}"
-        printing_error = True
-        total_time = elapsed_time
-        streaming_active = False  # Останавливаем стриминг
-
-    motion_timer_decorator.set_motion_end_handler(motion_end_handler)
-    print_error_detector.set_error_handler(print_error_handler)
-
-    def frame_generator():
-        global motion_start_time, printing_status, total_time, streaming_active, last_frame, videostream
-        print_repo = get_print_repo()
-        try:
-            while streaming_active:
-                try:
-                    frame = videostream.get_frame()
-                    if frame is None:
-                        print("Ошибка: кадр не получен.")
-                        break
-
-                    # Обработка кадра
-                    result = print_error_detector.process_frame(frame)
-                    processed_frame, motion_detected = result
-
-                    # Обновление статуса и времени
-                    if motion_detected and printing_status != "Идет печать":
-                        motion_start_time = datetime.now()
-                        printing_status = "Идет печать"
-
-                    if motion_start_time is not None:
-                        total_time = (datetime.now() - motion_start_time).total_seconds()
-                    else:
-                        total_time = 0
-
-                    # Сжатие кадра в JPEG
-                    ret, buffer = cv2.imencode('.jpg', processed_frame)
-                    if not ret:
-                        print("Ошибка: не удалось сжать кадр в JPEG.")
-                        continue
-                    frame_bytes = buffer.tobytes()
-
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-
-                    last_frame = frame
-
-                except ValueError as e:
-                    print(f"Ошибка при получении кадра: {e}")
-                    break
-                except Exception as e:
-                    print(f"Неожиданная ошибка при обработке кадра: {e}")
-                    break
-
-        except Exception as e:
-            print(f"Ошибка во время обработки видео: {e}")
-            raise HTTPException(status_code=500, detail="Internal Server Error")
-        finally:
-            total_motion_time = motion_timer_decorator.get_motion_time()
-            if not printing_error:
-                handle_motion_end(total_motion_time, last_frame, print_repo)
-            videostream.release()
+async def stream_response(request: Request, pipeline: PrintPipeline, profile: Optional[str] = None):
+    # Профиль задает размер, качество JPEG и частоту кадров трансляции
+    try:
+        # Открытие камеры при первом зрителе блокирует, поэтому выполняется в отдельном пуле потоков
+        subscription = await asyncio.get_running_loop().run_in_executor(stream_executor, pipeline.subscribe,
+                                                                        profile)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Неизвестный профиль трансляции: {profile}")
+
+    # Кадры ожидаются в цикле событий: зритель не занимает поток, отключение сразу снимает подписку
+    async def frame_generator():
+        async for frame_bytes in stream_frames(subscription, request.is_disconnected):
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
 
     return StreamingResponse(frame_generator(), media_type="multipart/x-mixed-replace; boundary=frame")
 
 
+def events_response(request: Request, pipeline: PrintPipeline):
+    # Server-Sent Events: статус, время печати, движение, коэффициент качества и сообщения детекторов
+    return StreamingResponse(
+        event_stream(pipeline.events, request.is_disconnected, settings.EVENTS_MAX_RATE, settings.EVENTS_HEARTBEAT),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/events")
+def status_events(request: Request, username: str = Depends(require_user)):
+    return events_response(request, pipeline)
+
+
+@app.get("/stream", response_class=StreamingResponse)
+async def video_stream(request: Request, profile: Optional[str] = None, username: str = Depends(require_user)):
+    return await stream_response(request, pipeline, profile)
+
+
 @app.post("/resume")
-def resume_processing():
-    global streaming_active, printing_error, error_message, videostream
-    streaming_active = True
-    printing_error = False
-    error_message = ""
-    videostream = get_videostream()
+def resume_processing(username: str = Depends(require_user)):
+    pipeline.resume()
     return JSONResponse(content={"message": "Обработка возобновлена."})
 
 
 @app.get("/print_status")
-def get_print_status():
-    global printing_status, printing_error
+def get_print_status(username: str = Depends(require_user)):
+    return JSONResponse(content=pipeline.get_status())
+
+
+@app.get("/stats")
+def get_stats(username: str = Depends(require_user)):
+    return JSONResponse(content={**pipeline.get_stats(), "persistence": writer.get_stats()})
+
+
+@app.get("/ready")
+def ready():
+    state = readiness()
+    return JSONResponse(content=state, status_code=200 if state["ready"] else 503)
+
+
+@app.get("/metrics")
+def metrics():
+    # Метрики в формате Prometheus
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/printers")
+def list_printers():
+    return JSONResponse(content=[
+        {"id": printer.printer_id, **printer.get_status(), "running": printer.running,
+         "cpu_time": round(printer.get_cpu_time(), 3)}
+        for printer in registry
+    ])
+
+
+@app.get("/printers/{printer_id}/stream", response_class=StreamingResponse)
+async def printer_stream(request: Request, printer_id: str, profile: Optional[str] = None,
+                         username: str = Depends(require_user)):
+    return await stream_response(request, get_pipeline(printer_id), profile)
+
+
+@app.get("/printers/{printer_id}/events")
+def printer_events(request: Request, printer_id: str, username: str = Depends(require_user)):
+    return events_response(request, get_pipeline(printer_id))
+
+
+@app.get("/printers/{printer_id}/status")
+def printer_status(printer_id: str, username: str = Depends(require_user)):
+    printer = get_pipeline(printer_id)
     return JSONResponse(content={
-        "status": printing_status,
-        "error": printing_error
+        **printer.get_status(),
+        "elapsed_time": round(printer.total_time, 2),
+        "running": printer.running,
+        "cpu_time": round(printer.get_cpu_time(), 3),
     })
+
+
+@app.post("/printers/{printer_id}/resume")
+def printer_resume(printer_id: str, username: str = Depends(require_user)):
+    get_pipeline(printer_id).resume()
+    return JSONResponse(content={"message": "Обработка возобновлена."})
+
+
+@app.get("/printers/{printer_id}/stats")
+def printer_stats(printer_id: str, username: str = Depends(require_user)):
+    return JSONResponse(content=get_pipeline(printer_id).get_stats())
+
+
+@app.get("/history")
+def print_history(limit: int = Query(50, ge=1, le=500), cursor: Optional[int] = None,
+                  printer_id: Optional[str] = None, status: Optional[PrintOutcome] = None,
+                  started_from: Optional[datetime] = None, started_to: Optional[datetime] = None,
+                  username: str = Depends(require_user),
+                  print_repo: PrintInfoRepository = Depends(get_history_repo)):
+    # Только метаданные, снимки загружаются отдельно по /history/{id}/image
+    rows, next_cursor = print_repo.list_history(limit, cursor, printer_id, status, started_from, started_to)
+    page = PrintHistoryPage(
+        items=[PrintHistoryItem.model_validate(row, from_attributes=True) for row in rows],
+        next_cursor=next_cursor
+    )
+    return JSONResponse(content=page.model_dump(mode="json"))
+
+
+@app.get("/history/{print_id}/image")
+def print_history_image(print_id: int, username: str = Depends(require_user),
+                        print_repo: PrintInfoRepository = Depends(get_history_repo)):
+    image = print_repo.get_image(print_id)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Снимок не найден")
+    return Response(content=image, media_type="image/jpeg")
+
+
+@app.get("/history/{print_id}/thumbnail")
+def print_history_thumbnail(print_id: int, username: str = Depends(require_user),
+                            print_repo: PrintInfoRepository = Depends(get_history_repo)):
+    thumbnail = print_repo.get_thumbnail(print_id)
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Миниатюра не найдена")
+    return Response(content=thumbnail, media_type="image/jpeg")
+
+
+@app.get("/history/{print_id}/clip")
+def print_history_clip(print_id: int, username: str = Depends(require_user),
+                       print_repo: PrintInfoRepository = Depends(get_history_repo)):
+    # Ролик последних секунд перед ошибкой, записывается в фоне и может появиться позже строки истории
+    clip_ref = print_repo.get_clip_ref(print_id)
+    path = clip_path(clip_ref, registry.clip_exporter.root) if clip_ref else None
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Ролик не найден")
+    return FileResponse(path, media_type="video/x-msvideo", filename=os.path.basename(path))
+
+
+def create_schema():
+    # Таблицы создаются один раз при запуске, а не при каждом запросе
+    db.create_tables()
+
+
+def stop_printers():
+    registry.stop_all()
+    stream_executor.shutdown(wait=False, cancel_futures=True)
+    if mqtt_client is not None:
+        mqtt_client.disconnect()
+        mqtt_client.loop_stop()
+    # Запись оставшихся данных о печати перед остановкой
+    writer.shutdown()
+    db.close_session()
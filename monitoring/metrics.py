@@ -0,0 +1,236 @@
+import bisect
+import math
+import threading
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+'''
+
+Метрики в формате Prometheus без внешних зависимостей. Значение с набором меток (printer, stage) хранится
+в отдельном дочернем объекте: код обработки кадра получает его один раз и дальше только увеличивает числа
+под коротким локом, поэтому запись метрик можно оставлять включенной постоянно.
+
+'''
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+
+class _GaugeChild(_CounterChild):
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина - больше всех границ
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        result = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            result.append((f"{name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+        result.append((f"{name}_sum", labels, total))
+        result.append((f"{name}_count", labels, count))
+        return result
+
+
+class Metric:
+    type = "untyped"
+    child_class = _CounterChild
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def _create_child(self):
+        return self.child_class()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._create_child())
+        return child
+
+    def samples(self):
+        result = []
+        for key, child in list(self.children.items()):
+            result.extend(child.samples(self.name, dict(zip(self.labelnames, key))))
+        return result
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+    child_class = _GaugeChild
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _create_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class CallbackMetric:
+    # Значения считаются при чтении /metrics: глубина очередей, данные из get_stats и т.п.
+    def __init__(self, name: str, documentation: str, metric_type: str, callback):
+        self.name = name
+        self.documentation = documentation
+        self.type = metric_type
+        self.callback = callback  # Возвращает список пар (метки, значение)
+
+    def samples(self):
+        return [(self.name, labels, value) for labels, value in self.callback() if value is not None]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if existing.type != metric.type:
+                    raise ValueError(f"Метрика {metric.name} уже зарегистрирована с типом {existing.type}")
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, metric_type, callback):
+        # Повторная регистрация заменяет функцию, например при перезапуске приложения в тестах
+        with self.lock:
+            self.metrics[name] = CallbackMetric(name, documentation, metric_type, callback)
+            return self.metrics[name]
+
+    def render(self) -> str:
+        # Текстовый формат Prometheus 0.0.4
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                print(f"Ошибка получения метрики {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.histogram("print_stage_seconds", "Время этапа обработки кадра", ("printer", "stage"))
+FRAMES_PROCESSED = REGISTRY.counter("print_frames_processed_total", "Обработано кадров", ("printer",))
+PIPELINE_FPS = REGISTRY.gauge("print_pipeline_fps", "Кадров в секунду в цикле обработки", ("printer",))
+DB_WRITE_SECONDS = REGISTRY.histogram("print_db_write_seconds", "Время записи пачки в базу")
+DB_RECORDS_WRITTEN = REGISTRY.counter("print_db_records_written_total", "Записано строк информации о печати")
+
+
+'''
+
+StageMetrics - запись времени этапов одного принтера. Дочерние гистограммы кешируются по имени этапа,
+запись стоит одного поиска в словаре и одного инкремента под локом.
+
+'''
+
+
+class StageMetrics:
+    def __init__(self, printer_id: str = "default", histogram: Histogram = STAGE_SECONDS):
+        self.printer_id = printer_id
+        self.histogram = histogram
+        self.children = {}
+
+    def observe(self, stage: str, seconds: float):
+        child = self.children.get(stage)
+        if child is None:
+            child = self.children[stage] = self.histogram.labels(printer=self.printer_id, stage=stage)
+        child.observe(seconds)
+
+
+class NullStageMetrics(StageMetrics):
+    # Детекторы вне PrintPipeline (процессы пула, тесты) ничего не записывают
+    def __init__(self):
+        super().__init__("none")
+
+    def observe(self, stage: str, seconds: float):
+        pass
+
+
+NULL_METRICS = NullStageMetrics()
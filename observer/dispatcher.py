@@ -0,0 +1,163 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional
+
+from observer.observer import Observer
+
+'''
+
+QueuedObserver доставляет сообщения наблюдателю в отдельном потоке. update только ставит сообщение в ограниченную
+очередь, поэтому медленный наблюдатель (сеть, диск) не задерживает обработку кадров.
+
+- Одинаковые сообщения в пределах dedupe_window секунд объединяются: доставляется первое, остальные считаются.
+- Сообщения доставляются не чаще раза в min_interval секунд, остальные ждут в очереди; при переполнении очереди
+  отбрасываются самые старые.
+- Вызов update наблюдателя ограничен timeout секунд. Пока зависший вызов не завершился, новые сообщения этому
+  наблюдателю не доставляются и считаются отброшенными, остальные наблюдатели работают независимо.
+
+'''
+
+
+class QueuedObserver(Observer):
+    def __init__(self, observer: Observer, timeout: float = 5.0, dedupe_window: float = 10.0,
+                 min_interval: float = 0.0, max_queue: int = 100):
+        self.observer = observer
+        self.name = type(observer).__name__
+        self.timeout = timeout  # Ограничение времени одного вызова update
+        self.dedupe_window = dedupe_window  # Окно объединения одинаковых сообщений, секунды
+        self.min_interval = min_interval  # Минимальный интервал между доставками, секунды
+        self.queue = queue.Queue(maxsize=max(1, max_queue))
+        self.recent = {}  # Сообщение -> время последней постановки в очередь
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"observer-{self.name}")
+        self.stalled_call = None  # Вызов update, не завершившийся за timeout
+        self.last_delivery = None
+
+        self.queued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.timeouts = 0
+        self.failed = 0
+
+    def update(self, message: str):
+        now = time.monotonic()
+        with self.lock:
+            last = self.recent.get(message)
+            if last is not None and now - last < self.dedupe_window:
+                self.coalesced += 1
+                return False
+            self.recent[message] = now
+            if len(self.recent) > 256:
+                # Забываем сообщения старше окна объединения
+                self.recent = {text: moment for text, moment in self.recent.items()
+                               if now - moment < self.dedupe_window}
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=f"dispatch-{self.name}", daemon=True)
+                self.thread.start()
+
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                break
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+        self.queued += 1
+        return True
+
+    def _run(self):
+        while True:
+            message = self.queue.get()
+            try:
+                if message is None:
+                    break
+                self._deliver(message)
+            finally:
+                self.queue.task_done()
+
+    def _deliver(self, message):
+        if self.min_interval and self.last_delivery is not None:
+            delay = self.last_delivery + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if self.stalled_call is not None:
+            if not self.stalled_call.done():
+                self.dropped += 1
+                return
+            self.stalled_call = None
+
+        self.last_delivery = time.monotonic()
+        call = self.executor.submit(self.observer.update, message)
+        try:
+            call.result(timeout=self.timeout)
+            self.delivered += 1
+        except FutureTimeoutError:
+            self.timeouts += 1
+            self.stalled_call = call
+            print(f"{self.name}: доставка сообщения заняла больше {self.timeout} с")
+        except Exception as e:
+            self.failed += 1
+            print(f"{self.name}: ошибка доставки сообщения: {e}")
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join(timeout=self.timeout + 1)
+        self.executor.shutdown(wait=False)
+
+    def get_stats(self):
+        return {
+            "observer": self.name,
+            "queued": self.queued,
+            "pending": self.queue.qsize(),
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "delivered": self.delivered,
+            "timeouts": self.timeouts,
+            "failed": self.failed,
+        }
+
+
+'''
+
+NotificationDispatcher создает QueuedObserver для наблюдателей одного принтера и останавливает их потоки вместе.
+
+'''
+
+
+class NotificationDispatcher:
+    def __init__(self, timeout: float = 5.0, dedupe_window: float = 10.0, min_interval: float = 0.0,
+                 max_queue: int = 100):
+        self.defaults = {"timeout": timeout, "dedupe_window": dedupe_window, "min_interval": min_interval,
+                         "max_queue": max_queue}
+        self.observers: List[QueuedObserver] = []
+
+    def wrap(self, observer: Observer, **options) -> QueuedObserver:
+        queued = QueuedObserver(observer, **{**self.defaults, **options})
+        self.observers.append(queued)
+        return queued
+
+    def flush(self):
+        for observer in self.observers:
+            observer.flush()
+
+    def close(self):
+        for observer in self.observers:
+            observer.close()
+
+    def get_stats(self):
+        return [observer.get_stats() for observer in self.observers]
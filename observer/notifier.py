@@ -1,5 +1,50 @@
+import json
+import time
+
 from observer.observer import Observer
 
 class ConsoleNotifier(Observer):
     def update(self, message: str):
         print(f"ConsoleNotifier: {message}")
+
+
+# Передача сообщений детекторов клиентам /events
+class EventNotifier(Observer):
+    def __init__(self, hub):
+        self.hub = hub
+
+    def update(self, message: str):
+        self.hub.publish("message", {"message": message})
+
+
+def create_mqtt_client(username: str = None, password: str = None, client_id: str = ""):
+    # Один клиент на все принтеры, подключается connect_mqtt_client при запуске приложения
+    from paho.mqtt.client import CallbackAPIVersion, Client
+
+    client = Client(CallbackAPIVersion.VERSION2, client_id=client_id)
+    if username:
+        client.username_pw_set(username, password)
+    client.reconnect_delay_set(min_delay=1, max_delay=60)
+    return client
+
+
+def connect_mqtt_client(client, host: str, port: int = 1883, keepalive: int = 60):
+    # Подключение и переподключение идут в потоке paho, поэтому недоступный брокер не задерживает запуск
+    # сервиса, а сообщения до подключения ставятся в очередь клиента
+    client.connect_async(host, port, keepalive)
+    client.loop_start()
+    return client
+
+
+# Публикация сообщений детекторов в MQTT для панелей фермы принтеров, тема {topic_prefix}/{printer_id}/message
+class MQTTNotifier(Observer):
+    def __init__(self, client, printer_id: str = "default", topic_prefix: str = "printers", qos: int = 1):
+        self.client = client
+        self.printer_id = printer_id
+        self.topic = f"{topic_prefix.rstrip('/')}/{printer_id}/message"
+        self.qos = qos
+
+    def update(self, message: str):
+        payload = json.dumps({"printer": self.printer_id, "message": message, "time": time.time()},
+                             ensure_ascii=False)
+        self.client.publish(self.topic, payload, qos=self.qos)
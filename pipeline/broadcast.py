@@ -0,0 +1,260 @@
+import asyncio
+import queue
+import threading
+import time
+
+import cv2
+
+from validation.all_classes import StreamProfile
+
+# Профили трансляции по умолчанию, первый используется, если клиент не указал профиль
+DEFAULT_STREAM_PROFILES = (
+    StreamProfile(name="high", width=None, quality=80, min_quality=50, max_fps=None),
+    StreamProfile(name="medium", width=960, quality=70, min_quality=40, max_fps=10),
+    StreamProfile(name="low", width=480, quality=50, min_quality=25, max_fps=5),
+)
+
+QUALITY_STEP = 10  # Изменение качества JPEG за один шаг адаптации
+RAISE_AFTER = 30  # Кадров без потерь, после которых качество повышается
+
+
+def encode_jpeg(image, width=None, quality=80):
+    # Уменьшение до ширины профиля и сжатие в JPEG
+    if width and image.shape[1] > width:
+        scale = width / image.shape[1]
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ret, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ret:
+        raise ValueError("Не удалось сжать кадр в JPEG.")
+    return buffer.tobytes()
+
+
+'''
+
+Subscription - очередь кадров одного клиента. Очередь ограничена, политика при переполнении - отбрасывание
+самого старого кадра: поток обработки никогда не ждет клиента, медленный клиент не задерживает остальных и видит
+свежее изображение, а память на клиента не больше maxsize кадров.
+
+Кадры можно забирать блокирующим get (поток) или get_async (цикл событий asyncio). Для get_async поток обработки
+будит ожидающую корутину через call_soon_threadsafe, поэтому зритель не занимает поток из пула.
+
+Качество JPEG подстраивается под клиента: при потере кадров оно снижается до min_quality профиля, а после
+RAISE_AFTER кадров без потерь снова растет. Частота кадров ограничивается max_fps профиля.
+
+'''
+
+
+class Subscription:
+    def __init__(self, broadcaster, maxsize: int = 2, profile: StreamProfile = None):
+        self.broadcaster = broadcaster
+        self.queue = queue.Queue(maxsize=max(1, maxsize))
+        self.profile = profile or DEFAULT_STREAM_PROFILES[0]
+        self.quality = self.profile.quality  # Текущее качество JPEG для этого клиента
+        self.interval = 1.0 / self.profile.max_fps if self.profile.max_fps else 0.0
+        self.last_sent = None  # Время отправки последнего кадра
+        self.delivered = 0  # Кадров поставлено в очередь
+        self.dropped = 0  # Кадров отброшено из-за медленного клиента
+        self.dropped_seen = 0  # Потери, уже учтенные при адаптации качества
+        self.clean_frames = 0  # Кадров подряд без потерь
+        self.closed = False
+        self.loop = None  # Цикл событий клиента, ожидающего кадры через get_async
+        self.ready = None  # asyncio.Event: в очереди появился кадр
+
+    def due(self, now: float) -> bool:
+        # Ограничение частоты кадров профиля
+        return self.last_sent is None or now - self.last_sent >= self.interval
+
+    def adapt(self):
+        # Снижение качества, если клиент теряет кадры, и повышение, если успевает
+        if self.dropped > self.dropped_seen:
+            self.dropped_seen = self.dropped
+            self.clean_frames = 0
+            self.quality = max(self.profile.min_quality, self.quality - QUALITY_STEP)
+        else:
+            self.clean_frames += 1
+            if self.clean_frames >= RAISE_AFTER and self.quality < self.profile.quality:
+                self.clean_frames = 0
+                self.quality = min(self.profile.quality, self.quality + QUALITY_STEP)
+        return self.quality
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                break
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    if item is not None:
+                        self.dropped += 1
+                except queue.Empty:
+                    pass
+        if item is not None:
+            self.delivered += 1
+        self._wake()
+
+    def _wake(self):
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.ready.set)
+            except RuntimeError:
+                # Цикл событий уже закрыт
+                pass
+
+    def get(self, timeout: float = None):
+        # Возвращает JPEG кадр или None, если трансляция завершена
+        while not self.closed:
+            try:
+                item = self.queue.get(timeout=timeout or 1.0)
+            except queue.Empty:
+                if timeout is not None:
+                    raise
+                continue
+            if item is None:
+                self.closed = True
+            return item
+        return None
+
+    async def get_async(self, timeout: float = None):
+        # Ожидание кадра в цикле событий, asyncio.TimeoutError по истечении timeout
+        if self.loop is None:
+            self.ready = asyncio.Event()
+            self.loop = asyncio.get_running_loop()
+        while not self.closed:
+            self.ready.clear()
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+                continue
+            if item is None:
+                self.closed = True
+            return item
+        return None
+
+    def __iter__(self):
+        while True:
+            item = self.get()
+            if item is None:
+                break
+            yield item
+
+    def close(self):
+        self.closed = True
+        self.broadcaster.unsubscribe(self)
+        self._wake()
+
+
+async def stream_frames(subscription: Subscription, is_disconnected=None, poll_interval: float = 1.0):
+    # Асинхронный генератор кадров для StreamingResponse. Пока кадров нет, раз в poll_interval проверяется
+    # отключение клиента; при отключении или отмене генератора клиент сразу отписывается от кадров
+    try:
+        while True:
+            try:
+                item = await subscription.get_async(poll_interval)
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    break
+                continue
+            if item is None:
+                break
+            yield item
+    finally:
+        subscription.close()
+
+
+'''
+
+FrameBroadcaster раздает закодированные кадры всем подключенным клиентам. publish_frame кодирует кадр только
+если есть клиенты, которым он нужен, и один раз на каждое сочетание ширины и качества. Поэтому нагрузка на
+кодирование зависит от числа и скорости зрителей, а не от частоты камеры.
+
+'''
+
+
+class FrameBroadcaster:
+    def __init__(self, queue_size: int = 2, profiles=DEFAULT_STREAM_PROFILES):
+        self.queue_size = queue_size  # Размер очереди клиента по умолчанию
+        self.profiles = {profile.name: profile for profile in profiles}
+        self.default_profile = profiles[0]
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.published = 0  # Всего разослано кадров
+        self.encoded = 0  # Всего сжатий в JPEG
+        self.skipped = 0  # Кадров без зрителей, сжатие не выполнялось
+        self.dropped_closed = 0  # Отброшенные кадры уже отключившихся клиентов
+
+    def get_profile(self, name: str = None) -> StreamProfile:
+        if name is None:
+            return self.default_profile
+        if name not in self.profiles:
+            raise KeyError(name)
+        return self.profiles[name]
+
+    def subscribe(self, maxsize: int = None, profile: str = None) -> Subscription:
+        subscription = Subscription(self, maxsize or self.queue_size, self.get_profile(profile))
+        with self.lock:
+            self.subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+                self.dropped_closed += subscription.dropped
+
+    @property
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def publish(self, data: bytes):
+        with self.lock:
+            subscribers = list(self.subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            subscription.put(data)
+
+    def publish_frame(self, image, encoder=encode_jpeg, now: float = None) -> int:
+        # Сжатие и рассылка кадра клиентам, которым он нужен. Возвращает количество сжатий
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            subscribers = [subscription for subscription in self.subscribers if subscription.due(now)]
+            if not self.subscribers:
+                self.skipped += 1
+            if subscribers:
+                self.published += 1
+
+        encoded = {}
+        for subscription in subscribers:
+            key = (subscription.profile.width, subscription.adapt())
+            if key not in encoded:
+                encoded[key] = encoder(image, *key)
+            subscription.last_sent = now
+            subscription.put(encoded[key])
+        self.encoded += len(encoded)
+        return len(encoded)
+
+    def close(self):
+        # Завершение трансляции: клиенты получают None и закрывают соединение
+        with self.lock:
+            subscribers = list(self.subscribers)
+            self.subscribers.clear()
+            self.dropped_closed += sum(subscription.dropped for subscription in subscribers)
+        for subscription in subscribers:
+            subscription.put(None)
+
+    def get_stats(self):
+        with self.lock:
+            subscribers = list(self.subscribers)
+            return {
+                "subscribers": len(subscribers),
+                "published": self.published,
+                "encoded": self.encoded,
+                "skipped": self.skipped,
+                "dropped": self.dropped_closed + sum(subscription.dropped for subscription in subscribers),
+                "clients": [{"profile": subscription.profile.name, "quality": subscription.quality,
+                             "delivered": subscription.delivered, "dropped": subscription.dropped,
+                             "queued": subscription.queue.qsize()} for subscription in subscribers],
+            }
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import threading
+import time
+
+'''
+
+EventHub хранит последние события принтера по типам: status, elapsed, motion, quality, message. Новое событие
+заменяет предыдущее того же типа, поэтому клиент, который забирает изменения не чаще max_rate раз в секунду,
+получает только актуальные значения, а частота событий в цикле обработки кадров на клиентов не влияет.
+
+Каждое событие получает номер версии. Клиент запоминает последнюю полученную версию и забирает только более
+новые события, поэтому публикация не зависит от количества подключенных клиентов.
+
+'''
+
+
+class EventHub:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = 0  # Номер последнего события
+        self.latest = {}  # Тип события -> (версия, данные)
+        self.published = 0
+
+    def publish(self, event_type: str, data: dict):
+        with self.lock:
+            self.version += 1
+            self.latest[event_type] = (self.version, data)
+            self.published += 1
+
+    def changes_since(self, version: int = 0):
+        # Возвращает (текущая версия, события новее version в порядке публикации)
+        if version >= self.version:
+            return version, []
+        with self.lock:
+            events = sorted((event_version, event_type, data) for event_type, (event_version, data)
+                            in self.latest.items() if event_version > version)
+            return self.version, [(event_type, data) for _, event_type, data in events]
+
+
+def format_sse(event_type: str, data: dict) -> str:
+    # Одно событие в формате Server-Sent Events
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def event_stream(hub: EventHub, is_disconnected, max_rate: float = 4.0, heartbeat: float = 15.0):
+    # Генератор для StreamingResponse: при подключении отправляет текущее состояние, дальше только изменения,
+    # не чаще max_rate раз в секунду. Ожидание идет в цикле событий, без отдельного потока на клиента
+    interval = 1.0 / max_rate
+    version = 0
+    last_sent = time.monotonic()
+    yield "retry: 3000\n\n"
+    while not await is_disconnected():
+        version, events = hub.changes_since(version)
+        if events:
+            yield "".join(format_sse(event_type, data) for event_type, data in events)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= heartbeat:
+            # Комментарий не виден клиенту, но не дает прокси закрыть соединение
+            yield ": ping\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(interval)
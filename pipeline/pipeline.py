@@ -0,0 +1,389 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from decorators.decorators import TimerDetectorDecorator, PrintErrorDetector, TimelapseDecorator
+from functions.alignment import HomographyAligner
+from functions.errorsdetector import FindError
+from functions.features import FeatureEngine
+from functions.motiondetector import MotionDetector
+from functions.preprocessing import FramePreprocessor
+from functions.qualityworker import QualityWorkerPool
+from functions.referencecache import ReferenceFeatureCache
+from functions.referenceset import ReferenceSet
+from functions.scheduler import AnalysisScheduler
+from handlers.clips import ClipExporter, FrameRingBuffer, new_clip_ref
+from handlers.handlers import handle_motion_end, handle_print_error
+from handlers.timelapse import TIMELAPSE_DIR, TimelapseRecorder
+from monitoring.metrics import FRAMES_PROCESSED, PIPELINE_FPS, StageMetrics
+from observer.dispatcher import NotificationDispatcher
+from observer.notifier import ConsoleNotifier, EventNotifier
+from pipeline.events import EventHub
+from pipeline.broadcast import DEFAULT_STREAM_PROFILES, FrameBroadcaster, encode_jpeg
+
+WAITING_STATUS = "Ожидание начала печати"
+PRINTING_STATUS = "Идет печать"
+SUCCESS_STATUS = "Печать завершена успешно"
+
+
+'''
+
+PrintPipeline - единственный обработчик видеопотока одной камеры. Он работает в своем потоке независимо от
+HTTP клиентов: читает кадры, прогоняет их через цепочку детекторов, один раз кодирует результат в JPEG и раздает
+его всем подключенным клиентам через FrameBroadcaster. Здесь же хранится статус печати.
+
+'''
+
+
+class PrintPipeline:
+    def __init__(self, source_factory: Callable, sink_factory: Callable, feature_settings: dict = None,
+                 reference_cache: ReferenceFeatureCache = None, reference_name: str = "image2.jpg",
+                 preprocessor: FramePreprocessor = None, quality_pool: Optional[QualityWorkerPool] = None,
+                 queue_size: int = 2, printer_id: str = "default", quality_threshold: float = 0.01,
+                 error_threshold: float = 0, motion_engine: str = "mog2", stream_profiles=None,
+                 alignment_settings: dict = None, reference_set: ReferenceSet = None, clip_settings: dict = None,
+                 clip_exporter: ClipExporter = None, timelapse_settings: dict = None, notifiers: list = None,
+                 dispatcher: NotificationDispatcher = None):
+        self.printer_id = printer_id
+        self.quality_threshold = quality_threshold  # Порог коэффициента качества для ошибки печати
+        self.error_threshold = error_threshold  # Порог доли ошибок FindError
+        self.motion_engine = motion_engine  # Способ обнаружения движения: mog2 или diff
+        self.source_factory = source_factory  # Открытие видеопотока
+        self.sink_factory = sink_factory  # Получатель записей о печати: PersistenceWriter или RepositorySink
+        self.feature_settings = feature_settings or {}
+        self.alignment_settings = alignment_settings  # Настройки HomographyAligner, None - без выравнивания
+        self.preprocessor = preprocessor or FramePreprocessor()
+        # Эталоны проходят ту же предобработку, что и кадры камеры
+        self.reference_cache = reference_cache or ReferenceFeatureCache(engine=FeatureEngine(**self.feature_settings),
+                                                                        preprocessor=self.preprocessor)
+        self.reference_name = reference_name
+        # Эталоны по ходу печати, по умолчанию только reference_name
+        self.reference_set = reference_set or ReferenceSet([reference_name], cache=self.reference_cache)
+        self.quality_pool = quality_pool
+        self.broadcaster = FrameBroadcaster(queue_size, stream_profiles or DEFAULT_STREAM_PROFILES)
+        # Сжатые кадры последних секунд для ролика ошибки, None - сохраняется только последний кадр
+        self.prebuffer = FrameRingBuffer(**clip_settings) if clip_settings is not None else None
+        self.clip_exporter = clip_exporter or (ClipExporter() if self.prebuffer is not None else None)
+        # Замедленная съемка печати, у каждого принтера своя папка и свой бюджет на диске
+        self.recorder = None
+        if timelapse_settings is not None:
+            settings = dict(timelapse_settings)
+            settings.setdefault("root", os.path.join(TIMELAPSE_DIR, printer_id))
+            self.recorder = TimelapseRecorder(**settings)
+
+        # Статус и время печати
+        self.printing_status = WAITING_STATUS
+        self.motion_start_time = None
+        self.total_time = 0
+        self.streaming_active = True
+        self.last_frame = None
+
+        # Ошибка печати
+        self.printing_error = False
+        self.error_message = ""
+
+        self.videostream = None
+        # Эталоны и процессы расчета качества готовятся при запуске приложения, камера - при первом зрителе
+        self.warmed_up = False
+        self.warmup_error = None
+        self.warmup_time = None
+        self.analysis_scheduler = None
+        self.error_detector = None
+        self.print_error_detector = None
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.cpu_time = 0.0  # Процессорное время потока обработки за все запуски
+        self.capture_cpu_time = 0.0  # Процессорное время потока чтения камеры за завершенные запуски
+
+        # Метрики этапов обработки кадра для /metrics
+        self.metrics = StageMetrics(printer_id)
+        self.frames_counter = FRAMES_PROCESSED.labels(printer=printer_id)
+        self.fps_gauge = PIPELINE_FPS.labels(printer=printer_id)
+        self.fps = 0.0
+
+        # События для клиентов /events: смена статуса, движение, качество, сообщения детекторов
+        self.events = EventHub()
+        # Наблюдатели детекторов. EventHub только запоминает событие и вызывается сразу, остальные (консоль, MQTT)
+        # получают сообщения через очередь в своих потоках и не задерживают обработку кадров
+        self.dispatcher = dispatcher or NotificationDispatcher()
+        self.notifiers = [self.dispatcher.wrap(ConsoleNotifier()), EventNotifier(self.events)]
+        self.notifiers += [self.dispatcher.wrap(notifier) for notifier in notifiers or []]
+        self.publish_status()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def ensure_started(self):
+        # Запуск обработки при первом подключении клиента, повторные вызовы ничего не делают
+        with self.lock:
+            return self._start_locked()
+
+    def _start_locked(self):
+        if self.running or not self.streaming_active:
+            return self.running
+        if self.videostream is None:
+            self.videostream = self.source_factory()
+        self.thread = threading.Thread(target=self._run, name=f"print-pipeline-{self.printer_id}", daemon=True)
+        self.thread.start()
+        return True
+
+    def subscribe(self, profile: str = None):
+        # KeyError, если профиль трансляции не найден
+        with self.lock:
+            subscription = self.broadcaster.subscribe(profile=profile)
+            started = self._start_locked()
+            if not started:
+                # Обработка остановлена до вызова /resume, клиент сразу получает конец трансляции
+                subscription.put(None)
+            return subscription
+
+    def encode_frame(self, image, width=None, quality=80):
+        start = time.perf_counter()
+        data = encode_jpeg(image, width, quality)
+        self.metrics.observe("jpeg_encode", time.perf_counter() - start)
+        return data
+
+    def resume(self):
+        # Сброс ошибки, обработка начнется заново при подключении клиента
+        with self.lock:
+            self.streaming_active = True
+            self.printing_error = False
+            self.error_message = ""
+            # Следующая печать отсчитывается от нового начала движения
+            self.motion_start_time = None
+            self.total_time = 0
+        self.publish_status()
+
+    def stop(self):
+        self.streaming_active = False
+        thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+
+    def warm_up(self):
+        # Дескрипторы всех эталонов и процессы расчета качества до первого кадра
+        start = time.perf_counter()
+        try:
+            self.reference_set.preload()
+            if self.quality_pool is not None:
+                self.quality_pool.start()
+            self.warmup_error = None
+        except (OSError, ValueError, RuntimeError) as e:
+            self.warmup_error = str(e)
+            print(f"Не удалось загрузить эталоны принтера {self.printer_id}: {e}")
+        self.warmup_time = time.perf_counter() - start
+        self.warmed_up = self.warmup_error is None
+        return self.warmed_up
+
+    def build_chain(self):
+        detector = MotionDetector(engine=self.motion_engine)
+        aligner = HomographyAligner(**self.alignment_settings) if self.alignment_settings is not None else None
+        find_error_detector = FindError(error_threshold=self.error_threshold,
+                                        engine=FeatureEngine(**self.feature_settings), aligner=aligner)
+        self.error_detector = find_error_detector
+        motion_timer_decorator = TimerDetectorDecorator(detector)
+        # Проверка качества раз в 10 кадров, раз в 2 секунды и при смене состояния движения
+        self.analysis_scheduler = AnalysisScheduler(every_n_frames=10, every_seconds=2.0, frame_budget=1 / 15)
+        print_error_detector = PrintErrorDetector(motion_timer_decorator, find_error_detector,
+                                                  quality_threshold=self.quality_threshold,
+                                                  reference_name=self.reference_name,
+                                                  reference_cache=self.reference_cache,
+                                                  scheduler=self.analysis_scheduler,
+                                                  quality_pool=self.quality_pool,
+                                                  reference_set=self.reference_set)
+        self.print_error_detector = print_error_detector
+
+        # Инициализация наблюдателей: сообщения о движении и об ошибках печати
+        for notifier in self.notifiers:
+            motion_timer_decorator.attach(notifier)
+            find_error_detector.attach(notifier)
+
+        motion_timer_decorator.set_motion_end_handler(self.motion_end_handler)
+        print_error_detector.set_error_handler(self.print_error_handler)
+        print_error_detector.set_quality_handler(self.quality_handler)
+        print_error_detector.set_metrics(self.metrics)
+
+        # Без подготовки при запуске эталоны загружаются перед первым кадром
+        if not self.warmed_up:
+            self.warm_up()
+        if self.recorder is not None:
+            # Внешнее звено цепочки: кадр ставится в очередь записи после обработки детекторами
+            chain = TimelapseDecorator(print_error_detector, self.recorder)
+            chain.set_metrics(self.metrics)
+            return motion_timer_decorator, chain
+        return motion_timer_decorator, print_error_detector
+
+    # Установка обработчиков событий
+    def motion_end_handler(self, total_motion_time, last_frame):
+        handle_motion_end(total_motion_time, last_frame, self.sink_factory(), self.printer_id)
+        self.printing_status = SUCCESS_STATUS
+        self.motion_start_time = None
+        self.total_time = total_motion_time
+        self.streaming_active = False  # Останавливаем стриминг
+        if self.recorder is not None:
+            self.recorder.end_job()
+        self.events.publish("motion", {"active": False})
+        self.publish_status()
+
+    def export_clip(self):
+        # Имя ролика возвращается сразу, кадры записываются в файл в фоновом потоке
+        if self.prebuffer is None:
+            return None
+        frames = self.prebuffer.snapshot()
+        clip_ref = new_clip_ref(self.printer_id)
+        if not self.clip_exporter.submit(clip_ref, frames, self.prebuffer.fps):
+            return None
+        return clip_ref
+
+    def print_error_handler(self, elapsed_time, last_frame, error_message):
+        handle_print_error(elapsed_time, last_frame, error_message, self.sink_factory(), self.printer_id,
+                           self.export_clip())
+        self.printing_status = f"Ошибка: {error_message}"
+        self.printing_error = True
+        self.error_message = error_message
+        self.total_time = elapsed_time
+        self.streaming_active = False  # Останавливаем стриминг
+        if self.recorder is not None:
+            self.recorder.end_job()
+        self.publish_status()
+
+    def quality_handler(self, quality_coefficient):
+        self.events.publish("quality", {"value": round(quality_coefficient, 4)})
+
+    def get_progress(self):
+        # Доля выполнения печати по времени от начала движения, до движения - как в начале печати.
+        # Без ожидаемого времени печати ReferenceSet всегда выбирает эталон готовой детали
+        if self.motion_start_time is None:
+            return self.reference_set.progress_at(0)
+        return self.reference_set.progress_at((datetime.now() - self.motion_start_time).total_seconds())
+
+    def publish_status(self):
+        self.events.publish("status", {**self.get_status(), "elapsed_time": round(self.total_time, 2)})
+
+    def _run(self):
+        cpu_start, cpu_base = time.thread_time(), self.cpu_time
+        motion_timer_decorator, chain = self.build_chain()
+        print_sink = self.sink_factory()
+        metrics = self.metrics
+        last_frame_time = None
+        last_elapsed = None
+        try:
+            while self.streaming_active:
+                self.cpu_time = cpu_base + time.thread_time() - cpu_start
+                try:
+                    start = time.perf_counter()
+                    frame = self.videostream.get_frame()
+                    captured = time.perf_counter()
+                    metrics.observe("capture", captured - start)
+                    if frame is None:
+                        print("Ошибка: кадр не получен.")
+                        break
+
+                    # Кадр попадает в буфер до проверки, поэтому ролик ошибки заканчивается кадром с ошибкой
+                    if self.prebuffer is not None and self.prebuffer.due(time.monotonic()):
+                        buffered = time.perf_counter()
+                        self.prebuffer.add(frame)
+                        metrics.observe("prebuffer", time.perf_counter() - buffered)
+                        captured = time.perf_counter()
+
+                    # Обработка кадра, оттенки серого и область стола считаются один раз для всех детекторов
+                    prepared = self.preprocessor.prepare(frame)
+                    metrics.observe("grayscale", time.perf_counter() - captured)
+                    self.print_error_detector.set_progress(self.get_progress())
+                    result = chain.process_frame(prepared)
+                    processed_frame, motion_detected = result
+
+                    # Обновление статуса и времени
+                    # Начало движения после запуска или после /resume, прерванного посреди печати
+                    motion_started = self.printing_status != PRINTING_STATUS or self.motion_start_time is None
+                    if motion_detected and motion_started:
+                        self.motion_start_time = datetime.now()
+                        self.printing_status = PRINTING_STATUS
+                        if self.recorder is not None:
+                            self.recorder.start_job(f"{self.printer_id}-{self.motion_start_time:%Y%m%d-%H%M%S}")
+                        self.events.publish("motion", {"active": True})
+                        self.publish_status()
+
+                    # После конца движения остается итоговое время, заданное обработчиком
+                    if self.motion_start_time is not None:
+                        self.total_time = (datetime.now() - self.motion_start_time).total_seconds()
+
+                    # Время печати отправляется клиентам раз в секунду
+                    if int(self.total_time) != last_elapsed:
+                        last_elapsed = int(self.total_time)
+                        self.events.publish("elapsed", {"elapsed_time": last_elapsed})
+
+                    # Сжатие в JPEG только для подключенных зрителей, один раз на каждый размер и качество
+                    try:
+                        self.broadcaster.publish_frame(processed_frame, self.encode_frame)
+                    except ValueError as e:
+                        print(f"Ошибка: {e}")
+                        continue
+
+                    self.last_frame = frame
+
+                    # Кадры в секунду со сглаживанием
+                    now = time.perf_counter()
+                    if last_frame_time is not None and now > last_frame_time:
+                        interval = now - last_frame_time
+                        self.fps = self.fps * 0.9 + 0.1 / interval if self.fps else 1.0 / interval
+                        self.fps_gauge.set(round(self.fps, 2))
+                    last_frame_time = now
+                    self.frames_counter.inc()
+
+                except ValueError as e:
+                    print(f"Ошибка при получении кадра: {e}")
+                    break
+                except Exception as e:
+                    print(f"Неожиданная ошибка при обработке кадра: {e}")
+                    break
+
+        except Exception as e:
+            print(f"Ошибка во время обработки видео: {e}")
+        finally:
+            total_motion_time = motion_timer_decorator.get_motion_time()
+            if not self.printing_error:
+                handle_motion_end(total_motion_time, self.last_frame, print_sink, self.printer_id)
+            if self.recorder is not None:
+                self.recorder.end_job()
+            self.cpu_time = cpu_base + time.thread_time() - cpu_start
+            self.videostream.release()
+            self.capture_cpu_time += getattr(self.videostream, "cpu_time", 0.0)
+            with self.lock:
+                self.videostream = None
+                self.thread = None
+                self.broadcaster.close()
+
+    def get_status(self):
+        return {
+            "status": self.printing_status,
+            "error": self.printing_error
+        }
+
+    def get_cpu_time(self):
+        # Процессорное время обработки и чтения камеры этого принтера, секунды
+        videostream = self.videostream
+        return self.cpu_time + self.capture_cpu_time + getattr(videostream, "cpu_time", 0.0)
+
+    def get_stats(self):
+        videostream = self.videostream
+        return {
+            "printer_id": self.printer_id,
+            "running": self.running,
+            "cpu_time": round(self.get_cpu_time(), 3),
+            "fps": round(self.fps, 2),
+            "capture": videostream.get_stats() if hasattr(videostream, "get_stats") else None,
+            "analysis": self.analysis_scheduler.get_stats() if self.analysis_scheduler else None,
+            "quality_pool": self.quality_pool.get_stats() if self.quality_pool else None,
+            "alignment": self.error_detector.aligner.get_stats()
+            if self.error_detector is not None and self.error_detector.aligner is not None else None,
+            "stream": self.broadcaster.get_stats(),
+            "prebuffer": self.prebuffer.get_stats() if self.prebuffer is not None else None,
+            "timelapse": self.recorder.get_stats() if self.recorder is not None else None,
+            "notifications": self.dispatcher.get_stats(),
+            "warmup": {"ready": self.warmed_up, "error": self.warmup_error,
+                       "seconds": round(self.warmup_time, 3) if self.warmup_time is not None else None},
+        }
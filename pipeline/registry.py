@@ -0,0 +1,154 @@
+import json
+import os
+from typing import Callable, Dict
+
+from connectors.videoconnect import ThreadedVideoStream
+from functions.features import FeatureEngine
+from functions.preprocessing import FramePreprocessor
+from functions.qualityworker import QualityWorkerPool
+from functions.referencecache import ReferenceFeatureCache
+from functions.referenceset import ReferenceSet
+from handlers.clips import ClipExporter
+from monitoring.metrics import REGISTRY, MetricsRegistry
+from observer.dispatcher import NotificationDispatcher
+from pipeline.pipeline import PrintPipeline
+from validation.all_classes import FarmConfig, PrinterConfig
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "printers.json")
+
+
+def load_farm_config(path: str = None) -> FarmConfig:
+    # Без файла настроек используется один принтер с камерой 0
+    path = path or os.environ.get("PRINTERS_CONFIG", CONFIG_PATH)
+    if not os.path.exists(path):
+        return FarmConfig(printers=[PrinterConfig(id="default")])
+    with open(path, encoding="utf-8") as file:
+        return FarmConfig(**json.load(file))
+
+
+'''
+
+PrinterRegistry хранит обработчики всех принтеров фермы. Каждый принтер получает свою камеру, эталоны, пороги
+и свой поток обработки; потоки OpenCV отпускают GIL, поэтому принтеры распределяются по ядрам процессора.
+Расчет качества при необходимости выносится в отдельные процессы для каждого принтера.
+
+'''
+
+
+class PrinterRegistry:
+    def __init__(self, config: FarmConfig, sink_factory: Callable, notifier_factory: Callable = None,
+                 dispatcher_settings: dict = None):
+        self.config = config
+        self.sink_factory = sink_factory  # Получатель записей о печати: PersistenceWriter или RepositorySink
+        self.notifier_factory = notifier_factory  # Дополнительные наблюдатели принтера, например MQTTNotifier
+        self.dispatcher_settings = dispatcher_settings or {}  # Настройки NotificationDispatcher
+        self.pipelines: Dict[str, PrintPipeline] = {}
+        self._reference_caches = {}  # Кеш эталонов на каждую конфигурацию детектора признаков
+        self.clip_exporter = ClipExporter()  # Один поток записи роликов ошибок на все принтеры
+
+        for printer in config.printers:
+            if printer.id in self.pipelines:
+                raise ValueError(f"Повторяющийся идентификатор принтера: {printer.id}")
+            self.pipelines[printer.id] = self.create_pipeline(printer)
+
+    @classmethod
+    def from_config(cls, sink_factory: Callable, path: str = None, **options):
+        return cls(load_farm_config(path), sink_factory, **options)
+
+    def get_reference_cache(self, feature_settings: dict, preprocessor: FramePreprocessor):
+        key = (tuple(sorted(feature_settings.items())), preprocessor.signature)
+        if key not in self._reference_caches:
+            self._reference_caches[key] = ReferenceFeatureCache(engine=FeatureEngine(**feature_settings),
+                                                                preprocessor=preprocessor)
+        return self._reference_caches[key]
+
+    def create_pipeline(self, printer: PrinterConfig) -> PrintPipeline:
+        feature_settings = printer.feature.model_dump()
+        alignment_settings = printer.alignment.model_dump() if printer.alignment else None
+        preprocess_settings = {"analysis_width": printer.analysis_width, "roi": printer.roi}
+        preprocessor = FramePreprocessor(**preprocess_settings)
+        quality_pool = None
+        if printer.quality_workers > 0:
+            quality_pool = QualityWorkerPool(feature_settings, reference_names=printer.references,
+                                             workers=printer.quality_workers,
+                                             alignment_settings=alignment_settings,
+                                             preprocess_settings=preprocess_settings)
+
+        reference_cache = self.get_reference_cache(feature_settings, preprocessor)
+        reference_set = ReferenceSet(printer.references, printer.reference_progress, reference_cache,
+                                     neighbors=printer.reference_neighbors,
+                                     expected_duration=printer.expected_duration)
+
+        return PrintPipeline(
+            source_factory=lambda source=printer.source: ThreadedVideoStream(source).start(),
+            sink_factory=self.sink_factory,
+            feature_settings=feature_settings,
+            reference_cache=reference_cache,
+            reference_name=printer.references[0],
+            preprocessor=preprocessor,
+            quality_pool=quality_pool,
+            printer_id=printer.id,
+            quality_threshold=printer.quality_threshold,
+            error_threshold=printer.error_threshold,
+            motion_engine=printer.motion_engine,
+            stream_profiles=printer.stream_profiles,
+            alignment_settings=alignment_settings,
+            reference_set=reference_set,
+            clip_settings=printer.error_clip.model_dump() if printer.error_clip else None,
+            clip_exporter=self.clip_exporter,
+            timelapse_settings=printer.timelapse.model_dump() if printer.timelapse else None,
+            notifiers=self.notifier_factory(printer.id) if self.notifier_factory else None,
+            dispatcher=NotificationDispatcher(**self.dispatcher_settings)
+        )
+
+    def get(self, printer_id: str) -> PrintPipeline:
+        return self.pipelines[printer_id]
+
+    @property
+    def default(self) -> PrintPipeline:
+        # Первый принтер из настроек обслуживает старые адреса /stream, /status и т.д.
+        return self.pipelines[self.config.printers[0].id]
+
+    def __iter__(self):
+        return iter(self.pipelines.values())
+
+    def __len__(self):
+        return len(self.pipelines)
+
+    def stop_all(self):
+        for pipeline in self:
+            pipeline.stop()
+            if pipeline.quality_pool is not None:
+                pipeline.quality_pool.shutdown(wait=False)
+            if pipeline.recorder is not None:
+                pipeline.recorder.shutdown()
+            pipeline.dispatcher.close()
+        # Ролики ошибок, поставленные в очередь до остановки, дописываются
+        self.clip_exporter.shutdown()
+
+    def get_stats(self):
+        return {printer_id: pipeline.get_stats() for printer_id, pipeline in self.pipelines.items()}
+
+    def _stat_samples(self, *path):
+        # Значение из get_stats каждого принтера, считается только при чтении /metrics
+        samples = []
+        for printer_id, stats in self.get_stats().items():
+            for key in path:
+                stats = stats.get(key) if isinstance(stats, dict) else None
+            samples.append(({"printer": printer_id}, stats))
+        return samples
+
+    def register_metrics(self, metrics: MetricsRegistry = REGISTRY):
+        metrics.callback("print_capture_frames_dropped_total", "Кадры камеры, пропущенные обработкой", "counter",
+                         lambda: self._stat_samples("capture", "dropped"))
+        metrics.callback("print_stream_frames_dropped_total", "Кадры, отброшенные для медленных клиентов", "counter",
+                         lambda: self._stat_samples("stream", "dropped"))
+        metrics.callback("print_stream_subscribers", "Подключенные клиенты /stream", "gauge",
+                         lambda: self._stat_samples("stream", "subscribers"))
+        metrics.callback("print_quality_pool_pending", "Кадры в очереди пула расчета качества", "gauge",
+                         lambda: self._stat_samples("quality_pool", "pending"))
+        metrics.callback("print_quality_pool_dropped_total", "Устаревшие кадры, отброшенные пулом", "counter",
+                         lambda: self._stat_samples("quality_pool", "dropped"))
+        metrics.callback("print_pipeline_running", "Работает ли обработка принтера", "gauge",
+                         lambda: [(labels, int(bool(value))) for labels, value in self._stat_samples("running")])
+        return self
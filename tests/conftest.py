@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Тесты работают с базой SQLite в памяти вместо удаленного MySQL
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+# Ролики ошибок печати из тестов не попадают в папку проекта
+os.environ.setdefault("CLIP_DIR", tempfile.mkdtemp(prefix="clips-"))
+os.environ.setdefault("TIMELAPSE_DIR", tempfile.mkdtemp(prefix="timelapse-"))
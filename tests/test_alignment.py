@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+import pytest
+
+from functions.alignment import HomographyAligner
+from functions.errorsdetector import FindError
+from functions.features import FeatureEngine
+from functions.referencecache import ReferenceFeatures
+
+
+@pytest.fixture
+def reference():
+    rng = np.random.default_rng(3)
+    image = np.full((240, 320, 3), 90, np.uint8)
+    for _ in range(60):
+        x, y = rng.integers(0, 290), rng.integers(0, 215)
+        color = tuple(int(c) for c in rng.integers(30, 255, 3))
+        cv2.rectangle(image, (int(x), int(y)), (int(x) + 28, int(y) + 22), color, -1)
+    return image
+
+
+def camera_view(reference, dx=20, dy=12):
+    # Эталон, снятый неподвижной камерой со сдвигом и небольшим поворотом
+    matrix = cv2.getRotationMatrix2D((160, 120), 3, 1.0)
+    matrix[:, 2] += (dx, dy)
+    return cv2.warpAffine(reference, matrix, (360, 280), borderValue=(90, 90, 90))
+
+
+def reference_features(image, engine):
+    keypoints, descriptors = engine.detectAndCompute(image, None)
+    return ReferenceFeatures("reference.jpg", "digest", image, list(keypoints), descriptors)
+
+
+class CountingEngine(FeatureEngine):
+    def __init__(self):
+        super().__init__("sift", "bf")
+        self.calls = 0
+
+    def detectAndCompute(self, image, mask=None):
+        self.calls += 1
+        return super().detectAndCompute(image, mask)
+
+
+def test_aligned_frames_skip_feature_matching(reference):
+    engine = CountingEngine()
+    features = reference_features(reference, engine)
+    aligner = HomographyAligner()
+    detector = FindError(error_threshold=0, engine=engine, aligner=aligner)
+    frame = camera_view(reference)
+    engine.calls = 0
+
+    first = detector.calculate_quality_coefficient(features, frame)
+    assert aligner.ready and aligner.inliers >= aligner.min_inliers
+    for _ in range(5):
+        assert detector.calculate_quality_coefficient(features, frame) == pytest.approx(first)
+    assert engine.calls == 1
+    assert aligner.get_stats()["fast_frames"] == 5
+
+
+def test_drift_triggers_realignment(reference):
+    engine = CountingEngine()
+    features = reference_features(reference, engine)
+    aligner = HomographyAligner()
+    detector = FindError(error_threshold=0, engine=engine, aligner=aligner)
+    detector.calculate_quality_coefficient(features, camera_view(reference))
+    engine.calls = 0
+
+    # Камеру сдвинули: сходство падает, гомография считается заново по новому положению
+    moved = camera_view(reference, dx=-10, dy=30)
+    detector.calculate_quality_coefficient(features, moved)
+    assert engine.calls == 1
+    assert aligner.drifts == 1 and aligner.aligned == 2
+    assert aligner.compare(moved, "digest") is not None
+
+
+def test_failed_alignment_falls_back_to_features(reference):
+    engine = CountingEngine()
+    features = reference_features(reference, engine)
+    aligner = HomographyAligner()
+    detector = FindError(error_threshold=0, engine=engine, aligner=aligner)
+    blank = np.full((280, 360, 3), 90, np.uint8)
+    engine.calls = 0
+
+    detector.calculate_quality_coefficient(features, blank)
+    detector.calculate_quality_coefficient(features, blank)
+    assert not aligner.ready
+    assert engine.calls == 2
+
+
+def test_max_age_forces_realignment(reference):
+    engine = FeatureEngine()
+    aligner = HomographyAligner(max_age=2)
+    detector = FindError(error_threshold=0, engine=engine, aligner=aligner)
+    features = reference_features(reference, engine)
+    frame = camera_view(reference)
+    for _ in range(4):
+        detector.compute_scores(features, frame)
+    assert aligner.aligned == 2
+
+
+def test_alignment_kept_per_reference(reference):
+    engine = CountingEngine()
+    first = reference_features(reference, engine)
+    second = ReferenceFeatures("second.jpg", "other", reference, first.keypoints, first.descriptors)
+    aligner = HomographyAligner()
+    detector = FindError(error_threshold=0, engine=engine, aligner=aligner)
+    frame = camera_view(reference)
+    detector.compute_scores(first, frame)
+    detector.compute_scores(second, frame)
+    engine.calls = 0
+
+    # Переход между эталонами ReferenceSet не требует нового сопоставления
+    for features in (first, second, first):
+        detector.compute_scores(features, frame)
+    assert engine.calls == 0
+    assert aligner.get_stats()["references"] == 2
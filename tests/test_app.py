@@ -1,16 +1,36 @@
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
-from main.app import app
-from database.databases import Base, Users
+from main.app import app, create_schema, db
+from database.databases import Base, Users, UserRepository, PrintInfoRepository
+from database.storage import encode_jpeg
+from main import app as app_module
+from pipeline.pipeline import PrintPipeline
+from tests.test_broadcast import FakeSink, FakeStream
+from validation.all_classes import UserCreateSchema
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 
 @pytest.fixture
 def client():
+    # TestClient без контекста не выполняет запуск приложения, поэтому таблицы создаются здесь
+    create_schema()
     return TestClient(app)
 
 
+@pytest.fixture
+def auth_client(client):
+    # Пользователь в базе приложения и вход с получением cookie сессии
+    with db.session_scope() as session:
+        if UserRepository(session).get_user_by_username('statususer') is None:
+            UserRepository(session).add_user(UserCreateSchema(username='statususer', password='statuspass'))
+    response = client.post("/login", data={"username": "statususer", "password": "statuspass"},
+                           follow_redirects=False)
+    assert response.status_code == 303
+    return client
+
+
 @pytest.fixture
 def db_connection():
     # Используем временную базу данных SQLite для тестов
@@ -37,8 +57,8 @@ def test_login_failure(client, db_connection):
     assert "Неверный логин" in response.text
 
 
-def test_status_page(client):
-    response = client.get("/status")
+def test_status_page(auth_client):
+    response = auth_client.get("/status")
     assert response.status_code == 200
     assert "Ожидание начала печати" in response.text
 
@@ -49,7 +69,96 @@ def test_end_print_page(client):
     assert "Ожидание начала печати" in response.text
 
 
-def test_resume_processing(client):
-    response = client.post("/resume")
+def test_resume_processing(auth_client):
+    response = auth_client.post("/resume")
     assert response.status_code == 200
     assert response.json() == {"message": "Обработка возобновлена."}
+
+
+def test_printers_list(client):
+    response = client.get("/printers")
+    assert response.status_code == 200
+    assert response.json()[0]["id"] == "default"
+
+
+def test_unknown_printer_status(auth_client):
+    response = auth_client.get("/printers/unknown/status")
+    assert response.status_code == 404
+
+
+def test_status_requires_login(client):
+    response = client.get("/status", follow_redirects=False)
+    assert response.status_code == 303
+    assert client.get("/print_status").status_code == 401
+    assert client.get("/events").status_code == 401
+
+
+def test_control_and_stats_require_login(client):
+    assert client.post("/resume").status_code == 401
+    assert client.post("/printers/default/resume").status_code == 401
+    assert client.get("/stats").status_code == 401
+    assert client.get("/printers/default/stats").status_code == 401
+
+
+def test_control_and_stats_with_session(auth_client):
+    assert auth_client.post("/printers/default/resume").status_code == 200
+    assert "persistence" in auth_client.get("/stats").json()
+    assert auth_client.get("/printers/default/stats").status_code == 200
+
+
+def test_print_status_with_session(auth_client):
+    response = auth_client.get("/print_status")
+    assert response.status_code == 200
+    assert "status" in response.json()
+
+
+def test_history_lists_metadata_and_serves_images(auth_client):
+    jpeg = encode_jpeg(np.zeros((60, 80, 3), np.uint8))
+    with db.session_scope() as session:
+        PrintInfoRepository(session).add_print_info('5.0', 'Модель напечатана без ошибок', jpeg=jpeg,
+                                                    printer_id='history')
+
+    response = auth_client.get("/history", params={"printer_id": "history", "status": "success"})
+    assert response.status_code == 200
+    item = response.json()["items"][0]
+    assert item["has_image"] and item["duration_seconds"] == 5.0
+    assert "image" not in item
+
+    assert auth_client.get(f"/history/{item['id']}/image").content == jpeg
+    assert auth_client.get(f"/history/{item['id']}/thumbnail").status_code == 200
+    assert auth_client.get("/history/999999/image").status_code == 404
+
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE print_stage_seconds histogram" in response.text
+    assert 'print_pipeline_running{printer="default"} 0' in response.text
+
+
+def test_stream_unknown_profile(auth_client):
+    assert auth_client.get("/stream", params={"profile": "unknown"}).status_code == 400
+
+
+def test_stream_serves_frames_asynchronously(auth_client, monkeypatch):
+    monkeypatch.setattr(app_module, "pipeline", PrintPipeline(source_factory=lambda: FakeStream(frames=5),
+                                                              sink_factory=FakeSink))
+    response = auth_client.get("/stream")
+    assert response.status_code == 200
+    assert response.content.count(b"--frame") > 0
+    assert app_module.pipeline.broadcaster.subscriber_count == 0
+
+
+def test_ready_reports_reference_warmup(client):
+    for printer in app_module.registry:
+        printer.warmed_up = False
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["database"] is True
+    assert response.json()["printers"]["default"]["camera"] == "idle"
+
+    app_module.warm_up_printers()
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["printers"]["default"]["references"] is True
@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from auth.auth import (CredentialCache, authenticate, credential_cache, hash_password, is_hashed,
+                       sessions, verify_password)
+from database.databases import Base, Users, UserRepository
+from validation.all_classes import UserCreateSchema, UserUpdateSchema
+
+
+@pytest.fixture
+def user_repo():
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    credential_cache.clear()
+    return UserRepository(sessionmaker(bind=engine)())
+
+
+def test_hash_password_fits_column():
+    stored = hash_password('secretpass')
+    assert is_hashed(stored)
+    assert len(stored) <= 100
+    assert verify_password('secretpass', stored) == (True, False)
+    assert verify_password('wrongpass', stored) == (False, False)
+
+
+def test_legacy_plaintext_password_is_rehashed(user_repo):
+    user_repo.session.add(Users(username='olduser', password='oldpass'))
+    user_repo.session.commit()
+
+    assert authenticate(user_repo, 'olduser', 'oldpass')
+    user = user_repo.get_user_by_username('olduser')
+    assert is_hashed(user.password)
+    assert verify_password('oldpass', user.password)[0]
+
+
+def test_cache_skips_database_and_is_invalidated(user_repo):
+    user_repo.add_user(UserCreateSchema(username='cacheuser', password='cachepass'))
+    assert authenticate(user_repo, 'cacheuser', 'cachepass')
+    assert credential_cache.check('cacheuser', 'cachepass')
+    assert not credential_cache.check('cacheuser', 'wrongpass')
+
+    user = user_repo.get_user_by_username('cacheuser')
+    token = sessions.create('cacheuser')
+    user_repo.update_user(user.id, UserUpdateSchema(password='newpass1'))
+    assert not credential_cache.check('cacheuser', 'cachepass')
+    assert sessions.validate(token) is None
+    assert not authenticate(user_repo, 'cacheuser', 'cachepass')
+    assert authenticate(user_repo, 'cacheuser', 'newpass1')
+
+    user_repo.delete_user(user.id)
+    assert not credential_cache.check('cacheuser', 'newpass1')
+    assert not authenticate(user_repo, 'cacheuser', 'newpass1')
+
+
+def test_cache_entries_expire():
+    cache = CredentialCache(ttl=-1)
+    cache.put('user', 'pass')
+    assert not cache.check('user', 'pass')
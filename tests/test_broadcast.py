@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from functions.referencecache import REFERENCE_DIR
+from pipeline.broadcast import FrameBroadcaster, stream_frames
+from pipeline.pipeline import PrintPipeline
+from validation.all_classes import PrinterConfig, StreamProfile
+
+
+class FakeStream:
+    # Источник, отдающий эталонное изображение вместо камеры
+    def __init__(self, frames=30):
+        self.frames = frames
+        self.image = cv2.imread(f"{REFERENCE_DIR}/image2.jpg")
+
+    def get_frame(self):
+        if self.frames == 0:
+            raise ValueError("Не удалось получить кадр.")
+        self.frames -= 1
+        return self.image.copy()
+
+    def release(self):
+        pass
+
+
+class FakeSink:
+    def __init__(self):
+        self.records = []
+
+    def submit(self, print_time, status, frame=None, printer_id=None, outcome=None, clip_ref=None):
+        self.records.append((print_time, status))
+        return True
+
+
+def test_slow_subscriber_drops_old_frames():
+    broadcaster = FrameBroadcaster(queue_size=2)
+    fast, slow = broadcaster.subscribe(), broadcaster.subscribe()
+    for i in range(5):
+        broadcaster.publish(bytes([i]))
+        assert fast.get(timeout=1) == bytes([i])
+
+    assert slow.get(timeout=1) == bytes([3])
+    stats = broadcaster.get_stats()
+    assert stats["subscribers"] == 2
+    assert stats["dropped"] == 3
+
+    broadcaster.close()
+    assert list(slow) == [bytes([4])]
+    assert broadcaster.subscriber_count == 0
+
+
+def test_pipeline_encodes_once_for_all_subscribers():
+    sink = FakeSink()
+    pipeline = PrintPipeline(source_factory=FakeStream, sink_factory=lambda: sink)
+    first, second = pipeline.subscribe(), pipeline.subscribe()
+
+    frames = list(first)
+    assert frames and frames[0].startswith(b'\xff\xd8')
+    assert list(second)
+    assert pipeline.broadcaster.published == 30
+    assert not pipeline.running
+
+
+def test_publish_frame_skips_encoding_without_viewers():
+    broadcaster = FrameBroadcaster()
+    calls = []
+
+    def encoder(image, width, quality):
+        calls.append((width, quality))
+        return b"jpeg"
+
+    image = np.zeros((480, 640, 3), np.uint8)
+    assert broadcaster.publish_frame(image, encoder) == 0
+    assert calls == [] and broadcaster.get_stats()["skipped"] == 1
+
+    high, low, other_low = (broadcaster.subscribe(), broadcaster.subscribe(profile="low"),
+                            broadcaster.subscribe(profile="low"))
+    assert broadcaster.publish_frame(image, encoder, now=0.0) == 2
+    assert sorted(calls, key=str) == sorted([(None, 80), (480, 50)], key=str)
+    assert low.get(timeout=1) == other_low.get(timeout=1) == b"jpeg"
+
+    # Профиль low ограничен 5 кадрами в секунду
+    calls.clear()
+    broadcaster.publish_frame(image, encoder, now=0.1)
+    assert calls == [(None, 80)]
+
+
+def test_quality_adapts_to_slow_client():
+    broadcaster = FrameBroadcaster(queue_size=1)
+    slow = broadcaster.subscribe(profile="medium")
+    image = np.zeros((120, 160, 3), np.uint8)
+    for i in range(4):
+        broadcaster.publish_frame(image, now=float(i))
+    assert slow.quality == slow.profile.quality - 2 * 10  # Потери на 3-м и 4-м кадрах
+
+    for i in range(4, 200):
+        broadcaster.publish_frame(image, now=float(i))
+        assert slow.get(timeout=1).startswith(b'\xff\xd8')
+    assert slow.quality == slow.profile.quality
+
+    with pytest.raises(KeyError):
+        broadcaster.subscribe(profile="unknown")
+
+
+def test_invalid_stream_profiles_rejected():
+    with pytest.raises(ValueError):
+        StreamProfile(name="bad", quality=30, min_quality=60)
+    with pytest.raises(ValueError):
+        PrinterConfig(id="p", stream_profiles=[StreamProfile(name="low"), StreamProfile(name="low", width=320)])
+    assert len(PrinterConfig(id="p", stream_profiles=[StreamProfile(name="a"), StreamProfile(name="b")])
+               .stream_profiles) == 2
+
+
+def test_async_stream_receives_frames_from_thread():
+    # Очередь вмещает все кадры и признак конца трансляции, поэтому медленный цикл событий ничего не теряет
+    frames = 3
+    broadcaster = FrameBroadcaster(queue_size=frames + 1)
+    subscription = broadcaster.subscribe()
+
+    def publisher():
+        for i in range(frames):
+            broadcaster.publish(bytes([i]))
+            time.sleep(0.01)
+        broadcaster.close()
+
+    async def collect():
+        threading.Thread(target=publisher).start()
+        return [frame async for frame in stream_frames(subscription)]
+
+    assert asyncio.run(collect()) == [bytes([i]) for i in range(frames)]
+
+
+def test_async_stream_stops_on_disconnect():
+    broadcaster = FrameBroadcaster(queue_size=2)
+    subscription = broadcaster.subscribe()
+
+    async def disconnected():
+        return True
+
+    async def collect():
+        # Кадров нет, отключение обнаруживается при первой проверке, подписка снимается
+        return [frame async for frame in stream_frames(subscription, disconnected, poll_interval=0.01)]
+
+    assert asyncio.run(collect()) == []
+    assert broadcaster.subscriber_count == 0
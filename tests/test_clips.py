@@ -0,0 +1,71 @@
+import os
+
+import cv2
+import numpy as np
+
+from handlers.clips import ClipExporter, FrameRingBuffer, clip_path
+from pipeline.pipeline import PrintPipeline
+from tests.test_broadcast import FakeSink, FakeStream
+
+
+def noise_frame(seed, width=640, height=480):
+    return np.random.default_rng(seed).integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+
+def test_ring_buffer_keeps_last_seconds():
+    buffer = FrameRingBuffer(seconds=2, fps=2, width=160)
+    for index in range(40):
+        buffer.add(noise_frame(index % 3), now=index * 0.25)
+
+    frames = buffer.snapshot()
+    # Кадры не чаще 2 в секунду и только за последние 2 секунды
+    assert [timestamp for timestamp, _ in frames] == [7.5, 8.0, 8.5, 9.0, 9.5]
+    assert frames[-1][0] - frames[0][0] <= 2
+    image = cv2.imdecode(np.frombuffer(frames[0][1], np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape[1] == 160
+
+
+def test_ring_buffer_respects_byte_budget():
+    buffer = FrameRingBuffer(seconds=60, fps=100, width=320, quality=90, max_bytes=100_000)
+    for index in range(50):
+        buffer.add(noise_frame(index), now=index)
+    stats = buffer.get_stats()
+    assert stats["bytes"] <= 100_000
+    assert stats["evicted"] > 0 and stats["frames"] > 0
+
+
+def test_exporter_writes_playable_clip(tmp_path):
+    buffer = FrameRingBuffer(seconds=10, fps=5, width=160)
+    for index in range(5):
+        buffer.add(noise_frame(index), now=index)
+    exporter = ClipExporter(root=str(tmp_path))
+    assert exporter.submit("printer-1", buffer.snapshot(), 5)
+    exporter.flush()
+
+    capture = cv2.VideoCapture(clip_path("printer-1", str(tmp_path)))
+    assert capture.get(cv2.CAP_PROP_FRAME_COUNT) == 5
+    capture.release()
+    assert os.listdir(tmp_path) == ["printer-1.avi"]
+    exporter.shutdown()
+
+
+def test_print_error_links_clip_to_record(tmp_path):
+    sink = RecordingSink()
+    pipeline = PrintPipeline(source_factory=lambda: FakeStream(frames=5), sink_factory=lambda: sink,
+                             clip_settings={"seconds": 5, "fps": 100}, clip_exporter=ClipExporter(str(tmp_path)))
+    list(pipeline.subscribe())
+    pipeline.print_error_handler(1.0, noise_frame(0), "test")
+    pipeline.clip_exporter.flush()
+
+    clip_ref = sink.clips[-1]
+    assert clip_ref and os.path.exists(clip_path(clip_ref, str(tmp_path)))
+
+
+class RecordingSink(FakeSink):
+    def __init__(self):
+        super().__init__()
+        self.clips = []
+
+    def submit(self, print_time, status, frame=None, printer_id=None, outcome=None, clip_ref=None):
+        self.clips.append(clip_ref)
+        return super().submit(print_time, status)
@@ -1,7 +1,14 @@
+import base64
+from datetime import datetime, timedelta
+
+import numpy as np
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from database.databases import Base, DatabaseConnection, Users, PrintInfo, UserRepository, PrintInfoRepository
+from database.databases import (Base, DatabaseConnection, Users, PrintInfo, UserRepository, PrintInfoRepository,
+                                STATUS_LENGTH)
+from database.migrations import backfill_history, migrate_snapshots
+from database.storage import SnapshotStore, encode_jpeg
 from validation.all_classes import UserCreateSchema
 
 
@@ -36,3 +43,90 @@ def test_print_info_repository_add_print_info(db_connection):
     print_info = db_connection.query(PrintInfo).filter_by(print_time='10:00').first()
     assert print_info is not None
     assert print_info.status == 'success'
+
+
+def test_print_info_blob_storage_with_thumbnail(db_connection):
+    jpeg = encode_jpeg(np.full((240, 320, 3), 127, np.uint8))
+    print_repo = PrintInfoRepository(db_connection, storage_mode="blob")
+    print_repo.add_print_info(print_time='1.0', status='success', jpeg=jpeg)
+
+    listed = print_repo.list_print_info()
+    assert len(listed) == 1
+    # Изображения не загружаются при получении списка
+    assert "image_data" not in listed[0].__dict__
+    assert print_repo.get_image(listed[0].id) == jpeg
+    assert 0 < len(print_repo.get_thumbnail(listed[0].id)) < len(jpeg)
+
+
+def test_print_info_file_storage_and_migration(db_connection, tmp_path):
+    jpeg = encode_jpeg(np.zeros((120, 160, 3), np.uint8))
+    PrintInfoRepository(db_connection, storage_mode="base64").add_print_info(
+        print_time='2.0', status='error', image=base64.b64encode(jpeg).decode('utf-8'))
+
+    store = SnapshotStore(str(tmp_path))
+    assert migrate_snapshots(db_connection, "file", store) == 1
+
+    print_repo = PrintInfoRepository(db_connection, storage_mode="file", store=store)
+    row = print_repo.list_print_info()[0]
+    assert row.image_ref
+    assert print_repo.get_image(row.id) == jpeg
+    assert db_connection.query(PrintInfo).filter(PrintInfo.image.isnot(None)).count() == 0
+
+
+def test_engine_options_pool_settings():
+    options = DatabaseConnection.engine_options("mysql+pymysql://u:p@host/db", 8, 4, 600, True)
+    assert options == {"pool_size": 8, "max_overflow": 4, "pool_recycle": 600, "pool_pre_ping": True}
+
+    sqlite_options = DatabaseConnection.engine_options("sqlite://", 8, 4, 600, True)
+    assert "pool_size" not in sqlite_options
+    assert sqlite_options["connect_args"] == {"check_same_thread": False}
+
+
+def test_print_history_keyset_pagination_and_filters(db_connection):
+    print_repo = PrintInfoRepository(db_connection)
+    for i in range(5):
+        print_repo.add_print_info(print_time=str(10.0 * i), status='Модель напечатана без ошибок',
+                                  printer_id='p1' if i % 2 else 'p2')
+    print_repo.add_print_info(print_time='7.5', status='Ошибка печати: test', printer_id='p1',
+                              clip_ref='p1-clip')
+
+    first, cursor = print_repo.list_history(limit=4)
+    second, last_cursor = print_repo.list_history(limit=4, cursor=cursor)
+    assert [row.id for row in first] == [6, 5, 4, 3]
+    assert [row.id for row in second] == [2, 1]
+    assert last_cursor is None
+    assert first[0].outcome.value == 'error'
+    assert first[0].duration_seconds == 7.5
+    assert "image_data" not in first[0].__dict__
+    assert first[0].has_clip and not first[1].has_clip
+    assert print_repo.get_clip_ref(6) == 'p1-clip'
+
+    rows, _ = print_repo.list_history(printer_id='p1', outcome='success')
+    assert [row.id for row in rows] == [4, 2]
+    rows, _ = print_repo.list_history(started_from=datetime.utcnow() + timedelta(hours=1))
+    assert rows == []
+
+
+def test_backfill_history_for_old_records(db_connection):
+    db_connection.add(PrintInfo(print_time='12.5', status='Ошибка печати: test'))
+    db_connection.commit()
+    assert backfill_history(db_connection) == 1
+    row = db_connection.query(PrintInfo).one()
+    assert row.printer_id == 'default'
+    assert row.duration_seconds == 12.5
+    assert row.outcome.value == 'error'
+
+
+def test_long_error_status_truncated_to_column(db_connection):
+    message = "OpenCV(4.10.0) error: " + "x" * 600
+    print_repo = PrintInfoRepository(db_connection)
+    print_repo.add_print_infos([{"print_time": "1.0", "status": f"Ошибка печати: {message}"}])
+    print_repo.add_print_info(print_time='2.0', status=f"Ошибка печати: {message}")
+    db_connection.commit()
+
+    rows = db_connection.query(PrintInfo).all()
+    assert len(rows) == 2
+    for row in rows:
+        assert len(row.status) == STATUS_LENGTH
+        assert row.status.startswith("Ошибка печати: OpenCV")
+        assert row.outcome.value == 'error'
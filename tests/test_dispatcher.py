@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+
+from observer.dispatcher import NotificationDispatcher
+from observer.notifier import MQTTNotifier
+from observer.observer import Observer, Subject
+
+
+class RecordingObserver(Observer):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.messages = []
+
+    def update(self, message: str):
+        time.sleep(self.delay)
+        self.messages.append(message)
+
+
+class BlockingObserver(Observer):
+    def __init__(self):
+        self.release = threading.Event()
+        self.messages = []
+
+    def update(self, message: str):
+        self.messages.append(message)
+        self.release.wait(5)
+
+
+# Заменяет брокер: запоминает опубликованные сообщения, как paho.mqtt.client.Client.publish
+class FakeMQTTClient:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, json.loads(payload), qos))
+
+
+def test_notify_does_not_wait_for_slow_observer():
+    dispatcher = NotificationDispatcher(timeout=1.0, dedupe_window=0)
+    slow = RecordingObserver(delay=0.2)
+    subject = Subject()
+    subject.attach(dispatcher.wrap(slow))
+
+    start = time.perf_counter()
+    subject.notify("Движение началось")
+    assert time.perf_counter() - start < 0.1
+
+    dispatcher.flush()
+    assert slow.messages == ["Движение началось"]
+    dispatcher.close()
+
+
+def test_repeated_messages_are_coalesced():
+    dispatcher = NotificationDispatcher(dedupe_window=60)
+    observer = RecordingObserver()
+    queued = dispatcher.wrap(observer)
+    for _ in range(5):
+        queued.update("Ошибка печати обнаружена")
+    queued.update("Печать возобновлена")
+    dispatcher.flush()
+
+    assert observer.messages == ["Ошибка печати обнаружена", "Печать возобновлена"]
+    assert queued.get_stats()["coalesced"] == 4
+    dispatcher.close()
+
+
+def test_min_interval_limits_delivery_rate():
+    dispatcher = NotificationDispatcher(dedupe_window=0, min_interval=0.1)
+    observer = RecordingObserver()
+    queued = dispatcher.wrap(observer)
+    start = time.perf_counter()
+    for index in range(3):
+        queued.update(f"Сообщение {index}")
+    dispatcher.flush()
+
+    assert observer.messages == ["Сообщение 0", "Сообщение 1", "Сообщение 2"]
+    assert time.perf_counter() - start >= 0.2
+    dispatcher.close()
+
+
+def test_stuck_observer_times_out_without_blocking_others():
+    dispatcher = NotificationDispatcher(timeout=0.1, dedupe_window=0)
+    stuck = BlockingObserver()
+    healthy = RecordingObserver()
+    subject = Subject()
+    stuck_queue = dispatcher.wrap(stuck)
+    subject.attach(stuck_queue)
+    subject.attach(dispatcher.wrap(healthy))
+
+    subject.notify("первое")
+    subject.notify("второе")
+    dispatcher.flush()
+
+    assert healthy.messages == ["первое", "второе"]
+    stats = stuck_queue.get_stats()
+    # Пока первый вызов не завершился, второе сообщение зависшему наблюдателю не доставляется
+    assert stats["timeouts"] == 1 and stats["dropped"] == 1
+    stuck.release.set()
+    dispatcher.close()
+
+
+def test_mqtt_notifier_publishes_json_per_printer():
+    client = FakeMQTTClient()
+    notifier = MQTTNotifier(client, printer_id="prusa-1", topic_prefix="farm/", qos=1)
+    notifier.update("Ошибка печати обнаружена")
+
+    topic, payload, qos = client.published[0]
+    assert topic == "farm/prusa-1/message"
+    assert payload["printer"] == "prusa-1" and payload["message"] == "Ошибка печати обнаружена"
+    assert qos == 1
@@ -0,0 +1,52 @@
+import asyncio
+
+from pipeline.events import EventHub, event_stream, format_sse
+from pipeline.pipeline import PrintPipeline
+from tests.test_broadcast import FakeSink, FakeStream
+
+
+def test_hub_coalesces_events_by_type():
+    hub = EventHub()
+    hub.publish("quality", {"value": 0.5})
+    hub.publish("status", {"status": "Идет печать"})
+    hub.publish("quality", {"value": 0.7})
+
+    version, events = hub.changes_since(0)
+    assert events == [("status", {"status": "Идет печать"}), ("quality", {"value": 0.7})]
+    assert hub.changes_since(version) == (version, [])
+
+
+def test_event_stream_sends_state_then_changes():
+    hub = EventHub()
+    hub.publish("status", {"status": "Ожидание начала печати", "error": False})
+
+    async def collect():
+        checks = {"count": 0}
+
+        async def is_disconnected():
+            checks["count"] += 1
+            if checks["count"] == 2:
+                # Много событий между отправками доходят одним пакетом с последними значениями
+                for value in range(10):
+                    hub.publish("elapsed", {"elapsed_time": value})
+            return checks["count"] > 3
+
+        return [chunk async for chunk in event_stream(hub, is_disconnected, max_rate=100, heartbeat=60)]
+
+    chunks = asyncio.run(collect())
+    assert chunks[0].startswith("retry:")
+    assert "event: status" in chunks[1]
+    assert chunks[2] == format_sse("elapsed", {"elapsed_time": 9})
+    assert len(chunks) == 3
+
+
+def test_pipeline_publishes_state_transitions():
+    pipeline = PrintPipeline(source_factory=lambda: FakeStream(frames=5), sink_factory=FakeSink)
+    list(pipeline.subscribe())
+    pipeline.quality_handler(0.25)
+    pipeline.print_error_handler(1.0, None, "test")
+
+    _, events = pipeline.events.changes_since(0)
+    events = dict(events)
+    assert events["quality"] == {"value": 0.25}
+    assert events["status"]["error"] is True
@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+import pytest
+
+from functions.errorsdetector import FindError
+from functions.features import FeatureEngine
+
+
+@pytest.fixture
+def reference():
+    rng = np.random.default_rng(1)
+    image = np.zeros((200, 260, 3), np.uint8)
+    for _ in range(40):
+        x, y = rng.integers(0, 230), rng.integers(0, 170)
+        color = tuple(int(c) for c in rng.integers(50, 255, 3))
+        cv2.rectangle(image, (int(x), int(y)), (int(x) + 25, int(y) + 20), color, -1)
+    return image
+
+
+def test_engine_rejects_incompatible_matcher():
+    with pytest.raises(ValueError):
+        FeatureEngine("sift", "lsh")
+    with pytest.raises(ValueError):
+        FeatureEngine("orb", "flann")
+
+
+def test_nfeatures_caps_keypoints(reference):
+    keypoints, descriptors = FeatureEngine("akaze", "bf", nfeatures=10).detectAndCompute(reference)
+    assert len(keypoints) <= 10
+    assert len(descriptors) == len(keypoints)
+
+
+@pytest.mark.parametrize("feature, matcher", [("sift", "flann"), ("orb", "lsh"), ("akaze", "bf")])
+def test_find_error_with_selected_engine(reference, feature, matcher):
+    detector = FindError(error_threshold=0, engine=FeatureEngine(feature, matcher))
+    quality = detector.calculate_quality_coefficient(reference, reference.copy())
+    assert quality > 0.5
@@ -0,0 +1,55 @@
+import numpy as np
+
+from decorators.decorators import TimerDetectorDecorator
+from functions.motiondetector import MotionDetector
+from monitoring.metrics import MetricsRegistry, StageMetrics
+
+
+def test_histogram_renders_prometheus_format():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "Тест", ("stage",), buckets=(0.01, 0.1))
+    histogram.labels(stage="mog2").observe(0.005)
+    histogram.labels(stage="mog2").observe(0.05)
+    histogram.labels(stage="mog2").observe(1.0)
+    registry.counter("test_total", "Тест").inc(3)
+    registry.callback("test_depth", "Тест", "gauge", lambda: [({"printer": 'a"b'}, 2)])
+
+    text = registry.render()
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{stage="mog2",le="0.01"} 1' in text
+    assert 'test_seconds_bucket{stage="mog2",le="0.1"} 2' in text
+    assert 'test_seconds_bucket{stage="mog2",le="+Inf"} 3' in text
+    assert 'test_seconds_count{stage="mog2"} 3' in text
+    assert "test_total 3" in text
+    assert 'test_depth{printer="a\\"b"} 2' in text
+
+
+def test_decorator_chain_records_stage_latencies():
+    registry = MetricsRegistry()
+    metrics = StageMetrics("p1", registry.histogram("stage_seconds", "Тест", ("printer", "stage")))
+    detector = TimerDetectorDecorator(MotionDetector())
+    detector.set_metrics(metrics)
+    for _ in range(3):
+        detector.process_frame(np.zeros((120, 160, 3), np.uint8))
+
+    text = registry.render()
+    for stage in ("motion_timer", "mog2", "contours"):
+        assert f'stage_seconds_count{{printer="p1",stage="{stage}"}} 3' in text
+
+
+def test_stage_metrics_reuses_child_and_fills_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("overhead_seconds", "Тест", ("printer", "stage"), buckets=(0.001, 0.01))
+    metrics = StageMetrics("overhead", histogram)
+    for _ in range(1000):
+        metrics.observe("capture", 0.0005)
+    metrics.observe("capture", 0.005)
+    metrics.observe("capture", 0.5)
+
+    # Дочерняя гистограмма создается один раз на этап
+    assert list(metrics.children) == ["capture"]
+    text = registry.render()
+    assert 'overhead_seconds_bucket{printer="overhead",stage="capture",le="0.001"} 1000' in text
+    assert 'overhead_seconds_bucket{printer="overhead",stage="capture",le="0.01"} 1001' in text
+    assert 'overhead_seconds_bucket{printer="overhead",stage="capture",le="+Inf"} 1002' in text
+    assert 'overhead_seconds_count{printer="overhead",stage="capture"} 1002' in text
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.motion_benchmark import main as benchmark_main
+from connectors.replay import FileVideoStream, SyntheticVideoStream
+from functions.motiondetector import MotionDetector
+from functions.motionengines import FrameDiffMotionEngine, Mog2MotionEngine
+from functions.preprocessing import FramePreprocessor
+
+WARMUP = 30
+
+
+@pytest.fixture(scope="module")
+def recorded_print(tmp_path_factory):
+    # Запись печати в папку кадров, воспроизводится через FileVideoStream как записанное видео
+    path = tmp_path_factory.mktemp("print")
+    stream = SyntheticVideoStream(frames=160, width=320, height=240, print_frames=110, seed=3)
+    for index in range(stream.frames):
+        cv2.imwrite(str(path / f"{index:04d}.png"), stream.get_frame())
+    return str(path)
+
+
+def decisions(engine, source):
+    preprocessor = FramePreprocessor(analysis_width=320)
+    result = []
+    while True:
+        try:
+            prepared = preprocessor.prepare(source.get_frame())
+        except ValueError:
+            return result
+        result.append(engine.detect(prepared.analysis, 1000 * prepared.scale ** 2)[0])
+
+
+@pytest.mark.parametrize("decision", ["components", "pixels"])
+def test_diff_engine_agrees_with_mog2_on_recording(recorded_print, decision):
+    mog2 = decisions(Mog2MotionEngine(), FileVideoStream(recorded_print))
+    diff = decisions(FrameDiffMotionEngine(decision=decision), FileVideoStream(recorded_print))
+
+    agreement = np.mean(np.array(mog2[WARMUP:]) == np.array(diff[WARMUP:]))
+    assert agreement >= 0.85
+    # Во время печати оба способа видят движение, после печати diff не видит его
+    assert all(diff[WARMUP:100])
+    assert not any(diff[125:])
+
+
+def test_diff_engine_ignores_static_scene():
+    engine = FrameDiffMotionEngine()
+    frame = np.full((240, 320), 120, np.uint8)
+    assert [engine.detect(frame, 1000)[0] for _ in range(10)] == [False] * 10
+
+
+def test_diff_engine_returns_box_in_analysis_scale():
+    engine = FrameDiffMotionEngine(scale=0.5)
+    background = np.zeros((240, 320), np.uint8)
+    engine.detect(background, 100)
+    moved = background.copy()
+    moved[100:140, 200:260] = 255
+    motion, box = engine.detect(moved, 100)
+    assert motion
+    x, y, w, h = box
+    assert abs(x - 200) <= 4 and abs(y - 100) <= 4 and abs(w - 60) <= 8 and abs(h - 40) <= 8
+
+
+def test_motion_detector_uses_selected_engine():
+    detector = MotionDetector(min_area=400, engine="diff")
+    assert isinstance(detector.engine, FrameDiffMotionEngine)
+    with pytest.raises(ValueError):
+        MotionDetector(engine="unknown")
+
+
+def test_motion_benchmark_reports_agreement(tmp_path):
+    results = benchmark_main(["--frames", "80", "--warmup", "20", "--json", str(tmp_path / "motion.json")])
+    configs = {result["config"]: result for result in results}
+    assert configs["mog2"]["agreement"] == 1.0
+    assert configs["diff:components"]["truth_agreement"] >= 0.9
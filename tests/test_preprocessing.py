@@ -0,0 +1,31 @@
+import numpy as np
+
+from functions.motiondetector import MotionDetector
+from functions.preprocessing import FramePreprocessor
+
+
+def test_prepare_crops_and_downscales():
+    frame = np.zeros((480, 640, 3), np.uint8)
+    prepared = FramePreprocessor(analysis_width=200, roi=(100, 40, 400, 400)).prepare(frame)
+    assert prepared.gray.shape == (480, 640)
+    assert prepared.analysis.shape == (200, 200)
+    assert prepared.scale == 0.5
+    assert prepared.to_full(10, 20, 30, 40) == (120, 80, 60, 80)
+
+
+def test_motion_overlay_drawn_in_full_resolution():
+    preprocessor = FramePreprocessor(analysis_width=160, roi=(0, 0, 640, 480))
+    detector = MotionDetector(min_area=400)
+    background = np.zeros((480, 640, 3), np.uint8)
+    for _ in range(5):
+        detector.process_frame(preprocessor.prepare(background.copy()))
+
+    frame = background.copy()
+    frame[200:300, 300:400] = 255
+    processed, motion = detector.process_frame(preprocessor.prepare(frame))
+    assert motion
+    assert processed.shape == (480, 640, 3)
+    # Зеленая рамка вокруг объекта в координатах полного кадра
+    green = np.argwhere((processed[:, :, 1] == 255) & (processed[:, :, 0] == 0))
+    assert abs(green[:, 0].min() - 200) <= 4
+    assert abs(green[:, 1].max() - 399) <= 4
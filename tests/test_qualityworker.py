@@ -0,0 +1,61 @@
+import threading
+
+import cv2
+import pytest
+
+from decorators.decorators import PrintErrorDetector
+from functions.errorsdetector import FindError
+from functions.features import FeatureEngine
+from functions.qualityworker import QualityWorkerPool
+from functions.referencecache import REFERENCE_DIR
+from observer.observer import Subject
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = QualityWorkerPool({"feature": "orb", "matcher": "bf"}, workers=1, max_pending=1).start()
+    yield pool
+    pool.shutdown()
+
+
+def test_pool_returns_same_scores_as_sync_path(pool):
+    frame = cv2.imread(f"{REFERENCE_DIR}/image2.jpg")
+    done = threading.Event()
+    results = []
+
+    def callback(result, latency):
+        results.append(result)
+        done.set()
+
+    pool.submit("image2.jpg", frame, callback)
+    assert done.wait(30)
+
+    expected = FindError(engine=FeatureEngine("orb", "bf")).compute_scores(frame, frame)
+    assert results[0] == pytest.approx(expected)
+
+
+def test_pool_drops_stale_frames(pool):
+    frame = cv2.imread(f"{REFERENCE_DIR}/image2.jpg")
+    done = threading.Semaphore(0)
+    for _ in range(5):
+        pool.submit("image2.jpg", frame, lambda result, latency: done.release())
+
+    # Один кадр обрабатывается, один ждет в очереди, остальные отброшены
+    assert pool.get_stats()["dropped"] == 3
+    for _ in range(2):
+        assert done.acquire(timeout=30)
+
+
+def test_pool_results_are_applied_on_frame_thread():
+    errors = []
+    detector = PrintErrorDetector(Subject(), FindError())
+    detector.set_error_handler(lambda elapsed, frame, message: errors.append(message))
+
+    # Обратный вызов пула только ставит результат в очередь, ошибка фиксируется при обработке следующего кадра
+    callback = threading.Thread(target=detector.on_quality_scores, args=(None, 0.01))
+    callback.start()
+    callback.join()
+    assert not detector.error_occurred and errors == []
+
+    detector.apply_pool_results()
+    assert detector.error_occurred and len(errors) == 1
@@ -0,0 +1,80 @@
+import os
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from functions.errorsdetector import FindError
+from functions.preprocessing import FramePreprocessor
+from functions.referencecache import REFERENCE_DIR, ReferenceFeatureCache
+
+
+class CountingSIFT:
+    # Обертка над SIFT для подсчета вызовов detectAndCompute
+    calls = 0
+
+    def __init__(self):
+        self.sift = cv2.SIFT_create()
+
+    def detectAndCompute(self, image, mask):
+        CountingSIFT.calls += 1
+        return self.sift.detectAndCompute(image, mask)
+
+
+@pytest.fixture
+def reference_dir(tmp_path):
+    CountingSIFT.calls = 0
+    image = np.zeros((120, 160, 3), np.uint8)
+    cv2.rectangle(image, (30, 30), (90, 80), (255, 255, 255), -1)
+    cv2.circle(image, (120, 60), 20, (128, 200, 50), -1)
+    cv2.imwrite(str(tmp_path / "ref.png"), image)
+    return tmp_path
+
+
+def test_reference_features_computed_once(reference_dir):
+    cache = ReferenceFeatureCache(str(reference_dir), feature_factory=CountingSIFT)
+    first = cache.get("ref.png")
+    second = cache.get("ref.png")
+    assert first is second
+    assert CountingSIFT.calls == 1
+    assert len(first.keypoints) > 0
+
+
+def test_reference_features_persisted_on_disk(reference_dir):
+    features = ReferenceFeatureCache(str(reference_dir), feature_factory=CountingSIFT).get("ref.png")
+    restored = ReferenceFeatureCache(str(reference_dir), feature_factory=CountingSIFT).get("ref.png")
+    assert CountingSIFT.calls == 1
+    assert len(restored.keypoints) == len(features.keypoints)
+    assert np.array_equal(restored.descriptors, features.descriptors)
+
+
+def test_reference_cache_invalidated_on_change(reference_dir):
+    cache = ReferenceFeatureCache(str(reference_dir), feature_factory=CountingSIFT)
+    first = cache.get("ref.png")
+
+    image = np.zeros((120, 160, 3), np.uint8)
+    cv2.circle(image, (80, 60), 40, (255, 255, 255), -1)
+    path = str(reference_dir / "ref.png")
+    cv2.imwrite(path, image)
+    os.utime(path, ns=(0, 1))
+
+    second = cache.get("ref.png")
+    assert second.digest != first.digest
+    assert CountingSIFT.calls == 2
+
+
+def test_reference_uses_frame_preprocessing(tmp_path):
+    # Эталон, снятый той же камерой, совпадает с кадром при любом масштабе анализа
+    shutil.copy(f"{REFERENCE_DIR}/image2.jpg", tmp_path / "ref.jpg")
+    frame = cv2.imread(f"{REFERENCE_DIR}/image2.jpg")
+    for preprocessor in (FramePreprocessor(), FramePreprocessor(analysis_width=320),
+                         FramePreprocessor(analysis_width=320, roi=(40, 30, 400, 300))):
+        cache = ReferenceFeatureCache(str(tmp_path), preprocessor=preprocessor)
+        reference = cache.get("ref.jpg")
+        assert reference.image.shape == preprocessor.prepare(frame).analysis.shape
+        quality = FindError().calculate_quality_coefficient(reference, preprocessor.prepare(frame))
+        assert quality == pytest.approx(1.0)
+
+    # Настройки предобработки входят в ключ кеша на диске
+    assert len(os.listdir(tmp_path / ".cache")) == 3
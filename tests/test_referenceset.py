@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+import pytest
+
+from decorators.decorators import PrintErrorDetector
+from functions.errorsdetector import FindError
+from functions.motiondetector import MotionDetector
+from functions.referencecache import ReferenceFeatureCache
+from functions.referenceset import ReferenceSet
+from pipeline.pipeline import PrintPipeline
+from validation.all_classes import PrinterConfig
+
+
+@pytest.fixture
+def reference_dir(tmp_path):
+    # Три стадии печати: модель растет от кадра к кадру
+    rng = np.random.default_rng(5)
+    base = rng.integers(60, 200, size=(16, 20, 3), dtype=np.uint8)
+    base = cv2.resize(base, (320, 240), interpolation=cv2.INTER_NEAREST)
+    for index, size in enumerate((20, 60, 100)):
+        image = base.copy()
+        cv2.rectangle(image, (160 - size // 2, 120 - size // 2), (160 + size // 2, 120 + size // 2),
+                      (40, 120, 220), -1)
+        cv2.imwrite(str(tmp_path / f"stage{index}.png"), image)
+    return tmp_path
+
+
+def test_nearest_uses_progress_index():
+    references = ReferenceSet(["a.png", "b.png", "c.png"], [0.2, 0.6, 1.0])
+    assert references.nearest(0.0) == ["a.png"]
+    assert references.nearest(0.5) == ["b.png"]
+    assert references.nearest(0.85, 2) == ["c.png", "b.png"]
+    assert references.nearest(1.0, 2) == ["c.png", "b.png"]
+
+
+def test_default_progress_and_duration():
+    references = ReferenceSet(["a.png", "b.png"], expected_duration=100)
+    assert references.progress == [0.5, 1.0]
+    assert references.progress_at(30) == 0.3
+    assert references.progress_at(500) == 1.0
+    assert ReferenceSet(["a.png"]).progress_at(10) == 1.0
+
+
+def test_invalid_progress_rejected():
+    with pytest.raises(ValueError):
+        ReferenceSet(["a.png", "b.png"], [0.8, 0.2])
+    with pytest.raises(ValueError):
+        PrinterConfig(id="p", references=["a.png", "b.png"], reference_progress=[0.5])
+
+
+def test_detector_compares_with_reference_for_progress(reference_dir):
+    cache = ReferenceFeatureCache(str(reference_dir))
+    references = ReferenceSet(["stage0.png", "stage1.png", "stage2.png"], [0.3, 0.6, 1.0], cache)
+    assert len(references.preload()) == 3
+    detector = PrintErrorDetector(MotionDetector(), FindError(error_threshold=0), reference_cache=cache,
+                                  reference_set=references)
+
+    detector.set_progress(0.35)
+    assert detector.get_reference_features().name == "stage0.png"
+    detector.set_progress(0.9)
+    assert detector.get_reference_features().name == "stage2.png"
+
+    # Кадр середины печати лучше совпадает с эталоном середины, чем с готовой деталью
+    frame = references.cache.get("stage1.png").image
+    quality = {}
+    for progress in (0.6, 1.0):
+        detector.set_progress(progress)
+        quality[progress] = detector.error_detector.calculate_quality_coefficient(
+            detector.get_reference_features(), frame)
+    assert quality[0.6] > quality[1.0]
+
+
+def test_progress_is_measured_from_motion_start(reference_dir):
+    cache = ReferenceFeatureCache(str(reference_dir))
+    references = ReferenceSet(["stage0.png", "stage1.png", "stage2.png"], [0.3, 0.6, 1.0], cache,
+                              expected_duration=100)
+    pipeline = PrintPipeline(source_factory=lambda: None, sink_factory=lambda: None, reference_cache=cache,
+                             reference_set=references)
+    detector = PrintErrorDetector(MotionDetector(), FindError(error_threshold=0), reference_cache=cache,
+                                  reference_set=references)
+
+    # Пока движения нет, кадр сравнивается с первым эталоном независимо от времени создания цепочки
+    assert pipeline.get_progress() == 0.0
+    assert detector.get_reference_features().name == "stage0.png"
+    detector.set_progress(pipeline.get_progress())
+    assert detector.get_reference_features().name == "stage0.png"
+
+    pipeline.motion_start_time = datetime.now() - timedelta(seconds=70)
+    detector.set_progress(pipeline.get_progress())
+    assert detector.get_progress() == pytest.approx(0.7, abs=0.01)
+    assert detector.get_reference_features().name == "stage1.png"
+
+    # После конца движения и после /resume прогресс снова отсчитывается от начала печати
+    pipeline.motion_end_handler(70.0, None)
+    assert pipeline.motion_start_time is None and pipeline.total_time == 70.0
+    assert pipeline.get_progress() == 0.0
+    pipeline.motion_start_time = datetime.now() - timedelta(seconds=70)
+    pipeline.resume()
+    assert pipeline.motion_start_time is None and pipeline.total_time == 0
+    assert pipeline.get_progress() == 0.0
+
+
+def test_progress_without_duration_uses_finished_part(reference_dir):
+    cache = ReferenceFeatureCache(str(reference_dir))
+    references = ReferenceSet(["stage0.png", "stage1.png", "stage2.png"], [0.3, 0.6, 1.0], cache)
+    pipeline = PrintPipeline(source_factory=lambda: None, sink_factory=lambda: None, reference_cache=cache,
+                             reference_set=references)
+    detector = PrintErrorDetector(MotionDetector(), FindError(error_threshold=0), reference_cache=cache,
+                                  reference_set=references)
+
+    # Без ожидаемого времени эталон не меняется при начале движения
+    assert detector.get_reference_features().name == "stage2.png"
+    for motion_start in (None, datetime.now() - timedelta(seconds=30)):
+        pipeline.motion_start_time = motion_start
+        detector.set_progress(pipeline.get_progress())
+        assert detector.get_reference_features().name == "stage2.png"
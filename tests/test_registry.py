@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from pipeline.registry import PrinterRegistry, load_farm_config
+from tests.test_broadcast import FakeSink, FakeStream
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "printers.json"
+    path.write_text(json.dumps({"printers": [
+        {"id": "left", "source": 0},
+        {"id": "right", "source": "rtsp://camera/right", "quality_threshold": 0.2,
+         "feature": {"feature": "orb", "matcher": "lsh", "nfeatures": 500}, "roi": [0, 0, 320, 240]},
+    ]}))
+    return str(path)
+
+
+def test_registry_loads_printers_from_config(config_path):
+    registry = PrinterRegistry.from_config(sink_factory=FakeSink, path=config_path)
+    assert len(registry) == 2
+    assert registry.default.printer_id == "left"
+    right = registry.get("right")
+    assert right.quality_threshold == 0.2
+    assert right.feature_settings["feature"] == "orb"
+    assert right.preprocessor.roi == (0, 0, 320, 240)
+    with pytest.raises(KeyError):
+        registry.get("missing")
+
+
+def test_duplicate_printer_ids_rejected(tmp_path):
+    path = tmp_path / "printers.json"
+    path.write_text(json.dumps({"printers": [{"id": "a"}, {"id": "a"}]}))
+    with pytest.raises(ValueError):
+        PrinterRegistry(load_farm_config(str(path)), sink_factory=FakeSink)
+
+
+def test_printers_run_independently(config_path):
+    registry = PrinterRegistry.from_config(sink_factory=FakeSink, path=config_path)
+    for pipeline in registry:
+        pipeline.source_factory = lambda: FakeStream(frames=5)
+
+    subscriptions = [pipeline.subscribe() for pipeline in registry]
+    for subscription in subscriptions:
+        assert len(list(subscription)) > 0
+
+    stats = registry.get_stats()
+    assert set(stats) == {"left", "right"}
+    assert all(printer["cpu_time"] > 0 for printer in stats.values())
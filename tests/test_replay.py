@@ -0,0 +1,57 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.pipeline_benchmark import main as benchmark_main
+from benchmarks.startup_benchmark import main as startup_main
+from connectors.replay import FileVideoStream, SyntheticVideoStream
+
+
+def test_file_stream_reads_image_sequence_and_loops(tmp_path):
+    for i in range(3):
+        cv2.imwrite(str(tmp_path / f"frame_{i:03d}.png"), np.full((20, 30, 3), i * 50, np.uint8))
+
+    stream = FileVideoStream(str(tmp_path))
+    assert [int(stream.get_frame()[0, 0, 0]) for _ in range(3)] == [0, 50, 100]
+    with pytest.raises(ValueError):
+        stream.get_frame()
+
+    looped = FileVideoStream(str(tmp_path / "*.png"), loop=True)
+    assert [int(looped.get_frame()[0, 0, 0]) for _ in range(4)] == [0, 50, 100, 0]
+
+
+def test_synthetic_stream_is_deterministic_and_ends():
+    first = SyntheticVideoStream(frames=5, width=160, height=120, seed=1)
+    second = SyntheticVideoStream(frames=5, width=160, height=120, seed=1)
+    frames = [first.get_frame() for _ in range(5)]
+    assert all(np.array_equal(a, second.get_frame()) for a in frames)
+    # Головка двигается между кадрами печати
+    assert not np.array_equal(frames[1], frames[2])
+    with pytest.raises(ValueError):
+        first.get_frame()
+
+
+def test_pipeline_benchmark_reports_stage_latencies(tmp_path):
+    output = tmp_path / "result.json"
+    assert benchmark_main(["--frames", "12", "--width", "320", "--height", "240", "--analyze-every", "4",
+                           "--json", str(output)]) == 0
+
+    result = json.loads(output.read_text(encoding="utf-8"))
+    assert result["frames"] == 12
+    for stage in ("capture", "preprocess", "chain", "motion", "quality", "encode"):
+        assert {"per_second", "p50_ms", "p95_ms", "p99_ms"} <= set(result["stages"][stage])
+    assert result["stages"]["motion"]["calls"] == 12
+    assert result["peak_rss_mb"] > 0
+
+
+def test_startup_benchmark_measures_cold_start(tmp_path):
+    output = tmp_path / "startup.json"
+    assert startup_main(["--runs", "1", "--width", "160", "--height", "120", "--json", str(output)]) == 0
+    result = json.loads(output.read_text())
+    # Импорт не открывает камеру, не подключается к базе и не считает эталоны
+    assert result["eager_resources"] == []
+    summary = result["summary"]
+    assert summary["import_s"]["median"] > 0
+    assert summary["first_frame_s"]["median"] >= summary["lifespan_s"]["median"]
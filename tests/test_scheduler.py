@@ -0,0 +1,30 @@
+from functions.scheduler import AnalysisScheduler
+
+
+def test_analysis_every_n_frames():
+    scheduler = AnalysisScheduler(every_n_frames=5, on_motion_change=False)
+    decisions = [scheduler.should_analyze(False, now=0) for _ in range(11)]
+    assert decisions == [True, False, False, False, False, True, False, False, False, False, True]
+
+
+def test_analysis_on_time_and_motion_change():
+    scheduler = AnalysisScheduler(every_n_frames=100, every_seconds=2.0)
+    assert scheduler.should_analyze(False, now=0.0)
+    assert not scheduler.should_analyze(False, now=1.0)
+    assert scheduler.should_analyze(False, now=2.5)
+    assert scheduler.should_analyze(True, now=2.6)
+    assert not scheduler.should_analyze(True, now=2.7)
+
+
+def test_load_shedding_and_recovery():
+    scheduler = AnalysisScheduler(every_n_frames=2, frame_budget=0.05, max_load_factor=4.0)
+    for _ in range(200):
+        scheduler.record_frame(0.5)
+    assert scheduler.load_factor == 4.0
+    assert scheduler.scale < 1.0
+    assert scheduler.get_stats()["effective_interval_frames"] == 8
+
+    for _ in range(2000):
+        scheduler.record_frame(0.001)
+    assert scheduler.load_factor == 1.0
+    assert scheduler.scale == 1.0
@@ -0,0 +1,98 @@
+import os
+import threading
+
+import numpy as np
+
+from decorators.decorators import TimelapseDecorator
+from handlers.timelapse import TimelapseRecorder
+from observer.observer import Subject
+
+
+def noise_frame(seed, width=320, height=240):
+    return np.random.default_rng(seed).integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+
+def test_segments_rotate_and_are_indexed_by_job(tmp_path):
+    recorder = TimelapseRecorder(root=str(tmp_path), interval=1.0, segment_frames=3, width=160)
+    recorder.start_job("job-1")
+    for second in range(7):
+        recorder.offer(noise_frame(second), now=100 + second)
+        recorder.offer(noise_frame(second), now=100 + second + 0.5)  # Чаще interval не записывается
+    recorder.end_job()
+    recorder.start_job("job-2")
+    recorder.offer(noise_frame(0), now=200)
+    recorder.end_job()
+    recorder.flush()
+
+    jobs = recorder.list_jobs()
+    assert [job["job_id"] for job in jobs] == ["job-1", "job-2"]
+    assert [segment["frames"] for segment in jobs[0]["segments"]] == [3, 3, 1]
+    assert jobs[0]["segments"][0]["started_at"] == 100
+    assert all(os.path.exists(tmp_path / "job-1" / segment["file"]) for segment in jobs[0]["segments"])
+    recorder.shutdown()
+
+
+def test_disk_budget_evicts_oldest_segments(tmp_path):
+    recorder = TimelapseRecorder(root=str(tmp_path), interval=1.0, segment_frames=2)
+    for job in range(3):
+        recorder.start_job(f"job-{job}")
+        for second in range(4):
+            recorder.offer(noise_frame(second), now=job * 100 + second)
+        recorder.end_job()
+        recorder.flush()
+    segment_bytes = recorder.list_jobs()[-1]["segments"][-1]["bytes"]
+
+    recorder.max_bytes = segment_bytes * 3
+    recorder.enforce_budget()
+    jobs = recorder.list_jobs()
+    # Первая печать удалена целиком, от второй остался последний сегмент
+    assert [job["job_id"] for job in jobs] == ["job-1", "job-2"]
+    assert [len(job["segments"]) for job in jobs] == [1, 2]
+    assert not os.path.exists(tmp_path / "job-0")
+    assert recorder.evicted == 3
+    recorder.shutdown()
+
+
+def test_offer_never_blocks(tmp_path):
+    recorder = TimelapseRecorder(root=str(tmp_path), interval=0.0, queue_size=2)
+    recorder.job_id = "job"  # Поток записи не запущен, очередь не разбирается
+    results = [recorder.offer(noise_frame(0), now=index) for index in range(5)]
+    assert results == [True, True, False, False, False]
+    assert recorder.get_stats()["dropped"] == 3
+
+
+def test_end_job_waits_for_full_queue(tmp_path):
+    recorder = TimelapseRecorder(root=str(tmp_path), interval=0.0, queue_size=1, width=160)
+    recorder.job_id = "job"  # Поток записи еще не запущен, кадр занимает всю очередь
+    assert recorder.offer(noise_frame(0), now=0)
+
+    ending = threading.Thread(target=recorder.end_job)
+    ending.start()
+    recorder.start()
+    ending.join(timeout=30)
+    recorder.flush()
+
+    assert not ending.is_alive()
+    # Сегмент закрыт и попал в индекс, хотя очередь была заполнена в момент конца печати
+    assert [segment["frames"] for segment in recorder.list_jobs()[0]["segments"]] == [1]
+    assert recorder.get_stats()["dropped"] == 0
+    recorder.shutdown()
+
+
+class StaticDetector(Subject):
+    def process_frame(self, frame):
+        return frame, True
+
+
+def test_decorator_feeds_recorder_only_during_job(tmp_path):
+    recorder = TimelapseRecorder(root=str(tmp_path), interval=0.0)
+    chain = TimelapseDecorator(StaticDetector(), recorder)
+    chain.process_frame(noise_frame(0))
+    recorder.start_job("job")
+    processed, motion = chain.process_frame(noise_frame(1))
+    recorder.end_job()
+    recorder.flush()
+
+    assert motion is True
+    assert recorder.get_stats()["written"] == 1
+    recorder.shutdown()
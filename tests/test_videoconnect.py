@@ -0,0 +1,66 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from connectors.videoconnect import ThreadedVideoStream
+
+
+@pytest.fixture
+def video_file(tmp_path):
+    # Небольшое тестовое видео вместо камеры
+    path = str(tmp_path / "test.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    for i in range(20):
+        writer.write(np.full((48, 64, 3), i * 10, np.uint8))
+    writer.release()
+    return path
+
+
+class SlowCapture:
+    # Имитация камеры, отдающей кадр раз в 10 мс
+    def __init__(self, frames=50):
+        self.frames = frames
+
+    def read(self):
+        time.sleep(0.01)
+        if self.frames == 0:
+            return False, None
+        self.frames -= 1
+        return True, np.zeros((48, 64, 3), np.uint8)
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+def test_threaded_stream_returns_fresh_frames(video_file):
+    stream = ThreadedVideoStream(video_file, buffer_size=4)
+    stream.stream = SlowCapture()
+    stream.start()
+    try:
+        first = stream.read_packet()
+        time.sleep(0.2)
+        second = stream.read_packet()
+        assert second.seq > first.seq
+        assert second.frame.shape == (48, 64, 3)
+
+        stats = stream.get_stats()
+        assert stats["delivered"] == 2
+        assert stats["dropped"] == second.seq - 2
+        assert len(stream.get_recent()) <= 4
+    finally:
+        stream.release()
+
+
+def test_threaded_stream_raises_at_end_of_stream(video_file):
+    stream = ThreadedVideoStream(video_file).start()
+    try:
+        with pytest.raises(ValueError):
+            for _ in range(100):
+                stream.get_frame()
+    finally:
+        stream.release()
@@ -0,0 +1,150 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.databases import Base, PrintInfo, PrintInfoRepository
+from handlers.handlers import handle_print_error
+from handlers.writer import PersistenceWriter, RepositorySink
+
+
+@pytest.fixture
+def session_factory():
+    # Используем временную базу данных SQLite для тестов
+    engine = create_engine('sqlite://', connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def scope_for(session_factory):
+    # То же поведение, что у DatabaseConnection.session_scope
+    @contextmanager
+    def session_scope():
+        session = session_factory()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+    return session_scope
+
+
+class FlakyRepo:
+    # Репозиторий, недоступный первые failures вызовов
+    def __init__(self, failures):
+        self.failures = failures
+
+    def __call__(self, session):
+        if self.failures > 0:
+            self.failures -= 1
+            raise OperationalError("INSERT", {}, Exception("database is unreachable"))
+        return PrintInfoRepository(session)
+
+
+class BlockingScope:
+    # Сессии ждут release: поток записи занят, пока тест заполняет очередь
+    def __init__(self, session_factory):
+        self.session_scope = scope_for(session_factory)
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    @contextmanager
+    def __call__(self):
+        self.entered.set()
+        assert self.release.wait(10)
+        with self.session_scope() as session:
+            yield session
+
+
+def test_writer_batches_records_in_background(session_factory, tmp_path):
+    writer = PersistenceWriter(scope_for(session_factory), flush_interval=0.05,
+                               spill_path=str(tmp_path / "spill.jsonl")).start()
+    frame = np.zeros((10, 10, 3), np.uint8)
+    for i in range(5):
+        handle_print_error(float(i), frame, "test", writer)
+    writer.shutdown()
+
+    rows = session_factory().query(PrintInfo).all()
+    assert len(rows) == 5
+    assert rows[0].status == "Ошибка печати: test"
+    assert rows[0].image_data
+    assert rows[0].thumbnail
+    assert writer.get_stats()["queue_depth"] == 0
+
+
+def test_writer_spills_and_replays_when_database_unreachable(session_factory, tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+    writer = PersistenceWriter(scope_for(session_factory), FlakyRepo(failures=2), flush_interval=0.05,
+                               max_retries=2, backoff=0.01, spill_path=str(spill_path)).start()
+
+    writer.submit(1.0, "first")
+    assert writer.flush(timeout=5)
+    assert spill_path.exists()
+    assert writer.get_stats()["spilled"] == 1
+
+    writer.submit(2.0, "second")
+    writer.shutdown()
+
+    assert not spill_path.exists()
+    statuses = sorted(row.status for row in session_factory().query(PrintInfo).all())
+    assert statuses == ["first", "second"]
+
+
+def test_repository_sink_writes_synchronously(session_factory):
+    session = session_factory()
+    handle_print_error(3.0, np.zeros((10, 10, 3), np.uint8), "test", RepositorySink(PrintInfoRepository(session)))
+
+    row = session_factory().query(PrintInfo).one()
+    assert row.status == "Ошибка печати: test"
+    assert row.image_data
+
+
+def test_full_queue_defers_records_to_writer_thread(session_factory, tmp_path):
+    scope = BlockingScope(session_factory)
+    spill_path = tmp_path / "spill.jsonl"
+    writer = PersistenceWriter(scope, max_queue=1, batch_size=1, flush_interval=0.05,
+                               spill_path=str(spill_path)).start()
+    frame = np.zeros((10, 10, 3), np.uint8)
+    assert writer.submit(1.0, "first", frame)
+    assert scope.entered.wait(5)
+
+    # Очередь занята второй записью, третья уходит в переполнение без кодирования и без файла
+    assert writer.submit(2.0, "second", frame)
+    assert not writer.submit(3.0, "third", frame)
+    assert writer.overflow[0]["frame"] is frame
+    assert not spill_path.exists()
+    assert not writer.flush(timeout=0.1)
+
+    scope.release.set()
+    assert writer.flush(timeout=5)
+    writer.shutdown()
+    rows = session_factory().query(PrintInfo).order_by(PrintInfo.id).all()
+    assert [row.status for row in rows] == ["first", "second", "third"]
+    assert all(row.image_data for row in rows)
+    assert writer.get_stats()["overflowed"] == 1 and writer.get_stats()["spilled"] == 0
+
+
+def test_shutdown_timeout_leaves_queue_to_running_thread(session_factory, tmp_path):
+    scope = BlockingScope(session_factory)
+    writer = PersistenceWriter(scope, batch_size=1, flush_interval=0.05,
+                               spill_path=str(tmp_path / "spill.jsonl")).start()
+    writer.submit(1.0, "first")
+    assert scope.entered.wait(5)
+    writer.submit(2.0, "second")
+
+    # Поток занят записью, остаток очереди не записывается синхронно
+    writer.shutdown(timeout=0.1)
+    assert writer.thread is not None and writer.queue.qsize() == 1
+
+    scope.release.set()
+    writer.thread.join(timeout=5)
+    statuses = [row.status for row in session_factory().query(PrintInfo).order_by(PrintInfo.id).all()]
+    assert statuses == ["first", "second"]
@@ -1,5 +1,8 @@
-from pydantic import BaseModel, Field, validator
-from typing import Optional
+import enum
+from datetime import datetime
+
+from pydantic import BaseModel, Field, model_validator, validator
+from typing import List, Optional, Tuple, Union
 
 
 class LoginRequest(BaseModel):
@@ -20,3 +23,121 @@ class UserUpdateSchema(BaseModel):
                                                 "символов.")
     password: Optional[str] = Field(None, min_length=6, max_length=100,
                                     description="Пароль должен содержать от 6 до 100 символов.")
+
+
+class FeatureSettings(BaseModel):
+    feature: str = Field("sift", description="Детектор признаков: sift, orb или akaze.")
+    matcher: str = Field("bf", description="Сопоставление дескрипторов: bf, flann или lsh.")
+    nfeatures: int = Field(0, ge=0, description="Ограничение количества ключевых точек, 0 - без ограничения.")
+
+
+class AlignmentSettings(BaseModel):
+    min_inliers: int = Field(12, ge=4, description="Минимум точек, согласованных с гомографией RANSAC.")
+    ransac_threshold: float = Field(5.0, gt=0, description="Допустимая ошибка перепроецирования, пиксели.")
+    drift_tolerance: float = Field(0.15, gt=0, le=1, description="Падение сходства с эталоном, после которого "
+                                                                 "выполняется полное сопоставление признаков.")
+    max_age: int = Field(300, ge=0, description="Проверок качества до обязательного пересчета гомографии, "
+                                                "0 - без ограничения.")
+    compare_width: int = Field(320, gt=0, description="Ширина изображения для попиксельного сравнения.")
+
+
+class ClipSettings(BaseModel):
+    seconds: float = Field(10, gt=0, description="Сколько секунд до ошибки сохранять в ролик.")
+    fps: float = Field(5, gt=0, le=30, description="Частота кадров буфера и ролика.")
+    width: int = Field(480, gt=0, description="Ширина кадров ролика.")
+    quality: int = Field(70, ge=10, le=100, description="Качество JPEG кадров в буфере.")
+    max_bytes: int = Field(8 * 1024 * 1024, gt=0, description="Ограничение памяти буфера, байты.")
+
+
+class TimelapseSettings(BaseModel):
+    interval: float = Field(5.0, gt=0, description="Секунд печати между кадрами замедленной съемки.")
+    fps: float = Field(25.0, gt=0, le=60, description="Частота кадров при воспроизведении.")
+    segment_frames: int = Field(1500, ge=1, description="Кадров в одном файле сегмента.")
+    width: Optional[int] = Field(1280, gt=0, description="Ширина кадров записи, None - как у камеры.")
+    max_bytes: int = Field(2 * 1024 ** 3, gt=0, description="Бюджет на диске для записей принтера, байты.")
+
+
+class StreamProfile(BaseModel):
+    name: str = Field(..., min_length=1, max_length=20, description="Имя профиля, передается в /stream?profile=")
+    width: Optional[int] = Field(None, gt=0, description="Ширина кадра трансляции, None - как у камеры.")
+    quality: int = Field(80, ge=10, le=100, description="Качество JPEG для клиента, успевающего получать кадры.")
+    min_quality: int = Field(40, ge=10, le=100, description="Минимальное качество JPEG для медленного клиента.")
+    max_fps: Optional[float] = Field(None, gt=0, description="Максимальная частота кадров, None - как у камеры.")
+
+    @model_validator(mode="after")
+    def check_quality(self):
+        if self.min_quality > self.quality:
+            raise ValueError("min_quality не может быть больше quality.")
+        return self
+
+
+class PrinterConfig(BaseModel):
+    id: str = Field(..., min_length=1, max_length=50, pattern=r"^[A-Za-z0-9_-]+$",
+                    description="Идентификатор принтера, используется в адресах /printers/{id}/...")
+    source: Union[int, str] = Field(0, description="Индекс камеры, путь к видео или адрес потока.")
+    references: List[str] = Field(["image2.jpg"], min_length=1,
+                                  description="Эталонные изображения из папки referenceses по ходу печати.")
+    reference_progress: Optional[List[float]] = Field(None, description="Доля выполнения печати (0-1) для "
+                                                                        "каждого эталона, None - равномерно.")
+    reference_neighbors: int = Field(1, ge=1, le=2, description="Сколько ближайших эталонов сравнивать с кадром.")
+    expected_duration: Optional[float] = Field(None, gt=0, description="Ожидаемое время печати, секунды. "
+                                                                       "Без него используется последний эталон.")
+    quality_threshold: float = Field(0.01, description="Порог коэффициента качества для ошибки печати.")
+    error_threshold: float = Field(0, description="Порог доли ошибок FindError.")
+    feature: FeatureSettings = FeatureSettings()
+    alignment: Optional[AlignmentSettings] = Field(None, description="Сравнение кадров по сохраненной гомографии, "
+                                                                     "None - сопоставление признаков на каждом кадре.")
+    analysis_width: Optional[int] = Field(640, gt=0, description="Ширина изображения для анализа.")
+    roi: Optional[Tuple[int, int, int, int]] = Field(None, description="Область стола принтера (x, y, w, h).")
+    quality_workers: int = Field(0, ge=0, description="Количество процессов для расчета качества.")
+    motion_engine: str = Field("mog2", pattern=r"^(mog2|diff)$",
+                               description="Обнаружение движения: mog2 или diff (разница со скользящим средним).")
+    error_clip: Optional[ClipSettings] = Field(ClipSettings(), description="Ролик последних секунд перед ошибкой, "
+                                                                           "None - только последний кадр.")
+    timelapse: Optional[TimelapseSettings] = Field(None, description="Замедленная съемка каждой печати, "
+                                                                     "None - без записи.")
+    stream_profiles: Optional[List[StreamProfile]] = Field(None, description="Профили трансляции, первый - по "
+                                                                           "умолчанию. None - стандартные профили.")
+
+    @model_validator(mode="after")
+    def check_reference_progress(self):
+        progress = self.reference_progress
+        if progress is None:
+            return self
+        if len(progress) != len(self.references):
+            raise ValueError("reference_progress должен содержать значение для каждого эталона.")
+        if any(not 0 <= value <= 1 for value in progress) or progress != sorted(set(progress)):
+            raise ValueError("reference_progress должен возрастать в пределах от 0 до 1.")
+        return self
+
+    @model_validator(mode="after")
+    def check_stream_profiles(self):
+        names = [profile.name for profile in self.stream_profiles or []]
+        if len(names) != len(set(names)):
+            raise ValueError("Имена профилей трансляции должны быть уникальными.")
+        return self
+
+
+class FarmConfig(BaseModel):
+    printers: List[PrinterConfig] = Field(..., min_length=1)
+
+
+class PrintOutcome(str, enum.Enum):
+    SUCCESS = "success"  # Модель напечатана без ошибок
+    ERROR = "error"  # Печать остановлена из-за ошибки
+
+
+class PrintHistoryItem(BaseModel):
+    id: int
+    printer_id: Optional[str] = None
+    started_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    outcome: Optional[PrintOutcome] = None
+    status: str
+    has_image: bool = Field(False, description="Снимок доступен по /history/{id}/image.")
+    has_clip: bool = Field(False, description="Ролик перед ошибкой доступен по /history/{id}/clip.")
+
+
+class PrintHistoryPage(BaseModel):
+    items: List[PrintHistoryItem]
+    next_cursor: Optional[int] = Field(None, description="Передается в cursor для следующей страницы.")